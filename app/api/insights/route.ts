@@ -7,8 +7,10 @@ export const dynamic = "force-dynamic";
 
 export async function POST(req: NextRequest) {
   try {
-    const { text } = await req.json();
-    if (!text || text.trim() === "") {
+    const { text, selections } = await req.json();
+    // Several highlighted passages can be sent at once: { selections: [{ id, text }] }
+    const batch = Array.isArray(selections);
+    if (batch ? selections.length === 0 : !text || text.trim() === "") {
       return NextResponse.json({ facts: [] }, { status: 400 });
     }
 
@@ -16,12 +18,12 @@ export async function POST(req: NextRequest) {
       process.env.PYTHON_PATH || (process.platform === "win32" ? "python" : "python3");
     const scriptPath = path.join(process.cwd(), "python", "insightgenerator.py");
 
-    const pythonProcess = spawn(pythonCmd, [scriptPath], {
+    const pythonProcess = spawn(pythonCmd, batch ? [scriptPath, "--batch"] : [scriptPath], {
       stdio: ["pipe", "pipe", "pipe"],
       env: process.env, // make env explicit
     });
 
-    pythonProcess.stdin.write(text);
+    pythonProcess.stdin.write(batch ? JSON.stringify(selections) : text);
     pythonProcess.stdin.end();
 
     let result = "";
@@ -46,7 +48,7 @@ export async function POST(req: NextRequest) {
       return NextResponse.json({ facts: [], error: "Failed to parse Python output." }, { status: 500 });
     }
 
-    return NextResponse.json({ facts });
+    return NextResponse.json(batch ? { results: facts } : { facts });
   } catch (error) {
     console.error("Error in API route:", error);
     return NextResponse.json({ facts: [], error: "Unexpected server error." }, { status: 500 });
@@ -5,10 +5,12 @@ import os from "os";
 import crypto from "crypto";
 import { spawn } from "child_process";
 import {
+  getRunState,
   killCurrentProcess,
   setCurrentChild,
   setRunning,
   setStopped,
+  submitToScheduler,
 } from "@/lib/model2-runner";
 
 export const runtime = "nodejs";
@@ -79,6 +81,23 @@ export async function POST(req: NextRequest) {
     };
     await writeFileSafe(path.join(inputDir, "input.json"), Buffer.from(JSON.stringify(inputJson, null, 2), "utf8"));
 
+    const runId = crypto.randomUUID();
+
+    // A running scheduler (python/model_2/scheduler.py) has the models loaded already; spawn only without one
+    const jobId = await submitToScheduler(inputDir, publicOut, async (code) => {
+      if (getRunState().runId === runId) setStopped(code);
+      await fs.rm(tmpRoot, { recursive: true, force: true }).catch(() => {});
+    });
+    if (jobId) {
+      setRunning(runId);
+      // the client gave up before getting an answer: nobody will read the outputs
+      if (req.signal.aborted) {
+        await killCurrentProcess();
+        setStopped(null);
+      }
+      return NextResponse.json({ ok: true, runId, jobId, outputDirUrl: `/model2/outputs/` }, { status: 202 });
+    }
+
     const python = getPythonCmd();
     const scriptPath = path.join(process.cwd(), "python", "model_2", "process_pdf.py");
     const modelDir = path.join(process.cwd(), "python", "model_2", "models");
@@ -99,7 +118,6 @@ export async function POST(req: NextRequest) {
       return NextResponse.json({ error: "python_not_found", stderr: probe.out }, { status: 500 });
     }
 
-    const runId = crypto.randomUUID();
     setRunning(runId);
 
     const args = [scriptPath, inputDir, publicOut, modelDir];
@@ -132,3 +150,11 @@ export async function POST(req: NextRequest) {
     return NextResponse.json({ error: err?.message || "unknown_error" }, { status: 500 });
   }
 }
+
+// Stops the current run: cancels its scheduler job, or kills the spawned process
+export async function DELETE() {
+  const { running } = getRunState();
+  await killCurrentProcess();
+  if (running) setStopped(null);
+  return NextResponse.json({ ok: true, stopped: running });
+}
@@ -1,17 +1,28 @@
 import { NextRequest, NextResponse } from "next/server";
 import { spawn } from "child_process";
 import path from "path";
+import { askInSession } from "@/lib/pdfchat-sessions";
 
 export const runtime = "nodejs";
 export const dynamic = "force-dynamic";
 
 export async function POST(req: NextRequest) {
   try {
-    const { pdfUrl, question } = await req.json();
+    const { pdfUrl, question, sessionId } = await req.json();
     if (!pdfUrl || !question) {
       return NextResponse.json({ answer: "" }, { status: 400 });
     }
 
+    if (sessionId) {
+      try {
+        const parsed = await askInSession(String(sessionId), { pdfUrl, question });
+        return NextResponse.json({ answer: parsed.answer || "" });
+      } catch (err) {
+        console.error("pdfchat session error:", err);
+        return NextResponse.json({ answer: "", error: "Python session failed. See server logs." }, { status: 500 });
+      }
+    }
+
     const pythonCmd =
       process.env.PYTHON_PATH || (process.platform === "win32" ? "python" : "python3");
     const scriptPath = path.join(process.cwd(), "python", "pdfchat.py");
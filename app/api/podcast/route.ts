@@ -56,6 +56,9 @@ export async function POST(req: NextRequest) {
     const title: string | undefined = body?.title;     // optional
     const topic: string | undefined = body?.topic;     // optional
     const maxTurns: number | undefined = body?.maxTurns;
+    // "mp3" (growing file) or "hls" (playlist + segments); answer as soon as the path is known
+    const stream: string | undefined =
+      body?.stream === true ? "mp3" : body?.stream === "mp3" || body?.stream === "hls" ? body.stream : undefined;
 
     if (!text) {
       return NextResponse.json({ error: "Missing text" }, { status: 400 });
@@ -74,6 +77,7 @@ export async function POST(req: NextRequest) {
     if (typeof maxTurns === "number" && Number.isFinite(maxTurns)) {
       args.push("--max-turns", String(maxTurns));
     }
+    if (stream) args.push("--stream", stream);
 
     // Spawn without any global state -> safe alongside Model-2 runs
     const child = spawn(pythonCmd, args, {
@@ -96,6 +100,34 @@ export async function POST(req: NextRequest) {
     child.stdin.write(text);
     child.stdin.end();
 
+    if (stream) {
+      // Python prints the playable path first, then keeps appending audio
+      const first: string | null = await new Promise((resolve) => {
+        let buf = "";
+        const onData = (d: Buffer) => {
+          buf += d.toString();
+          const nl = buf.indexOf("\n");
+          if (nl !== -1) {
+            child.stdout.off("data", onData);
+            resolve(buf.slice(0, nl).trim());
+          }
+        };
+        child.stdout.on("data", onData);
+        child.on("close", () => resolve(null));
+      });
+      child.on("close", (c) => {
+        if (stderr) console.error("[/api/podcast stderr]\n" + stderr);
+        if (c) console.error(`[/api/podcast] streaming run exited with ${c}`);
+      });
+      if (!first || !first.startsWith("/audio/")) {
+        return NextResponse.json(
+          { error: "Unexpected python output", stderr: stderr.slice(0, 800) },
+          { status: 500 }
+        );
+      }
+      return NextResponse.json({ audioUrl: first, streaming: true, ok: true });
+    }
+
     const code: number = await new Promise((resolve) => {
       child.on("close", (c) => resolve(c ?? 0));
     });
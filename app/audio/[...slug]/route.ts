@@ -13,9 +13,43 @@ function contentTypeFor(file: string) {
   if (ext === ".m4a") return "audio/mp4";
   if (ext === ".ogg") return "audio/ogg";
   if (ext === ".txt") return "text/plain; charset=utf-8";
+  if (ext === ".m3u8") return "application/vnd.apple.mpegurl";
   return "application/octet-stream";
 }
 
+function followGrowingFile(filePath: string, base: string, idleMs = 60_000) {
+  let pos = 0;
+  let idle = 0;
+  return new ReadableStream<Uint8Array>({
+    async pull(controller) {
+      for (;;) {
+        // check the marker before sizing so bytes written ahead of `.eos` are never missed
+        const done = fs.existsSync(`${base}.eos`) || !fs.existsSync(`${base}.live`);
+        const size = (await fs.promises.stat(filePath).catch(() => null))?.size ?? 0;
+        if (size > pos) {
+          const fh = await fs.promises.open(filePath, "r");
+          try {
+            const buf = Buffer.alloc(size - pos);
+            const { bytesRead } = await fh.read(buf, 0, buf.length, pos);
+            pos += bytesRead;
+            controller.enqueue(new Uint8Array(buf.subarray(0, bytesRead)));
+          } finally {
+            await fh.close();
+          }
+          idle = 0;
+          return;
+        }
+        if (done || idle >= idleMs) {
+          controller.close();
+          return;
+        }
+        await new Promise((r) => setTimeout(r, 200));
+        idle += 200;
+      }
+    },
+  });
+}
+
 export async function GET(
   req: NextRequest,
   { params }: { params: { slug: string[] } }
@@ -46,6 +80,18 @@ export async function GET(
     "Content-Type": contentTypeFor(filePath),
   });
 
+  // A podcast still being written (generate_podcast.py --stream mp3) has a
+  // sibling `<id>.live` marker; follow the file until `<id>.eos` appears.
+  // Checked before Range: <audio> sends `bytes=0-`, and a 206 sized to the
+  // bytes written so far would end playback there. Its length isn't known
+  // yet, so it is served whole and unseekable.
+  const base = filePath.replace(/\.mp3$/i, "");
+  if (base !== filePath && fs.existsSync(`${base}.live`)) {
+    headers.set("Accept-Ranges", "none");
+    headers.set("Cache-Control", "no-store");
+    return new NextResponse(followGrowingFile(filePath, base) as any, { status: 200, headers });
+  }
+
   // Range support (seeking)
   if (range) {
     const m = /bytes=(\d*)-(\d*)/.exec(range);
@@ -13,6 +13,8 @@ export default function PdfChat({ pdfUrl }: { pdfUrl: string }) {
   const [input, setInput] = useState("")
   const [loading, setLoading] = useState(false)
   const scrollRef = useRef<HTMLDivElement>(null)
+  // One server-side chat session per mounted chat, so follow-ups keep context
+  const sessionIdRef = useRef<string>(Math.random().toString(36).slice(2) + Date.now().toString(36))
 
   useEffect(() => {
     // Auto-scroll to bottom when messages update
@@ -33,7 +35,7 @@ export default function PdfChat({ pdfUrl }: { pdfUrl: string }) {
       const res = await fetch("/api/pdfchat", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ pdfUrl, question: userMessage }),
+        body: JSON.stringify({ pdfUrl, question: userMessage, sessionId: sessionIdRef.current }),
       })
 
       const data = await res.json()
@@ -2,6 +2,9 @@ import "server-only";
 
 import type { ChildProcess } from "child_process"
 import { spawn } from "child_process"
+import net from "net"
+import os from "os"
+import path from "path"
 
 type RunState = {
   running: boolean
@@ -12,6 +15,7 @@ type RunState = {
 }
 
 let currentChild: ChildProcess | null = null
+let currentJobId: string | null = null
 let state: RunState = {
   running: false,
   runId: null,
@@ -55,7 +59,126 @@ function killProcessTreeWin(pid: number): Promise<void> {
   })
 }
 
+// ---- model_2 scheduler (python/model_2/scheduler.py) ----
+
+type SchedulerReply = {
+  ok: boolean
+  error?: string
+  job_id?: string
+  state?: string
+}
+
+const FINISHED_STATES = new Set(["done", "failed", "cancelled"])
+
+export function schedulerAddress(): string {
+  return (
+    process.env.MODEL2_SCHEDULER ||
+    (process.platform === "win32" ? "127.0.0.1:8767" : path.join(os.tmpdir(), "model2-scheduler.sock"))
+  )
+}
+
+// "host:port" is TCP, anything else a Unix socket path (as scheduler.py's parse_address)
+function connectOptions(address: string): net.NetConnectOpts {
+  const i = address.lastIndexOf(":")
+  const host = address.slice(0, i)
+  const port = address.slice(i + 1)
+  if (i !== -1 && /^\d+$/.test(port) && !host.includes(path.sep)) {
+    return { host: host || "127.0.0.1", port: Number(port) }
+  }
+  return { path: address }
+}
+
+// One JSON-lines request/reply round trip with a running scheduler
+export function schedulerRequest(payload: object, timeoutMs = 5000): Promise<SchedulerReply> {
+  return new Promise((resolve, reject) => {
+    const sock = net.createConnection(connectOptions(schedulerAddress()))
+    let buf = ""
+    const timer = setTimeout(() => sock.destroy(new Error("scheduler request timed out")), timeoutMs)
+    sock.setEncoding("utf8")
+    sock.on("connect", () => sock.write(JSON.stringify(payload) + "\n"))
+    sock.on("data", (d) => {
+      buf += d
+      const nl = buf.indexOf("\n")
+      if (nl === -1) return
+      clearTimeout(timer)
+      sock.end()
+      try {
+        resolve(JSON.parse(buf.slice(0, nl)))
+      } catch (e) {
+        reject(e)
+      }
+    })
+    sock.on("error", (e) => {
+      clearTimeout(timer)
+      reject(e)
+    })
+    sock.on("close", () => {
+      clearTimeout(timer)
+      reject(new Error("scheduler closed the connection"))
+    })
+  })
+}
+
+function schedulerAbsent(err: any): boolean {
+  // no socket file, or a stale one / closed port left by a scheduler that is gone
+  return err?.code === "ENOENT" || err?.code === "ECONNREFUSED"
+}
+
+/**
+ * Queue a run on the scheduler, which keeps the models loaded between runs.
+ * Resolves to the job id, or null when no scheduler is listening (the caller
+ * then spawns process_pdf.py itself). `onFinished` gets 0 once the job is
+ * done, 1 if it failed or was cancelled, null if the scheduler went away.
+ */
+export async function submitToScheduler(
+  inputDir: string,
+  outputDir: string,
+  onFinished: (code: number | null) => void
+): Promise<string | null> {
+  let reply: SchedulerReply
+  try {
+    reply = await schedulerRequest({ op: "submit", input_dir: inputDir, output_dir: outputDir, priority: "interactive" })
+  } catch (err) {
+    if (schedulerAbsent(err)) return null
+    throw err
+  }
+  if (!reply.ok || !reply.job_id) throw new Error(`scheduler: ${reply.error || "submit failed"}`)
+  const jobId = reply.job_id
+  currentJobId = jobId
+  void watchJob(jobId, onFinished)
+  return jobId
+}
+
+async function watchJob(jobId: string, onFinished: (code: number | null) => void) {
+  let code: number | null = null
+  try {
+    for (;;) {
+      const reply = await schedulerRequest({ op: "wait", job_id: jobId, timeout: 30 }, 35000)
+      if (!reply.ok) break
+      if (FINISHED_STATES.has(String(reply.state))) {
+        code = reply.state === "done" ? 0 : 1
+        break
+      }
+    }
+  } catch {}
+  if (currentJobId === jobId) currentJobId = null
+  onFinished(code)
+}
+
+async function cancelCurrentJob(): Promise<void> {
+  const jobId = currentJobId
+  currentJobId = null
+  state.running = false
+  try {
+    await schedulerRequest({ op: "cancel", job_id: jobId })
+    // a running job stops at its next stage boundary; wait for it so the next run may reuse the output folder
+    await schedulerRequest({ op: "wait", job_id: jobId, timeout: 15 }, 20000)
+  } catch {}
+}
+
+// Stops the current run: cancels its scheduler job, or kills the spawned process tree
 export async function killCurrentProcess(): Promise<void> {
+  if (currentJobId) return cancelCurrentJob()
   if (!currentChild) return
   const pid = currentChild.pid
   if (!pid) {
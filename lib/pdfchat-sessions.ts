@@ -0,0 +1,115 @@
+import "server-only";
+
+import type { ChildProcessWithoutNullStreams } from "child_process"
+import { spawn } from "child_process"
+import path from "path"
+
+// One long-lived `pdfchat.py --session` process per chat session: the PDF is
+// extracted and embedded once and follow-up questions only pay for the LLM call.
+
+type Pending = { resolve: (v: any) => void; reject: (e: Error) => void; timer: NodeJS.Timeout }
+
+type Session = {
+  proc: ChildProcessWithoutNullStreams
+  buffer: string
+  pending: Pending[]
+  idleTimer: NodeJS.Timeout | null
+}
+
+const IDLE_MS = Number(process.env.PDFCHAT_SESSION_IDLE_MS || 10 * 60 * 1000)
+const MAX_SESSIONS = Number(process.env.PDFCHAT_MAX_SESSIONS || 8)
+const REQUEST_TIMEOUT_MS = Number(process.env.PDFCHAT_REQUEST_TIMEOUT_MS || 3 * 60 * 1000)
+
+const sessions = new Map<string, Session>()
+
+function closeSession(id: string) {
+  const s = sessions.get(id)
+  if (!s) return
+  sessions.delete(id)
+  if (s.idleTimer) clearTimeout(s.idleTimer)
+  s.proc.stdin.end()
+  rejectAll(s, new Error("pdfchat session closed"))
+}
+
+function rejectAll(s: Session, err: Error) {
+  for (const p of s.pending.splice(0)) {
+    clearTimeout(p.timer)
+    p.reject(err)
+  }
+}
+
+// Answers are matched to questions by order, so a session that failed one
+// request (died, unwritable, too slow) can't be trusted with the rest.
+function failSession(id: string, s: Session, err: Error) {
+  if (sessions.get(id) === s) sessions.delete(id)
+  if (s.idleTimer) clearTimeout(s.idleTimer)
+  rejectAll(s, err)
+  if (s.proc.exitCode === null) s.proc.kill()
+}
+
+function touch(id: string, s: Session) {
+  if (s.idleTimer) clearTimeout(s.idleTimer)
+  s.idleTimer = setTimeout(() => closeSession(id), IDLE_MS)
+}
+
+function startSession(id: string): Session {
+  if (sessions.size >= MAX_SESSIONS) {
+    // evict the session that was created first
+    const oldest = sessions.keys().next().value
+    if (oldest !== undefined) closeSession(oldest)
+  }
+  const pythonCmd =
+    process.env.PYTHON_PATH || (process.platform === "win32" ? "python" : "python3")
+  const scriptPath = path.join(process.cwd(), "python", "pdfchat.py")
+  const proc = spawn(pythonCmd, [scriptPath, "--session"], {
+    stdio: ["pipe", "pipe", "pipe"],
+    env: process.env,
+  })
+  const s: Session = { proc, buffer: "", pending: [], idleTimer: null }
+
+  proc.stdout.on("data", (d) => {
+    s.buffer += d.toString()
+    let nl: number
+    while ((nl = s.buffer.indexOf("\n")) >= 0) {
+      const line = s.buffer.slice(0, nl).trim()
+      s.buffer = s.buffer.slice(nl + 1)
+      if (!line) continue
+      const p = s.pending.shift()
+      if (!p) continue
+      clearTimeout(p.timer)
+      try {
+        p.resolve(JSON.parse(line))
+      } catch (err) {
+        p.reject(new Error(`Failed to parse Python output: ${line}`))
+      }
+    }
+  })
+  proc.stderr.on("data", (d) => console.error("[pdfchat]", d.toString().trimEnd()))
+  proc.on("close", (code) => failSession(id, s, new Error(`pdfchat session exited (${code})`)))
+  // spawn failures (bad PYTHON_PATH) and EPIPE from a session that just died
+  proc.on("error", (err) => failSession(id, s, new Error(`pdfchat session failed: ${err.message}`)))
+  proc.stdin.on("error", (err) => failSession(id, s, new Error(`pdfchat session failed: ${err.message}`)))
+
+  sessions.set(id, s)
+  return s
+}
+
+export function askInSession(
+  sessionId: string,
+  payload: { pdfUrl?: string; question?: string; reset?: boolean; noCache?: boolean }
+): Promise<{ answer: string }> {
+  const s = sessions.get(sessionId) ?? startSession(sessionId)
+  touch(sessionId, s)
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(
+      () => failSession(sessionId, s, new Error(`pdfchat request timed out after ${REQUEST_TIMEOUT_MS}ms`)),
+      REQUEST_TIMEOUT_MS
+    )
+    s.pending.push({ resolve, reject, timer })
+    s.proc.stdin.write(JSON.stringify(payload) + "\n")
+  })
+}
+
+export function endSession(sessionId: string) {
+  closeSession(sessionId)
+}
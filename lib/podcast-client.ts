@@ -7,6 +7,7 @@ export type StartPodcastParams = {
   title?: string;
   topic?: string;
   maxTurns?: number;    
+  stream?: boolean | "mp3" | "hls"; // return the URL as soon as playback can start
 };
 
 export async function startPodcast(params: StartPodcastParams) {
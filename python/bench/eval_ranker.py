@@ -0,0 +1,213 @@
+# python/bench/eval_ranker.py
+"""
+Accuracy-versus-latency evaluation of MultiQueryRanker configurations.
+
+Takes a corpus (<dir>/PDFs) and a labeled query set (<dir>/labels.json, as
+written by synth_pdf.py: [{id, query, persona?, task?, relevant: [{document,
+title}]}]) and runs every query through the model_2 pipeline — preview
+gating, document selection, chunk extraction, ranking — once per
+configuration of the speed knobs:
+
+    quantize_int8  cross_top_m  shortlist_multiplier  batch_size
+    max_pages_per_doc  preview_pages
+
+Each configuration runs in its own process so peak RSS is its own. The
+report gives nDCG@k and recall@k (hits / min(k, relevant)), p50/p95
+per-query latency, model load time and peak RSS; the accuracy/latency
+Pareto frontier (nDCG@k vs p95) is marked, and configurations losing more
+than --max_ndcg_drop against the default are flagged as unsafe.
+
+    python python/bench/eval_ranker.py python/model_2/models --synthetic 8x4
+    python python/bench/eval_ranker.py python/model_2/models --corpus my_eval --mode grid
+"""
+import os, sys, json, math, time, argparse, itertools, statistics, subprocess, tempfile
+from contextlib import redirect_stdout
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for p in (_HERE, os.path.join(os.path.dirname(_HERE), "model_2")):
+    if p not in sys.path: sys.path.insert(0, p)
+import synth_pdf
+
+DEFAULT_CONFIG = {"quantize_int8": False, "cross_top_m": 48, "shortlist_multiplier": 4, "batch_size": 128,
+                  "max_pages_per_doc": None, "preview_pages": 2}
+DEFAULT_SWEEP = {"quantize_int8": [False, True], "cross_top_m": [16, 48, 96], "shortlist_multiplier": [2, 4],
+                 "batch_size": [32, 128], "max_pages_per_doc": [None, 2], "preview_pages": [1, 2]}
+
+# --------------------------
+# Metrics
+# --------------------------
+def ndcg_at_k(ranked_rel, n_relevant, k):
+    dcg = sum(rel / math.log2(i + 2) for i, rel in enumerate(ranked_rel[:k]))
+    idcg = sum(1.0 / math.log2(i + 2) for i in range(min(k, n_relevant)))
+    return dcg / idcg if idcg else 0.0
+
+def recall_at_k(ranked_rel, n_relevant, k):
+    return sum(ranked_rel[:k]) / min(k, n_relevant) if n_relevant else 0.0
+
+def percentile(xs, q):
+    xs = sorted(xs)
+    if not xs: return None
+    i = (len(xs) - 1) * q
+    lo, hi = math.floor(i), math.ceil(i)
+    return xs[lo] + (xs[hi] - xs[lo]) * (i - lo)
+
+def configs_for(mode, sweep, base=DEFAULT_CONFIG):
+    """`oat`: the default plus one knob changed at a time; `grid`: every combination."""
+    if mode == "grid":
+        keys = list(sweep)
+        return [dict(base, **dict(zip(keys, vals))) for vals in itertools.product(*(sweep[k] for k in keys))]
+    out = [dict(base)]
+    for key, values in sweep.items():
+        for v in values:
+            cfg = dict(base, **{key: v})
+            if cfg not in out: out.append(cfg)
+    return out
+
+def pareto_front(rows, quality="ndcg", cost="p95_ms"):
+    """Indices of rows no other row beats on both quality (higher) and cost (lower)."""
+    front = []
+    for i, a in enumerate(rows):
+        dominated = any(b[quality] >= a[quality] and b[cost] <= a[cost] and
+                        (b[quality] > a[quality] or b[cost] < a[cost]) for j, b in enumerate(rows) if j != i)
+        if not dominated: front.append(i)
+    return front
+
+# --------------------------
+# One configuration (worker process)
+# --------------------------
+def evaluate(config, corpus_dir, labels, model_dir, k=5, top_k=5, per_doc_k=2, max_docs=3,
+             dedup_threshold=0.9, persona="user"):
+    import process_pdf as m2
+    from stage_trace import _peak_rss_bytes
+
+    t0 = time.perf_counter()
+    ranker = m2.MultiQueryRanker(model_dir=model_dir, cross_top_m=config["cross_top_m"],
+                                 quantize_int8=config["quantize_int8"])
+    ranker.model, ranker.cross_encoder  # load now so it isn't counted in the first timing
+    load_ms = (time.perf_counter() - t0) * 1000.0
+    pdfs_dir = os.path.join(corpus_dir, "PDFs")
+    pdf_files = sorted(f for f in os.listdir(pdfs_dir) if f.lower().endswith(".pdf"))
+    pdf_files.sort(key=lambda f: m2.get_page_count_safe(os.path.join(pdfs_dir, f)))
+
+    per_query, latencies = [], []
+    for item in labels:
+        q_persona, q_task = item.get("persona", persona), item.get("task", item["query"])
+        t = time.perf_counter()
+        previews = {}
+        for name in pdf_files:
+            try:
+                previews[name] = m2.quick_doc_preview_text(os.path.join(pdfs_dir, name),
+                                                           max_pages=config["preview_pages"])
+            except Exception:
+                previews[name] = ""
+        anchor = ranker.build_anchor(q_persona, q_task, item["query"])
+        scores = ranker.score_documents(previews, anchor, batch_size=config["batch_size"])
+        selected = m2.select_docs(scores, pdf_files, max_docs)
+        chunks_by_doc, _ = m2.load_doc_chunks(selected, pdfs_dir, None, config["max_pages_per_doc"], dedup_threshold)
+        ranked = []
+        for name in selected:
+            if not chunks_by_doc.get(name): continue
+            ranked += ranker.rank(q_persona, q_task, chunks_by_doc[name], query=item["query"], top_k=top_k,
+                                  max_chunks_per_doc=per_doc_k, batch_size=config["batch_size"],
+                                  shortlist_multiplier=config["shortlist_multiplier"])
+        latencies.append((time.perf_counter() - t) * 1000.0)
+
+        ranked.sort(key=lambda c: c["final_score"], reverse=True)
+        relevant = {(r["document"], r["title"].strip()) for r in item["relevant"]}
+        rel = [1.0 if (c["document"], c["title"].strip()) in relevant else 0.0 for c in ranked]
+        per_query.append({"id": item.get("id"), "ndcg": ndcg_at_k(rel, len(relevant), k),
+                          "recall": recall_at_k(rel, len(relevant), k), "ms": latencies[-1]})
+
+    return {"config": config, "queries": len(per_query),
+            "ndcg": round(statistics.mean(q["ndcg"] for q in per_query), 4) if per_query else 0.0,
+            "recall": round(statistics.mean(q["recall"] for q in per_query), 4) if per_query else 0.0,
+            "p50_ms": round(percentile(latencies, 0.5) or 0.0, 2), "p95_ms": round(percentile(latencies, 0.95) or 0.0, 2),
+            "load_ms": round(load_ms, 2), "peak_rss_mb": round((_peak_rss_bytes() or 0) / (1024 * 1024), 1),
+            "per_query": per_query}
+
+def run_config(config, corpus_dir, model_dir, args):
+    """evaluate() in a fresh interpreter; returns its result dict."""
+    cmd = [sys.executable, os.path.abspath(__file__), model_dir, "--corpus", corpus_dir, "--k", str(args.k),
+           "--max_docs", str(args.max_docs), "--_worker", json.dumps(config)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"config": config, "error": proc.stderr.strip().splitlines()[-1:] or ["worker failed"]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+# --------------------------
+# Report
+# --------------------------
+def summarize(results, max_ndcg_drop=0.02):
+    rows = [r for r in results if "error" not in r]
+    base = next((r for r in rows if r["config"] == DEFAULT_CONFIG), None)
+    for i in pareto_front(rows):
+        rows[i]["pareto"] = True
+    for r in rows:
+        r.setdefault("pareto", False)
+        if base is not None:
+            r["ndcg_delta"] = round(r["ndcg"] - base["ndcg"], 4)
+            r["unsafe"] = r["ndcg_delta"] < -max_ndcg_drop
+    return rows
+
+def _cfg_label(cfg):
+    diff = {k: v for k, v in cfg.items() if DEFAULT_CONFIG.get(k) != v}
+    return ", ".join(f"{k}={v}" for k, v in diff.items()) or "default"
+
+def print_table(rows, k, out=sys.stderr):
+    print(f"{'config':<44} {'nDCG@'+str(k):>8} {'R@'+str(k):>6} {'p50 ms':>9} {'p95 ms':>9} {'RSS MB':>8}", file=out)
+    for r in sorted(rows, key=lambda r: -r["ndcg"]):
+        flags = ("*" if r["pareto"] else " ") + (" unsafe" if r.get("unsafe") else "")
+        print(f"{_cfg_label(r['config'])[:44]:<44} {r['ndcg']:>8.3f} {r['recall']:>6.3f} {r['p50_ms']:>9.1f} "
+              f"{r['p95_ms']:>9.1f} {r['peak_rss_mb']:>8.0f} {flags}", file=out)
+    print("* = on the nDCG / p95 latency Pareto frontier", file=out)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep ranker speed settings and report accuracy vs latency.")
+    parser.add_argument("model_dir", help="Directory containing local model folders.")
+    parser.add_argument("--corpus", default=None, help="Directory with PDFs/ and labels.json.")
+    parser.add_argument("--synthetic", default=None, help="Generate a <docs>x<pages> synthetic corpus instead.")
+    parser.add_argument("--mode", choices=("oat", "grid"), default="oat",
+                        help="One knob at a time around the default, or the full grid.")
+    parser.add_argument("--sweep", default=None, help="JSON {knob: [values]} replacing the default sweep.")
+    parser.add_argument("--k", type=int, default=5, help="Cutoff for nDCG and recall.")
+    parser.add_argument("--max_docs", type=int, default=3, help="Documents kept after gating, as in process_pdf.")
+    parser.add_argument("--max_ndcg_drop", type=float, default=0.02, help="nDCG loss vs the default that flags a config unsafe.")
+    parser.add_argument("--out", default=None, help="Write the full JSON report here.")
+    parser.add_argument("--_worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._worker:
+        with open(os.path.join(args.corpus, "labels.json"), "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        with redirect_stdout(sys.stderr):
+            res = evaluate(json.loads(args._worker), args.corpus, labels, args.model_dir,
+                           k=args.k, max_docs=args.max_docs)
+        print(json.dumps(res))
+        sys.exit(0)
+
+    corpus = args.corpus
+    if args.synthetic:
+        docs, _, pages = args.synthetic.lower().partition("x")
+        corpus = corpus or tempfile.mkdtemp(prefix="model2-eval-")
+        synth_pdf.make_corpus(corpus, docs=int(docs), pages=int(pages or 4))
+    if not corpus or not os.path.exists(os.path.join(corpus, "labels.json")):
+        parser.error("need --corpus with labels.json, or --synthetic")
+
+    sweep = json.loads(args.sweep) if args.sweep else DEFAULT_SWEEP
+    configs = configs_for(args.mode, sweep)
+    results = []
+    for n, cfg in enumerate(configs, 1):
+        print(f"[eval] {n}/{len(configs)} {_cfg_label(cfg)}", file=sys.stderr, flush=True)
+        results.append(run_config(cfg, corpus, args.model_dir, args))
+        if "error" in results[-1]:
+            print(f"[eval]   failed: {results[-1]['error']}", file=sys.stderr)
+
+    rows = summarize(results, args.max_ndcg_drop)
+    report = {"corpus": os.path.abspath(corpus), "k": args.k, "mode": args.mode, "default": DEFAULT_CONFIG,
+              "results": rows, "failed": [r for r in results if "error" in r]}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print_table(rows, args.k)
+    json.dump({"pareto": [r["config"] for r in rows if r["pareto"]]}, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,202 @@
+# python/bench/load_test.py
+"""
+Offline load test of the Python entry points the Node routes spawn.
+
+Starts the Vertex stub (python/stubs/vertex_server.py), the Azure TTS stub
+(python/stubs/tts_server.py) and a static server for a synthetic PDF corpus,
+points the scripts at them through their usual environment variables, then
+launches each entry point as a fresh process — as the routes do — keeping
+`--concurrency` of them running until `--requests` have finished.
+
+Per entry point it reports throughput, p50/p99 latency, error count, CPU
+seconds per request (user + system, from wait4) and peak RSS per process;
+the stubs' own counters (requests, injected failures, max in flight) are
+included so client retries and concurrency limits are visible.
+
+    python python/bench/load_test.py --entries pdfchat,summary,insights --concurrency 8 --requests 40 \
+        --llm-latency-ms 900 --llm-error-rate 0.02
+"""
+import os, sys, json, time, shutil, argparse, tempfile, statistics, subprocess, threading
+import urllib.request
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_PY = os.path.dirname(_HERE)
+for p in (_HERE, os.path.join(_PY, "stubs")):
+    if p not in sys.path: sys.path.insert(0, p)
+import synth_pdf
+import tts_server
+import vertex_server
+
+SELECTION = ("Battery storage lets a rooftop solar array keep supplying power after sunset. "
+             "Lithium cells lose capacity with every charge and discharge cycle, so sizing has to allow for it.")
+
+# --------------------------
+# Entry points: name -> (argv, stdin) for request number n
+# --------------------------
+def entry_points(ctx):
+    py = sys.executable
+    return {
+        "pdfchat": lambda n: ([py, os.path.join(_PY, "pdfchat.py")],
+                              json.dumps({"pdfUrl": ctx["pdf_url"](n), "question": f"What limits battery life? ({n})",
+                                          "noCache": True})),
+        "summary": lambda n: ([py, os.path.join(_PY, "summarygenerator.py"), ctx["pdf_url"](n), "--no-cache"], ""),
+        "insights": lambda n: ([py, os.path.join(_PY, "insightgenerator.py"), "--no-cache"], f"{SELECTION} ({n})"),
+        "insights_batch": lambda n: ([py, os.path.join(_PY, "insightgenerator.py"), "--batch", "--no-cache"],
+                                     json.dumps([{"id": f"s{i}", "text": f"{SELECTION} ({n}.{i})"} for i in range(4)])),
+        "podcast": lambda n: ([py, os.path.join(_PY, "generate_podcast.py")], f"{SELECTION} ({n})"),
+        "model_1": lambda n: ([py, os.path.join(_PY, "model_1", "process_pdf.py"), "--input", ctx["pdf_path"](n),
+                               "--output", os.path.join(ctx["tmp"], "m1", str(n))], ""),
+        "model_2": lambda n: ([py, os.path.join(_PY, "model_2", "process_pdf.py"), ctx["corpus"],
+                               os.path.join(ctx["tmp"], "m2", str(n)), ctx["model_dir"] or "", "--no_cache"], ""),
+    }
+
+# --------------------------
+# Running one process
+# --------------------------
+def run_once(argv, stdin_text, env, workdir):
+    """
+    Run to completion; wall ms, exit code, CPU seconds and peak RSS of that process.
+    It runs in `workdir`, so what the scripts write relative to the working
+    directory (podcast MP3s under public/audio, caches under .cache) stays out of the repo.
+    """
+    fd_in, in_path = tempfile.mkstemp(dir=workdir)
+    with os.fdopen(fd_in, "w", encoding="utf-8") as f:
+        f.write(stdin_text)
+    with open(in_path, "rb") as fin, tempfile.TemporaryFile(dir=workdir) as ferr, \
+            tempfile.TemporaryFile(dir=workdir) as fout:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(argv, stdin=fin, stdout=fout, stderr=ferr, env=env, cwd=workdir)
+        cpu_s = rss_mb = None
+        if hasattr(os, "wait4"):
+            _, status, ru = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            cpu_s = ru.ru_utime + ru.ru_stime
+            rss_mb = ru.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        else:
+            proc.wait()
+        wall_ms = (time.perf_counter() - t0) * 1000.0
+        ferr.seek(0)
+        err_tail = ferr.read()[-400:].decode("utf-8", "replace").strip()
+    os.remove(in_path)
+    return {"ms": wall_ms, "code": proc.returncode, "cpu_s": cpu_s, "rss_mb": rss_mb,
+            "error": err_tail if proc.returncode != 0 else None}
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    if not xs: return None
+    i = min(len(xs) - 1, max(0, int(round(q * (len(xs) - 1)))))
+    return round(xs[i], 1)
+
+def load(entry, make_cmd, env, workdir, concurrency, requests):
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        runs = list(ex.map(lambda n: run_once(*make_cmd(n), env, workdir), range(requests)))
+    wall = time.perf_counter() - t0
+    ok = [r for r in runs if r["code"] == 0]
+    cpu = [r["cpu_s"] for r in runs if r["cpu_s"] is not None]
+    rss = [r["rss_mb"] for r in runs if r["rss_mb"] is not None]
+    return {
+        "entry": entry, "concurrency": concurrency, "requests": len(runs), "ok": len(ok),
+        "errors": len(runs) - len(ok), "wall_s": round(wall, 2),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else 0.0,
+        "p50_ms": _pct([r["ms"] for r in ok], 0.50), "p99_ms": _pct([r["ms"] for r in ok], 0.99),
+        "cpu_s_per_request": round(statistics.mean(cpu), 3) if cpu else None,
+        # share of the machine's cores the entry point kept busy during the run
+        "cpu_utilization": round(sum(cpu) / wall / (os.cpu_count() or 1), 3) if cpu and wall else None,
+        "rss_mb_mean": round(statistics.mean(rss), 1) if rss else None,
+        "rss_mb_max": round(max(rss), 1) if rss else None,
+        "first_error": next((r["error"] for r in runs if r["error"]), None),
+    }
+
+def _stub_stats(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as r:
+            return json.loads(r.read())
+    except (OSError, ValueError):
+        return None
+
+def _reset_stub_stats(*stat_classes):
+    for s in stat_classes:
+        with s.lock:
+            for k in ("requests", "failures", "hangs", "max_inflight"):
+                if hasattr(s, k): setattr(s, k, 0)
+
+# --------------------------
+# Main
+# --------------------------
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Load-test the Python entry points against local LLM/TTS stubs.")
+    ap.add_argument("--entries", default="pdfchat,summary,insights,insights_batch,podcast,model_1",
+                    help="Comma-separated entry points (also: model_2, which needs --model_dir).")
+    ap.add_argument("--concurrency", type=int, default=4, help="Processes kept running at once.")
+    ap.add_argument("--requests", type=int, default=20, help="Requests per entry point.")
+    ap.add_argument("--model_dir", default=None, help="Model folder for model_2.")
+    ap.add_argument("--docs", type=int, default=4, help="Synthetic corpus size.")
+    ap.add_argument("--pages", type=int, default=4)
+    ap.add_argument("--llm-latency-ms", type=float, default=500.0)
+    ap.add_argument("--llm-jitter-ms", type=float, default=150.0)
+    ap.add_argument("--llm-ms-per-token", type=float, default=0.0)
+    ap.add_argument("--llm-error-rate", type=float, default=0.0)
+    ap.add_argument("--llm-error-codes", default="429,503")
+    ap.add_argument("--llm-hang-rate", type=float, default=0.0)
+    ap.add_argument("--tts-latency-ms", type=float, default=300.0)
+    ap.add_argument("--tts-jitter-ms", type=float, default=80.0)
+    ap.add_argument("--tts-error-rate", type=float, default=0.0)
+    ap.add_argument("--out", default=None, help="Write the JSON report here as well as to stdout.")
+    a = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="load-test-")
+    try:
+        corpus = os.path.join(tmp, "corpus")
+        synth_pdf.make_corpus(corpus, docs=a.docs, pages=a.pages)
+        pdfs = sorted(f for f in os.listdir(os.path.join(corpus, "PDFs")) if f.endswith(".pdf"))
+
+        files = ThreadingHTTPServer(("127.0.0.1", 0), partial(type("Quiet", (SimpleHTTPRequestHandler,),
+                                    {"log_message": lambda *x: None}), directory=os.path.join(corpus, "PDFs")))
+        files.daemon_threads = True
+        threading.Thread(target=files.serve_forever, daemon=True).start()
+        llm = vertex_server.serve(latency_ms=a.llm_latency_ms, jitter_ms=a.llm_jitter_ms,
+                                  ms_per_token=a.llm_ms_per_token, error_rate=a.llm_error_rate,
+                                  error_codes=[int(c) for c in a.llm_error_codes.split(",") if c.strip()],
+                                  hang_rate=a.llm_hang_rate)
+        tts = tts_server.serve(latency_ms=a.tts_latency_ms, jitter_ms=a.tts_jitter_ms, error_rate=a.tts_error_rate)
+        llm_url = f"http://127.0.0.1:{llm.server_address[1]}"
+        tts_url = f"http://127.0.0.1:{tts.server_address[1]}"
+
+        env = dict(os.environ, LLM_PROVIDER="vertex_http", LLM_HTTP_ENDPOINT=llm_url, LLM_CACHE_BYPASS="1",
+                   TTS_PROVIDER="azure", AZURE_TTS_KEY="stub", AZURE_TTS_ENDPOINT=f"{tts_url}/cognitiveservices/v1",
+                   TTS_CACHE_BYPASS="1", PYTHONIOENCODING="utf-8")
+        # the host's batch-size profile lives under the repo, not the temporary working directory
+        env.setdefault("MODEL2_TUNING_DIR", os.path.join(os.path.dirname(_PY), ".cache", "model2", "tuning"))
+        ctx = {"tmp": tmp, "corpus": corpus, "model_dir": a.model_dir,
+               "pdf_url": lambda n: f"http://127.0.0.1:{files.server_address[1]}/{pdfs[n % len(pdfs)]}",
+               "pdf_path": lambda n: os.path.join(corpus, "PDFs", pdfs[n % len(pdfs)])}
+        eps = entry_points(ctx)
+
+        results = []
+        for entry in [e.strip() for e in a.entries.split(",") if e.strip()]:
+            if entry not in eps:
+                print(f"[load] unknown entry point: {entry}", file=sys.stderr); continue
+            if entry == "model_2" and not a.model_dir:
+                print("[load] skipping model_2: --model_dir not given", file=sys.stderr); continue
+            _reset_stub_stats(vertex_server.Stats, tts_server.Stats)
+            print(f"[load] {entry}: {a.requests} requests at concurrency {a.concurrency}", file=sys.stderr, flush=True)
+            res = load(entry, eps[entry], env, tmp, a.concurrency, a.requests)
+            res["llm_stub"] = _stub_stats(llm_url)
+            res["tts_stub"] = _stub_stats(tts_url)
+            results.append(res)
+            print(f"[load]   {res['ok']}/{res['requests']} ok, {res['throughput_rps']} req/s, "
+                  f"p50 {res['p50_ms']} ms, p99 {res['p99_ms']} ms, {res['cpu_s_per_request']} CPU s/req, "
+                  f"max RSS {res['rss_mb_max']} MB", file=sys.stderr, flush=True)
+
+        report = {"cpu_count": os.cpu_count(), "settings": vars(a), "results": results}
+        if a.out:
+            with open(a.out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,214 @@
+# python/bench/run_bench.py
+"""
+Benchmark suite for the PDF pipelines on synthetic corpora (synth_pdf.py).
+
+For every corpus size it times, with `--repeat` runs each:
+
+    model_1_outline   model_1 process_single_pdf over every PDF
+    extract_chunks    model_2 extract_pdf_text_chunks over every PDF
+    rank              MultiQueryRanker.rank over all chunks of the corpus
+    main              model_2 main() end to end (models loaded per run, no result cache)
+
+plus the per-stage breakdown of the last main() run (stage_trace). Each run
+is appended to a JSON history; --compare checks it against the previous run
+from the same host and settings and exits 1 if any median slowed down by
+more than --threshold.
+
+    python python/bench/run_bench.py python/model_2/models --sizes 3x4,10x4 --compare
+"""
+import os, sys, io, json, time, socket, argparse, platform, tempfile, statistics, subprocess
+import importlib.util
+from contextlib import redirect_stdout
+from pathlib import Path
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_PY = os.path.dirname(_HERE)
+for p in (_HERE, os.path.join(_PY, "model_2")):
+    if p not in sys.path: sys.path.insert(0, p)
+import synth_pdf
+
+DEFAULT_HISTORY = os.path.join(_HERE, "history.json")
+NOISE_FLOOR_MS = 5.0  # slowdowns smaller than this are never flagged
+
+def load_model_1():
+    """model_1/process_pdf.py under its own name (model_2's module is also `process_pdf`)."""
+    spec = importlib.util.spec_from_file_location("model_1_process_pdf", os.path.join(_PY, "model_1", "process_pdf.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def parse_sizes(spec):
+    """"3x4,10x12" -> [(3 docs, 4 pages), (10 docs, 12 pages)]"""
+    out = []
+    for part in spec.split(","):
+        docs, _, pages = part.strip().lower().partition("x")
+        out.append((int(docs), int(pages or 4)))
+    return out
+
+def timed(fn, repeat=3, warmup=1):
+    for _ in range(warmup): fn()
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); runs.append((time.perf_counter() - t0) * 1000.0)
+    return {"median_ms": round(statistics.median(runs), 2), "min_ms": round(min(runs), 2),
+            "max_ms": round(max(runs), 2), "runs": len(runs)}
+
+# --------------------------
+# One corpus
+# --------------------------
+def bench_corpus(corpus_dir, model_dir, m1, m2, ranker, repeat=3, batch_size=128):
+    import stage_trace
+
+    pdf_dir = os.path.join(corpus_dir, "PDFs")
+    pdfs = sorted(os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.endswith(".pdf"))
+    with open(os.path.join(corpus_dir, "input.json"), "r", encoding="utf-8") as f:
+        inp = json.load(f)
+    persona, task = inp["persona"]["role"], inp["job_to_be_done"]["task"]
+    res = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def outline():
+            with redirect_stdout(io.StringIO()):
+                for p in pdfs: m1.process_single_pdf(Path(p), Path(tmp, "m1"))
+        res["model_1_outline"] = timed(outline, repeat)
+
+        res["extract_chunks"] = timed(lambda: [m2.extract_pdf_text_chunks(p) for p in pdfs], repeat)
+
+        chunks = []
+        for p in pdfs:
+            for c in m2.extract_pdf_text_chunks(p):
+                chunks.append(dict(c, document=os.path.basename(p)))
+        res["rank"] = timed(lambda: ranker.rank(persona, task, chunks, query=m2.enrich_query(inp),
+                                                batch_size=batch_size), repeat)
+        res["rank"]["chunks"] = len(chunks)
+
+        def end_to_end():
+            with redirect_stdout(io.StringIO()):
+                m2.main(corpus_dir, os.path.join(tmp, "m2"), model_dir, use_cache=False, batch_size=batch_size)
+        res["main"] = timed(end_to_end, repeat, warmup=0)
+        tracer = stage_trace.activate(stage_trace.Tracer())
+        try:
+            end_to_end()
+        finally:
+            stage_trace.deactivate()
+        res["main_stages"] = {k: v["wall_ms"] for k, v in tracer.report()["stages"].items()}
+    return res
+
+def host_info():
+    import torch
+    return {"host": socket.gethostname(), "platform": platform.platform(), "python": platform.python_version(),
+            "cpu_count": os.cpu_count(), "torch": torch.__version__, "torch_threads": torch.get_num_threads()}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_HERE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run(model_dir, sizes, repeat=3, seed=0, batch_size=128, work_dir=None, label=None):
+    m1 = load_model_1()
+    import process_pdf as m2
+
+    t0 = time.perf_counter()
+    ranker = m2.MultiQueryRanker(model_dir=model_dir)
+    ranker.model, ranker.cross_encoder  # load now so it isn't counted in the first timing
+    record = {"timestamp": time.time(), "label": label, "commit": git_commit(), "host": host_info(),
+              "config": {"repeat": repeat, "seed": seed, "batch_size": batch_size,
+                         "sizes": [f"{d}x{p}" for d, p in sizes]},
+              "load_models_ms": round((time.perf_counter() - t0) * 1000.0, 2), "results": {}}
+    work_dir = work_dir or tempfile.mkdtemp(prefix="model2-bench-")
+    for docs, pages in sizes:
+        name = f"{docs}x{pages}"
+        corpus = os.path.join(work_dir, f"{name}-s{seed}")
+        if not os.path.exists(os.path.join(corpus, "labels.json")):
+            synth_pdf.make_corpus(corpus, docs=docs, pages=pages, seed=seed)
+        print(f"[bench] {name} ...", file=sys.stderr, flush=True)
+        record["results"][name] = bench_corpus(corpus, model_dir, m1, m2, ranker, repeat, batch_size)
+    return record
+
+# --------------------------
+# History and regression check
+# --------------------------
+def load_history(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("runs", [])
+    except (OSError, ValueError):
+        return []
+
+def save_history(path, runs):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"runs": runs}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def find_baseline(runs, record):
+    """Latest earlier run on the same host with the same settings."""
+    for r in reversed(runs):
+        if r is record: continue
+        if r.get("host", {}).get("host") == record["host"]["host"] and r.get("config") == record["config"]:
+            return r
+    return None
+
+def compare(record, baseline, threshold=0.15):
+    """Rows per (corpus, metric) with the ratio to the baseline median; `regressed` past the threshold."""
+    rows = []
+    for corpus, metrics in record["results"].items():
+        base = baseline["results"].get(corpus, {})
+        for metric, cur in metrics.items():
+            if not isinstance(cur, dict) or "median_ms" not in cur or "median_ms" not in base.get(metric, {}):
+                continue
+            b = base[metric]["median_ms"]
+            ratio = cur["median_ms"] / b if b else float("inf")
+            rows.append({"corpus": corpus, "metric": metric, "baseline_ms": b, "current_ms": cur["median_ms"],
+                         "ratio": round(ratio, 3),
+                         "regressed": ratio > 1.0 + threshold and cur["median_ms"] - b > NOISE_FLOOR_MS})
+    return rows
+
+def print_table(record, rows=None, out=sys.stderr):
+    if rows is None:
+        for corpus, metrics in record["results"].items():
+            for metric, v in metrics.items():
+                if isinstance(v, dict) and "median_ms" in v:
+                    print(f"{corpus:>8} {metric:<16} {v['median_ms']:>10.1f} ms", file=out)
+        return
+    for r in rows:
+        flag = "  REGRESSION" if r["regressed"] else ""
+        print(f"{r['corpus']:>8} {r['metric']:<16} {r['baseline_ms']:>10.1f} -> {r['current_ms']:>10.1f} ms "
+              f"(x{r['ratio']:.2f}){flag}", file=out)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark model_1/model_2 on synthetic PDF corpora.")
+    parser.add_argument("model_dir", help="Directory containing local model folders.")
+    parser.add_argument("--sizes", default="3x4,10x4", help="Comma-separated <docs>x<pages> corpus sizes.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per measurement (median is compared).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch_size", type=int, default=128)
+    parser.add_argument("--work_dir", default=None, help="Where generated corpora are kept (default: a temp dir).")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON history file results are appended to.")
+    parser.add_argument("--label", default=None, help="Free-form note stored with the run.")
+    parser.add_argument("--no_save", action="store_true", help="Don't append this run to the history.")
+    parser.add_argument("--compare", action="store_true", help="Compare with the previous matching run; exit 1 on regression.")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown before a metric counts as regressed.")
+    args = parser.parse_args()
+
+    record = run(args.model_dir, parse_sizes(args.sizes), repeat=args.repeat, seed=args.seed,
+                 batch_size=args.batch_size, work_dir=args.work_dir, label=args.label)
+    runs = load_history(args.history)
+    baseline = find_baseline(runs, record) if args.compare else None
+    if not args.no_save:
+        save_history(args.history, runs + [record])
+
+    json.dump(record, sys.stdout, indent=2)
+    print()
+    if args.compare and baseline is None:
+        print("[bench] no earlier run with the same host and settings to compare against", file=sys.stderr)
+        print_table(record)
+    elif baseline is not None:
+        rows = compare(record, baseline, args.threshold)
+        print_table(record, rows)
+        if any(r["regressed"] for r in rows):
+            sys.exit(1)
+    else:
+        print_table(record)
@@ -0,0 +1,156 @@
+# python/bench/synth_pdf.py
+"""
+Synthetic PDF corpora for benchmarks, written with the standard library only.
+
+Every document is a run of sections on topics drawn from TOPICS: a heading
+(bold, larger font, optionally numbered "3.", "3.1") followed by body lines
+in a mix of font sizes, with optional running headers/footers ("Page 3 of 12",
+copyright lines) of the kind the extractors filter as junk. Generation is
+deterministic for a given seed, so timings stay comparable across runs.
+
+Each corpus also gets labels.json: one query per topic and the
+{document, title} of every section written on that topic, which the evaluation
+harness uses as relevance judgements.
+
+    python python/bench/synth_pdf.py out/corpus --docs 10 --pages 6
+"""
+import os, sys, json, random, argparse
+
+TOPICS = {
+    "solar": "solar panel photovoltaic irradiance inverter rooftop array module wattage sunlight mounting",
+    "battery": "battery lithium cell charge discharge capacity cycle storage voltage thermal",
+    "grid": "grid utility transmission substation frequency load demand tariff interconnection meter",
+    "safety": "safety hazard isolation fuse breaker grounding insulation protective fire emergency",
+    "cost": "cost price budget payback financing subsidy invoice savings investment maintenance",
+    "wind": "wind turbine blade rotor nacelle tower gearbox yaw airflow hub",
+    "hydrogen": "hydrogen electrolyzer fuel cell membrane compressor tank pressure purity catalyst",
+    "cooling": "cooling heat pump compressor refrigerant airflow duct thermostat condenser evaporator fan",
+}
+QUERIES = {
+    "solar": "sizing a rooftop photovoltaic array and choosing an inverter",
+    "battery": "lithium battery capacity and charge discharge cycles",
+    "grid": "utility grid interconnection tariffs and demand metering",
+    "safety": "electrical safety grounding fuses and fire hazards",
+    "cost": "project cost payback period and financing subsidies",
+    "wind": "wind turbine rotor blades and gearbox maintenance",
+    "hydrogen": "hydrogen electrolyzer and fuel cell membrane pressure",
+    "cooling": "heat pump refrigerant cooling and airflow",
+}
+FILLER = "the a of and to in for with this that is are be on by as system each when which".split()
+BOILERPLATE = ["Copyright 2024 Example Energy Ltd. All rights reserved.", "Version 2.1", "Internal use only"]
+
+# --------------------------
+# Minimal PDF writer (Type1 base fonts, one content stream per page)
+# --------------------------
+def _esc(t):
+    return t.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path, pages, page_h=792):
+    """`pages` is a list of [(font_size, bold, text)] lines laid out top to bottom."""
+    objs = []
+    def add(b): objs.append(b); return len(objs)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    fontb = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>")
+    pages_id = len(objs) + 1 + 2 * len(pages)
+    kids = []
+    for lines in pages:
+        ops, y = ["BT"], page_h - 20
+        for size, bold, text in lines:
+            y -= size * 1.5 + (8 if bold else 0)
+            ops.append(f"/{'F2' if bold else 'F1'} {size} Tf 1 0 0 1 50 {max(y, 10):.1f} Tm ({_esc(text)}) Tj")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        c = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 612 {page_h}] /Contents {c} 0 R "
+                        f"/Resources << /Font << /F1 {font} 0 R /F2 {fontb} 0 R >> >> >>".encode()))
+    add(f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode())
+    cat = add(f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode())
+    out, offs = bytearray(b"%PDF-1.4\n"), []
+    for i, o in enumerate(objs, 1):
+        offs.append(len(out)); out += f"{i} 0 obj\n".encode() + o + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offs)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root {cat} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+# --------------------------
+# Documents
+# --------------------------
+def _sentence(r, vocab, n=12):
+    return " ".join(r.choice(vocab) if r.random() < 0.55 else r.choice(FILLER) for _ in range(n))
+
+def make_document(path, pages=4, seed=0, headings_per_page=2, body_sizes=(10,), numbered=True,
+                  boilerplate=True, lines_per_page=40, topics=None):
+    """Write one PDF; returns [(section title, topic)] for the sections it contains."""
+    r = random.Random(seed)
+    topics = topics or list(TOPICS)
+    out_pages, sections, sec, sub = [], [], 0, 0
+    body_budget = max(1, lines_per_page // max(1, headings_per_page) - 1)
+    for p in range(1, pages + 1):
+        lines = []
+        if boilerplate:
+            lines.append((8, False, r.choice(BOILERPLATE)))
+        if p == 1:
+            lines.append((24, True, f"Technical Handbook {seed}"))  # taken as the document title
+            lines.append((10, False, "Reference notes for site planners and field engineers."))
+        for _ in range(headings_per_page):
+            topic = r.choice(topics)
+            vocab = TOPICS[topic].split()
+            words = " ".join(w.title() for w in r.sample(vocab, 3))
+            if numbered and sections and r.random() < 0.4:
+                sub += 1; label = f"{sec}.{sub} "
+            elif numbered:
+                sec += 1; sub = 0; label = f"{sec}. "
+            else:
+                label = ""
+            title = f"{label}{words}"
+            lines.append((r.choice((14, 16, 18)), True, title))
+            sections.append((title, topic))
+            for _ in range(body_budget):
+                lines.append((r.choice(body_sizes), False, _sentence(r, vocab)))
+        if boilerplate:
+            lines.append((8, False, f"Page {p} of {pages}"))
+        out_pages.append(lines)
+    write_pdf(path, out_pages)
+    return sections
+
+def make_corpus(out_dir, docs=5, pages=4, seed=0, persona="Energy consultant", **doc_kw):
+    """
+    <out_dir>/PDFs/doc_NNN.pdf, input.json (first topic's query) and labels.json.
+    Document i has `pages` + i % 3 pages so the page-count sort has work to do.
+    """
+    pdf_dir = os.path.join(out_dir, "PDFs")
+    os.makedirs(pdf_dir, exist_ok=True)
+    relevant = {t: [] for t in TOPICS}
+    for i in range(docs):
+        name = f"doc_{i:03d}.pdf"
+        for title, topic in make_document(os.path.join(pdf_dir, name), pages=pages + i % 3,
+                                          seed=seed * 1000 + i, **doc_kw):
+            relevant[topic].append({"document": name, "title": title})
+    labels = [{"id": t, "query": QUERIES[t], "relevant": rel} for t, rel in relevant.items() if rel]
+    with open(os.path.join(out_dir, "labels.json"), "w", encoding="utf-8") as f:
+        json.dump(labels, f, indent=2)
+    first = labels[0]["query"] if labels else ""
+    with open(os.path.join(out_dir, "input.json"), "w", encoding="utf-8") as f:
+        json.dump({"persona": {"role": persona}, "job_to_be_done": {"task": first},
+                   "selected_text": first}, f, indent=2)
+    return labels
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic PDF corpus.")
+    parser.add_argument("out_dir", help="Corpus directory (gets PDFs/, input.json, labels.json).")
+    parser.add_argument("--docs", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--headings_per_page", type=int, default=2)
+    parser.add_argument("--body_sizes", default="10", help="Comma-separated body font sizes, e.g. 9,10,11.")
+    parser.add_argument("--no_numbering", action="store_true")
+    parser.add_argument("--no_boilerplate", action="store_true")
+    args = parser.parse_args()
+    labels = make_corpus(args.out_dir, docs=args.docs, pages=args.pages, seed=args.seed,
+                         headings_per_page=args.headings_per_page,
+                         body_sizes=tuple(float(s) for s in args.body_sizes.split(",")),
+                         numbered=not args.no_numbering, boilerplate=not args.no_boilerplate)
+    print(f"Wrote {args.docs} PDFs and {len(labels)} labeled queries to {args.out_dir}", file=sys.stderr)
@@ -1,55 +1,36 @@
 # python/generate_podcast.py
-import sys, os, json, uuid, traceback, requests
+import sys, os, json, uuid, argparse, traceback
+from io import BytesIO
 from typing import List, Tuple
 from pydub import AudioSegment
 from pydub.generators import Sine
 from pydub.utils import which
 
+import llm_client
+import mp3frames
+import tts_client
+from text_reducer import reduce_for_llm
+
 # Make sure pydub finds ffmpeg
 AudioSegment.converter = which("ffmpeg") or "ffmpeg"
 
-# LLM (Gemini)
-LLM_PROVIDER = (os.environ.get("LLM_PROVIDER") or "gemini").lower()
-GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
-GOOGLE_APPLICATION_CREDENTIALS = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "")
-GOOGLE_CLOUD_PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT", "")
-GOOGLE_CLOUD_REGION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
-
-# Azure REST
-TTS_PROVIDER = (os.environ.get("TTS_PROVIDER") or "azure").lower()
-AZURE_TTS_KEY = os.environ.get("AZURE_TTS_KEY", "")
-AZURE_TTS_ENDPOINT = os.environ.get("AZURE_TTS_ENDPOINT", "")
-AZURE_REGION = os.environ.get("AZURE_REGION", "")
+HOST_VOICE = "en-IN-NeerjaNeural"
+GUEST_VOICE = "en-IN-PrabhatNeural"
+# pydub/ffmpeg export settings matching tts_client.TTS_OUTPUT_FORMAT, so fallback tones splice in frame by frame
+TTS_EXPORT_ARGS = {"format": "mp3", "bitrate": "192k", "parameters": ["-ar", "48000", "-ac", "1"]}
+TTS_FRAME_FORMAT = mp3frames.template(48000, 192, mono=True)
+LEAD_MS, GAP_MS = 400, 280
+AUDIO_DIR = os.path.join("public", "audio")
 
 def log(*a): print("[podcast]", *a, file=sys.stderr, flush=True)
 
-_model = None
-def _init_vertex():
-    global _model
-    if _model: return
-    if LLM_PROVIDER != "gemini": raise RuntimeError("LLM_PROVIDER must be 'gemini'")
-    if not GOOGLE_APPLICATION_CREDENTIALS: raise RuntimeError("GOOGLE_APPLICATION_CREDENTIALS not set")
-    from vertexai import init as vertex_init
-    from vertexai.generative_models import GenerativeModel
-    project = _read_project(GOOGLE_APPLICATION_CREDENTIALS) or GOOGLE_CLOUD_PROJECT or None
-    vertex_init(project=project, location=GOOGLE_CLOUD_REGION)
-    _model = GenerativeModel(GEMINI_MODEL)
-
-def _read_project(path:str)->str:
-    try:
-        with open(path,"r",encoding="utf-8") as f: j=json.load(f)
-        return j.get("project_id") or j.get("projectId") or ""
-    except: return ""
-
 def gen_dialog(seed:str)->List[Tuple[str,str]]:
-    _init_vertex()
-    from vertexai.generative_models import GenerationConfig
+    seed=reduce_for_llm(seed, label="podcast seed")
     prompt=f"""Write a ~8 line podcast conversation alternating Host: / Guest: based on:
 {seed}
 English only, no stage directions. Each line must start with Host: or Guest:"""
     log("Prompt len:", len(prompt))
-    r=_model.generate_content(prompt, generation_config=GenerationConfig(temperature=0.8))
-    text=getattr(r,"text",None) or str(r)
+    text=llm_client.generate_text(prompt, task="podcast", temperature=0.8)
     lines=[ln.strip() for ln in text.splitlines() if ln.strip()]
     out=[]
     for ln in lines:
@@ -58,54 +39,136 @@ English only, no stage directions. Each line must start with Host: or Guest:"""
     if not out: out=[("Host","Welcome."),("Guest","Thanks for having me.")]
     return out[:8]
 
-def azure_tts_mp3(voice:str, text:str)->bytes:
-    if TTS_PROVIDER!="azure": raise RuntimeError("TTS_PROVIDER must be 'azure'")
-    if not AZURE_TTS_KEY: raise RuntimeError("AZURE_TTS_KEY not set")
-    endpoint = AZURE_TTS_ENDPOINT or f"https://{AZURE_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
-    if not endpoint.startswith("https://"): raise RuntimeError(f"Bad AZURE_TTS_ENDPOINT: {endpoint}")
-    ssml = f"<speak version='1.0' xml:lang='en-IN'><voice name='{voice}'>{text}</voice></speak>"
-    h = {
-      "Ocp-Apim-Subscription-Key": AZURE_TTS_KEY,
-      "Content-Type": "application/ssml+xml",
-      "X-Microsoft-OutputFormat": "audio-48khz-192kbitrate-mono-mp3",
-      "User-Agent": "podcast-generator",
-    }
-    r = requests.post(endpoint, data=ssml.encode("utf-8"), headers=h, timeout=60)
-    if r.status_code!=200:
-        raise RuntimeError(f"Azure REST failed: {r.status_code} {r.text[:200]}")
-    return r.content
+def tone_mp3(sp:str)->bytes:
+    tone=Sine(440 if sp=="Host" else 330).to_audio_segment(duration=800)
+    buf=BytesIO(); tone.export(buf, **TTS_EXPORT_ARGS)
+    return buf.getvalue()
+
+def synth_dialog(convo:List[Tuple[str,str]])->List[bytes]:
+    """MP3 chunks for the dialog in order; a line whose TTS fails becomes a tone."""
+    lines=[(HOST_VOICE if sp=="Host" else GUEST_VOICE, txt) for sp,txt in convo]
+    return tts_client.synthesize_dialog(lines, fallback=lambda i: tone_mp3(convo[i][0]), pause_ms=GAP_MS)
+
+def assemble(mp3s:List[bytes])->bytes:
+    """
+    Lead-in, then each segment followed by a short pause. Same-format segments
+    are spliced at frame level; anything else is decoded from memory and re-encoded.
+    """
+    data=mp3frames.concat(mp3s, gap_ms=GAP_MS, lead_ms=LEAD_MS)
+    if data is not None: return data
+    log("Segments differ in format -> decode/re-encode")
+    out=AudioSegment.silent(LEAD_MS)
+    for b in mp3s: out += AudioSegment.from_file(BytesIO(b), format="mp3") + AudioSegment.silent(GAP_MS)
+    buf=BytesIO(); out.export(buf, **TTS_EXPORT_ARGS)
+    return buf.getvalue()
+
+# ---- Streaming output ----
+# While a stream is being written `<id>.live` exists next to it; when it is
+# complete `<id>.eos` is written (and `.live` removed). HLS playlists also
+# get #EXT-X-ENDLIST.
+def _stream_frames(chunk:bytes)->bytes:
+    """Audio frames of `chunk` in TTS_FRAME_FORMAT, re-encoding only if it isn't already."""
+    fs=mp3frames.frames(chunk)
+    if fs and all(f.format==TTS_FRAME_FORMAT.format for f in fs): return mp3frames.audio_bytes(chunk, fs)
+    buf=BytesIO(); AudioSegment.from_file(BytesIO(chunk), format="mp3").export(buf, **TTS_EXPORT_ARGS)
+    data=buf.getvalue()
+    return mp3frames.audio_bytes(data, mp3frames.frames(data))
+
+def _write_atomic(path:str, data):
+    tmp=path+".part"
+    with open(tmp,"wb" if isinstance(data,bytes) else "w") as f: f.write(data)
+    os.replace(tmp, path)
+
+class Mp3Stream:
+    """One growing MP3 file; each chunk is appended (plus a pause) as soon as it is ready."""
+    def __init__(self, sid:str):
+        self.sid=sid
+        self.path=os.path.join(AUDIO_DIR, f"{sid}.mp3")
+        self.url=f"/audio/{sid}.mp3"
+        open(os.path.join(AUDIO_DIR, f"{sid}.live"),"w").close()
+        self.f=open(self.path,"wb")
+        self._write(mp3frames.silence(TTS_FRAME_FORMAT, LEAD_MS))
+    def _write(self, data:bytes):
+        self.f.write(data); self.f.flush()
+    def add(self, n:int, chunk:bytes):
+        self._write(_stream_frames(chunk)+mp3frames.silence(TTS_FRAME_FORMAT, GAP_MS))
+        log(f"stream: chunk {n+1} appended")
+    def close(self):
+        self.f.close()
+        _write_atomic(os.path.join(AUDIO_DIR, f"{self.sid}.eos"), json.dumps({"url": self.url}))
+        try: os.remove(os.path.join(AUDIO_DIR, f"{self.sid}.live"))
+        except OSError: pass
+
+class HlsStream:
+    """HLS-style event playlist with one MP3 segment per chunk under public/audio/<id>/."""
+    TARGET_S=30
+    def __init__(self, sid:str):
+        self.sid=sid
+        self.dir=os.path.join(AUDIO_DIR, sid)
+        os.makedirs(self.dir, exist_ok=True)
+        self.url=f"/audio/{sid}/index.m3u8"
+        self.entries=[]
+        open(os.path.join(AUDIO_DIR, f"{sid}.live"),"w").close()
+        self._playlist(ended=False)
+    def _playlist(self, ended:bool):
+        lines=["#EXTM3U","#EXT-X-VERSION:3",f"#EXT-X-TARGETDURATION:{self.TARGET_S}",
+               "#EXT-X-MEDIA-SEQUENCE:0","#EXT-X-PLAYLIST-TYPE:EVENT"]
+        for name,dur in self.entries: lines+= [f"#EXTINF:{dur:.3f},", name]
+        if ended: lines.append("#EXT-X-ENDLIST")
+        _write_atomic(os.path.join(self.dir,"index.m3u8"), "\n".join(lines)+"\n")
+    def add(self, n:int, chunk:bytes):
+        lead=mp3frames.silence(TTS_FRAME_FORMAT, LEAD_MS) if n==0 else b""
+        data=lead+_stream_frames(chunk)+mp3frames.silence(TTS_FRAME_FORMAT, GAP_MS)
+        name=f"seg_{n:03d}.mp3"
+        _write_atomic(os.path.join(self.dir,name), data)
+        dur=mp3frames.duration_ms(mp3frames.frames(data))/1000.0
+        if dur>self.TARGET_S: log(f"stream: segment {name} is {dur:.1f}s, longer than target duration")
+        self.entries.append((name,dur))
+        self._playlist(ended=False)
+        log(f"stream: {name} published ({dur:.2f}s)")
+    def close(self):
+        self._playlist(ended=True)
+        _write_atomic(os.path.join(AUDIO_DIR, f"{self.sid}.eos"), json.dumps({"url": self.url}))
+        try: os.remove(os.path.join(AUDIO_DIR, f"{self.sid}.live"))
+        except OSError: pass
 
 def main():
     try:
         try:
             sys.stdout.reconfigure(encoding="utf-8"); sys.stderr.reconfigure(encoding="utf-8")  # type: ignore
         except: pass
+        ap=argparse.ArgumentParser(description="Generate a two-voice podcast MP3 from stdin text.")
+        ap.add_argument("--stream", choices=["mp3","hls"], default=os.environ.get("PODCAST_STREAM") or None,
+                        help="Publish audio progressively and print its path before synthesis finishes.")
+        args,_=ap.parse_known_args()
         seed=sys.stdin.read().strip()
         if not seed: raise RuntimeError("Empty text")
 
-        os.makedirs("public/audio", exist_ok=True)
+        os.makedirs(AUDIO_DIR, exist_ok=True)
         log("ffmpeg at:", AudioSegment.converter)
-        convo=gen_dialog(seed)
-        segs=[]
-        for i,(sp,txt) in enumerate(convo,1):
-            voice = "en-IN-NeerjaNeural" if sp=="Host" else "en-IN-PrabhatNeural"
+        if args.stream:
+            stream=(HlsStream if args.stream=="hls" else Mp3Stream)(uuid.uuid4().hex)
+            print(stream.url, flush=True)
             try:
-                log(f"TTS {i}/{len(convo)} voice={voice}")
-                mp3=azure_tts_mp3(voice, txt)
-                tmp=f"_seg_{uuid.uuid4().hex}.mp3"
-                open(tmp,"wb").write(mp3)
-                segs.append(AudioSegment.from_file(tmp, format="mp3"))
-            except Exception as e:
-                log("TTS error -> fallback tone:", e)
-                segs.append(Sine(440 if sp=="Host" else 330).to_audio_segment(duration=800))
-        out=AudioSegment.silent(400)
-        for s in segs: out += s + AudioSegment.silent(280)
+                convo=gen_dialog(seed)
+                lines=[(HOST_VOICE if sp=="Host" else GUEST_VOICE, txt) for sp,txt in convo]
+                # one line per request so playback can start after the first one
+                tts_client.synthesize_dialog(lines, fallback=lambda i: tone_mp3(convo[i][0]),
+                                             pause_ms=GAP_MS, pack=False, on_chunk=stream.add)
+            finally:
+                stream.close()
+            tts_client.prune_cache()
+            return
+
+        convo=gen_dialog(seed)
+        data=assemble(synth_dialog(convo))
 
         name=f"{uuid.uuid4().hex}.mp3"
-        path=os.path.join("public","audio",name)
+        path=os.path.join(AUDIO_DIR,name)
         log("Export:", path)
-        out.export(path, format="mp3")
+        _write_atomic(path, data)
         print(f"/audio/{name}")
+        tts_client.prune_cache()
     except Exception as e:
         log("FATAL:", e)
         traceback.print_exc(file=sys.stderr)
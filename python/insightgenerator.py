@@ -4,49 +4,18 @@ import json
 import re
 from typing import List, Dict, Any
 
-LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini").lower()
-GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
-GOOGLE_APPLICATION_CREDENTIALS = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "")
-GOOGLE_CLOUD_PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT", "")
-GOOGLE_CLOUD_REGION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
+import llm_client
+from text_reducer import reduce_for_llm, settings_key, LLM_INPUT_TOKEN_BUDGET
+from llm_cache import cached_call, lookup, store, make_key, log_stats
 
-if LLM_PROVIDER != "gemini":
-    print("Error: LLM_PROVIDER must be 'gemini' for insightgenerator.py", file=sys.stderr)
-    sys.exit(1)
+# Bump whenever the prompts below change so cached insights are not reused.
+INSIGHTS_PROMPT_VERSION = "insights-v1"
+INSIGHTS_BATCH_PROMPT_VERSION = "insights-batch-v1"
 
-if not GOOGLE_APPLICATION_CREDENTIALS:
-    print("Error: GOOGLE_APPLICATION_CREDENTIALS not set", file=sys.stderr)
-    sys.exit(1)
+# Rough input budget per batched prompt (tokens ~= chars / 4).
+INSIGHTS_BATCH_TOKEN_BUDGET = int(os.environ.get("INSIGHTS_BATCH_TOKEN_BUDGET", "6000"))
 
-# ---- Vertex init (lazy) ----
-_vertex_model = None
-
-def _read_project_from_sa(json_path: str) -> str:
-    try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data.get("project_id") or data.get("projectId") or ""
-    except Exception:
-        return ""
-
-def _init_vertex_if_needed():
-    global _vertex_model
-    if _vertex_model is not None:
-        return
-    try:
-        from vertexai import init as vertex_init
-        from vertexai.generative_models import GenerativeModel
-    except Exception as e:
-        print(f"Error: Vertex AI SDK not installed: {e}", file=sys.stderr)
-        sys.exit(1)
-
-    project = GOOGLE_CLOUD_PROJECT or _read_project_from_sa(GOOGLE_APPLICATION_CREDENTIALS)
-    if project:
-        vertex_init(project=project, location=GOOGLE_CLOUD_REGION)
-    else:
-        vertex_init(location=GOOGLE_CLOUD_REGION)
-
-    _vertex_model = GenerativeModel(GEMINI_MODEL)
+llm_client.require_config("insightgenerator.py")
 
 # ---- JSON helpers ----
 def _strip_code_fences(s: str) -> str:
@@ -83,10 +52,36 @@ def _parse_json_array(text: str) -> List[Dict[str, Any]]:
 
     return []
 
+def _parse_json_objects(text: str) -> List[Dict[str, Any]]:
+    """
+    Like _parse_json_array, but when the array as a whole is malformed
+    (truncated output, a stray comma) salvage every object that still decodes.
+    """
+    arr = _parse_json_array(text)
+    if arr:
+        return [x for x in arr if isinstance(x, dict)]
+
+    candidate = _strip_code_fences(text)
+    decoder = json.JSONDecoder()
+    out, i = [], candidate.find("{")
+    while i != -1:
+        try:
+            obj, end = decoder.raw_decode(candidate, i)
+        except ValueError:
+            i = candidate.find("{", i + 1)
+            continue
+        if isinstance(obj, dict):
+            out.append(obj)
+        i = candidate.find("{", end)
+    return out
+
 # ---- Core generation ----
-def generate_insights(text: str) -> List[Dict[str, Any]]:
-    _init_vertex_if_needed()
+def generate_insights(text: str, use_cache: bool = True) -> List[Dict[str, Any]]:
+    key = make_key(llm_client.model_id(), INSIGHTS_PROMPT_VERSION, settings_key(), text)
+    return cached_call(key, lambda: _generate_insights(reduce_for_llm(text, label="insights")),
+                       bypass=not use_cache)
 
+def _generate_insights(text: str) -> List[Dict[str, Any]]:
     prompt = f"""
 You are a highly intelligent AI assistant tasked with analyzing the text below. Generate concise and insightful facts in three distinct categories:
 
@@ -102,21 +97,7 @@ Text:
 """.strip()
 
     try:
-        resp = _vertex_model.generate_content(prompt)
-
-        # Prefer resp.text if present
-        out = None
-        if hasattr(resp, "text") and resp.text:
-            out = resp.text
-        else:
-            cands = getattr(resp, "candidates", None)
-            if cands:
-                content = getattr(cands[0], "content", None)
-                parts = getattr(content, "parts", None) if content else None
-                if parts and len(parts) > 0 and hasattr(parts[0], "text"):
-                    out = parts[0].text
-        if out is None:
-            out = str(resp)
+        out = llm_client.generate_text(prompt, task="insights")
 
         arr = _parse_json_array(out)
         # Ensure it's a list of dicts; else return []
@@ -127,6 +108,113 @@ Text:
         print(f"Error generating insights: {e}", file=sys.stderr)
         return []
 
+# ---- Batch generation ----
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def pack_selections(items: List[Dict[str, str]], budget: int = INSIGHTS_BATCH_TOKEN_BUDGET) -> List[List[Dict[str, str]]]:
+    """Greedily group selections (in order) so each group fits the token budget."""
+    packs, cur, used = [], [], 0
+    for it in items:
+        cost = _approx_tokens(it["text"]) + 16
+        if cur and used + cost > budget:
+            packs.append(cur)
+            cur, used = [], 0
+        cur.append(it)
+        used += cost
+    if cur:
+        packs.append(cur)
+    return packs
+
+def _batch_prompt(pack: List[Dict[str, str]]) -> str:
+    blocks = "\n\n".join(f"[[selection_id={it['id']}]]\n{it['text']}" for it in pack)
+    return f"""
+You are a highly intelligent AI assistant. Below are several independent text selections, each introduced by a [[selection_id=...]] marker. For EACH selection, generate concise and insightful facts in three distinct categories:
+
+1) "Did You Know": Interesting facts or trivia that are not obvious.
+2) "Contradiction": Points where the text presents conflicting statements or surprising contrasts.
+3) "Takeaway": A short summary of the selected text in bullet points, highlighting the most important points as a quick review.
+
+Return strictly ONE JSON array covering all selections, of objects with the following fields:
+selection_id (string, copied exactly from the marker), id (string), title (string), content (string), category (one of "Did You Know", "Contradiction", "Takeaway"), confidence (0-1 float).
+
+Selections:
+{blocks}
+""".strip()
+
+def _normalize_selections(payload: List[Any]) -> List[Dict[str, str]]:
+    items = []
+    for n, sel in enumerate(payload, 1):
+        if isinstance(sel, dict):
+            sid = str(sel.get("id") or n)
+            text = str(sel.get("text") or "")
+        else:
+            sid, text = str(n), str(sel or "")
+        items.append({"id": sid, "text": text})
+    return items
+
+def generate_insights_batch(selections: List[Any], use_cache: bool = True,
+                            budget: int = INSIGHTS_BATCH_TOKEN_BUDGET) -> List[Dict[str, Any]]:
+    """
+    Insights for many selections with as few LLM calls as the budget allows.
+    Returns one record per selection, in input order:
+    {"id", "facts": [...]} plus "error" when nothing usable came back.
+    """
+    items = _normalize_selections(selections)
+    model = llm_client.model_id()
+    results: Dict[str, List[Dict[str, Any]]] = {}
+
+    # Cached selections never reach the model
+    todo = []
+    for it in items:
+        if not it["text"].strip():
+            results[it["id"]] = []
+            continue
+        key = make_key(model, INSIGHTS_BATCH_PROMPT_VERSION, settings_key(), it["text"])
+        hit = lookup(key, bypass=not use_cache)
+        if hit:
+            results[it["id"]] = hit
+        else:
+            todo.append(it)
+
+    # Long selections are cut down before packing; cache keys stay on the original text
+    reduced = [{"id": it["id"], "text": reduce_for_llm(it["text"], min(budget, LLM_INPUT_TOKEN_BUDGET),
+                                                        label=f"selection {it['id']}")} for it in todo]
+    original = {it["id"]: it["text"] for it in todo}
+
+    packs = pack_selections(reduced, budget)
+    outputs = llm_client.generate_many([_batch_prompt(p) for p in packs], task="insights_batch")
+    for pack, out in zip(packs, outputs):
+        if isinstance(out, Exception):
+            print(f"Error generating batch insights: {out}", file=sys.stderr)
+            continue
+        wanted = {it["id"] for it in pack}
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for obj in _parse_json_objects(out):
+            sid = str(obj.pop("selection_id", ""))
+            if sid in wanted:
+                grouped.setdefault(sid, []).append(obj)
+        for it in pack:
+            facts = grouped.get(it["id"])
+            if facts:
+                results[it["id"]] = facts
+                store(make_key(model, INSIGHTS_BATCH_PROMPT_VERSION, settings_key(), original[it["id"]]), facts,
+                      bypass=not use_cache)
+
+    # A selection the batched answer lost gets one single-prompt retry
+    for it in todo:
+        if it["id"] not in results:
+            results[it["id"]] = generate_insights(it["text"], use_cache=use_cache)
+
+    records = []
+    for it in items:
+        facts = results.get(it["id"]) or []
+        rec: Dict[str, Any] = {"id": it["id"], "facts": facts}
+        if not facts and it["text"].strip():
+            rec["error"] = "no insights parsed for this selection"
+        records.append(rec)
+    return records
+
 # ---- CLI entrypoint ----
 if __name__ == "__main__":
     try:
@@ -136,9 +224,17 @@ if __name__ == "__main__":
         except Exception:
             pass
 
+        use_cache = "--no-cache" not in sys.argv[1:]
         input_text = sys.stdin.read()
-        facts = generate_insights(input_text or "")
-        print(json.dumps(facts, ensure_ascii=False))
+        if "--batch" in sys.argv[1:]:
+            selections = json.loads(input_text or "[]")
+            if not isinstance(selections, list):
+                raise ValueError("--batch expects a JSON array of selections")
+            print(json.dumps(generate_insights_batch(selections, use_cache=use_cache), ensure_ascii=False))
+        else:
+            facts = generate_insights(input_text or "", use_cache=use_cache)
+            print(json.dumps(facts, ensure_ascii=False))
+        log_stats()
     except Exception as e:
         # Always print a JSON array so the Node route can parse it
         print(json.dumps([]))
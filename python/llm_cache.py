@@ -0,0 +1,195 @@
+import sys
+import os
+import json
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Any, Callable, Dict, Optional
+
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", os.path.join(".cache", "llm"))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_MB = float(os.environ.get("LLM_CACHE_MAX_MB", "64"))
+LLM_CACHE_BYPASS = os.environ.get("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+# ---- Key helpers ----
+def normalize_input(text: str) -> str:
+    """Canonical form of an LLM input: NFC, collapsed whitespace, trimmed."""
+    t = unicodedata.normalize("NFC", text or "")
+    return re.sub(r"\s+", " ", t).strip()
+
+def make_key(model: str, template_version: str, *inputs: str) -> str:
+    h = hashlib.sha256()
+    h.update(f"{model}\x1f{template_version}".encode("utf-8"))
+    for part in inputs:
+        h.update(b"\x1e")
+        h.update(normalize_input(part).encode("utf-8"))
+    return h.hexdigest()
+
+# ---- Persistent store ----
+class ResponseCache:
+    """
+    SQLite-backed response cache keyed by (model, prompt version, input hash).
+    Entries expire after `ttl` seconds; once the store grows past `max_bytes`
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = LLM_CACHE_TTL,
+                 max_bytes: int = int(LLM_CACHE_MAX_MB * 1024 * 1024)):
+        self.path = path or os.path.join(LLM_CACHE_DIR, "responses.sqlite3")
+        self.ttl = float(ttl)
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        row = self._db.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl > 0 and now - row[1] > self.ttl):
+            if row is not None:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count("misses")
+            return None
+        self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode("utf-8")), now, now),
+            )
+            self.evict()
+
+    def evict(self) -> None:
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.ttl > 0:
+            self._db.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM entries ORDER BY accessed ASC").fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def _count(self, name: str) -> None:
+        setattr(self, name, getattr(self, name) + 1)
+        try:
+            self._db.execute(
+                "INSERT INTO counters (name, value) VALUES (?, 1)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (name,),
+            )
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._stats()
+
+    def _stats(self) -> Dict[str, Any]:
+        totals = dict(self._db.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self) -> None:
+        try:
+            self._db.close()
+        except Exception:
+            pass
+
+# ---- Process-wide instance ----
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> Optional[ResponseCache]:
+    """Shared cache for this process; None if the store can't be opened."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ResponseCache()
+            except Exception as e:
+                print(f"[llm-cache] disabled: {e}", file=sys.stderr)
+                return None
+    return _cache
+
+def lookup(key: str, bypass: bool = False) -> Optional[Any]:
+    cache = None if (bypass or LLM_CACHE_BYPASS) else get_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.get(key)
+    except sqlite3.Error as e:
+        print(f"[llm-cache] read failed: {e}", file=sys.stderr)
+        return None
+
+def store(key: str, value: Any, bypass: bool = False) -> None:
+    cache = None if (bypass or LLM_CACHE_BYPASS) else get_cache()
+    if cache is None:
+        return
+    try:
+        cache.put(key, value)
+    except sqlite3.Error as e:
+        print(f"[llm-cache] write failed: {e}", file=sys.stderr)
+
+def cached_call(key: str, produce: Callable[[], Any], bypass: bool = False,
+                should_store: Callable[[Any], bool] = bool) -> Any:
+    """
+    Return the cached value for `key`, or call `produce()` and store its result.
+    With `bypass` (or LLM_CACHE_BYPASS=1) the cache is neither read nor written.
+    Results rejected by `should_store` (empty by default) are not cached.
+    """
+    hit = lookup(key, bypass)
+    if hit is not None:
+        return hit
+    value = produce()
+    if should_store(value):
+        store(key, value, bypass)
+    return value
+
+def log_stats() -> None:
+    if _cache is None:
+        return
+    try:
+        s = _cache.stats()
+        print(f"[llm-cache] hits={s['hits']} misses={s['misses']} "
+              f"entries={s['entries']} bytes={s['bytes']}", file=sys.stderr)
+    except sqlite3.Error:
+        pass
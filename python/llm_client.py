@@ -0,0 +1,366 @@
+import sys
+import os
+import json
+import re
+import time
+import random
+import hashlib
+import atexit
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini").lower()
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+GOOGLE_APPLICATION_CREDENTIALS = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "")
+GOOGLE_CLOUD_PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT", "")
+GOOGLE_CLOUD_REGION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
+
+# Per-call deadline, retry policy and process-wide concurrency cap.
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "60"))
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "8"))
+LLM_MAX_INFLIGHT = max(1, int(os.environ.get("LLM_MAX_INFLIGHT", "4")))
+LLM_CLIENT_STATS = os.environ.get("LLM_CLIENT_STATS", "").lower() in ("1", "true", "yes")
+
+# Stub provider knobs (LLM_PROVIDER=stub), for offline runs and benchmarks.
+LLM_STUB_LATENCY_MS = float(os.environ.get("LLM_STUB_LATENCY_MS", "0"))
+
+# Vertex REST endpoint for LLM_PROVIDER=vertex_http (e.g. python/stubs/vertex_server.py).
+LLM_HTTP_ENDPOINT = os.environ.get("LLM_HTTP_ENDPOINT", "").rstrip("/")
+LLM_HTTP_TOKEN = os.environ.get("LLM_HTTP_TOKEN", "")
+
+class LLMError(RuntimeError):
+    pass
+
+class LLMTimeout(LLMError):
+    pass
+
+# HTTP statuses from vertex_http, named like the SDK's exceptions so the retry policy treats them alike
+class TooManyRequests(LLMError):
+    pass
+
+class InternalServerError(LLMError):
+    pass
+
+class ServiceUnavailable(LLMError):
+    pass
+
+class GatewayTimeout(LLMError):
+    pass
+
+_HTTP_ERRORS = {429: TooManyRequests, 500: InternalServerError, 503: ServiceUnavailable, 504: GatewayTimeout}
+
+# ---- Helpers ----
+def _read_project_from_sa(json_path: str) -> str:
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("project_id") or data.get("projectId") or ""
+    except Exception:
+        return ""
+
+def response_text(resp: Any) -> str:
+    """Text of a Vertex response: `resp.text` when set, else the first candidate part."""
+    try:
+        if hasattr(resp, "text") and resp.text:
+            return resp.text
+    except Exception:
+        # .text raises when the response has no text part (e.g. blocked)
+        pass
+    cands = getattr(resp, "candidates", None)
+    if cands:
+        content = getattr(cands[0], "content", None)
+        parts = getattr(content, "parts", None) if content else None
+        if parts and len(parts) > 0 and hasattr(parts[0], "text"):
+            return parts[0].text
+    return str(resp)
+
+# ---- Providers ----
+class VertexProvider:
+    """Gemini on Vertex AI. One GenerativeModel (and its transport) per process."""
+
+    def __init__(self, model_name: str = GEMINI_MODEL):
+        if not GOOGLE_APPLICATION_CREDENTIALS:
+            raise LLMError("GOOGLE_APPLICATION_CREDENTIALS not set")
+        try:
+            from vertexai import init as vertex_init
+            from vertexai.generative_models import GenerativeModel
+        except Exception as e:
+            raise LLMError(f"Vertex AI SDK not installed: {e}")
+
+        project = GOOGLE_CLOUD_PROJECT or _read_project_from_sa(GOOGLE_APPLICATION_CREDENTIALS)
+        if project:
+            vertex_init(project=project, location=GOOGLE_CLOUD_REGION)
+        else:
+            vertex_init(location=GOOGLE_CLOUD_REGION)
+        self.model_name = model_name
+        self._model = GenerativeModel(model_name)
+
+    def generate(self, prompt: str, task: str = "generic", temperature: Optional[float] = None) -> str:
+        kwargs = {}
+        if temperature is not None:
+            from vertexai.generative_models import GenerationConfig
+            kwargs["generation_config"] = GenerationConfig(temperature=temperature)
+        return response_text(self._model.generate_content(prompt, **kwargs))
+
+class StubProvider:
+    """
+    Local stand-in that never leaves the process. Answers are deterministic per
+    prompt and shaped like what each caller (`task`) expects to parse.
+    """
+
+    def __init__(self, model_name: str = "stub"):
+        self.model_name = model_name
+        self.latency_s = LLM_STUB_LATENCY_MS / 1000.0
+
+    def generate(self, prompt: str, task: str = "generic", temperature: Optional[float] = None) -> str:
+        if self.latency_s > 0:
+            time.sleep(self.latency_s)
+        return stub_response(prompt, task)
+
+def stub_response(prompt: str, task: str = "generic") -> str:
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+    words = prompt.split()
+    gist = " ".join(words[-12:]) if words else "the document"
+    if task == "insights":
+        return json.dumps([
+            {"id": f"{digest}-{i}", "title": cat, "content": f"Stub {cat.lower()} about {gist}.",
+             "category": cat, "confidence": 0.5}
+            for i, cat in enumerate(["Did You Know", "Contradiction", "Takeaway"], 1)
+        ])
+    if task == "insights_batch":
+        ids = re.findall(r"\[\[selection_id=(.*?)\]\]", prompt)
+        return json.dumps([
+            {"selection_id": sid, "id": f"{digest}-{sid}-{i}", "title": cat,
+             "content": f"Stub {cat.lower()} for selection {sid}.", "category": cat, "confidence": 0.5}
+            for sid in ids
+            for i, cat in enumerate(["Did You Know", "Contradiction", "Takeaway"], 1)
+        ])
+    if task == "chat":
+        return json.dumps({"answer": f"Stub answer ({digest}) about {gist}."})
+    if task == "podcast":
+        return "\n".join(
+            f"{'Host' if i % 2 == 0 else 'Guest'}: Stub line {i + 1} about {gist}." for i in range(8)
+        )
+    if task == "summary":
+        return f"Overview\nStub summary ({digest}) of {gist}."
+    return f"Stub response ({digest})."
+
+class VertexHTTPProvider:
+    """
+    generateContent over plain REST with one keep-alive session per thread.
+    Meant for local stand-ins of Vertex (load tests); sends the caller's task
+    as X-Stub-Task so a stub can shape its answer.
+    """
+
+    def __init__(self, model_name: str = GEMINI_MODEL):
+        if not LLM_HTTP_ENDPOINT:
+            raise LLMError("LLM_HTTP_ENDPOINT not set")
+        project = GOOGLE_CLOUD_PROJECT or "local"
+        self.model_name = model_name
+        self.url = (f"{LLM_HTTP_ENDPOINT}/v1/projects/{project}/locations/{GOOGLE_CLOUD_REGION}"
+                    f"/publishers/google/models/{model_name}:generateContent")
+        self._local = threading.local()
+
+    def _session(self):
+        if getattr(self._local, "session", None) is None:
+            import requests
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def generate(self, prompt: str, task: str = "generic", temperature: Optional[float] = None) -> str:
+        body: Dict[str, Any] = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if temperature is not None:
+            body["generationConfig"] = {"temperature": temperature}
+        headers = {"X-Stub-Task": task}
+        if LLM_HTTP_TOKEN:
+            headers["Authorization"] = f"Bearer {LLM_HTTP_TOKEN}"
+        resp = self._session().post(self.url, json=body, headers=headers, timeout=LLM_TIMEOUT or None)
+        if resp.status_code != 200:
+            raise _HTTP_ERRORS.get(resp.status_code, LLMError)(f"HTTP {resp.status_code}: {resp.text[:200]}")
+        try:
+            return resp.json()["candidates"][0]["content"]["parts"][0]["text"]
+        except (ValueError, KeyError, IndexError) as e:
+            raise LLMError(f"Malformed generateContent response: {e}")
+
+_PROVIDERS: Dict[str, Callable[[str], Any]] = {
+    "gemini": VertexProvider,
+    "stub": StubProvider,
+    "vertex_http": VertexHTTPProvider,
+}
+
+def register_provider(name: str, factory: Callable[[str], Any]) -> None:
+    """Make `factory(model_name)` selectable via LLM_PROVIDER=<name>."""
+    _PROVIDERS[name.lower()] = factory
+
+def require_config(script: str) -> None:
+    """Exit early (as the scripts always have) when the provider can't work."""
+    if LLM_PROVIDER not in _PROVIDERS:
+        print(f"Error: LLM_PROVIDER must be one of {sorted(_PROVIDERS)} for {script}", file=sys.stderr)
+        sys.exit(1)
+    if LLM_PROVIDER == "gemini" and not GOOGLE_APPLICATION_CREDENTIALS:
+        print("Error: GOOGLE_APPLICATION_CREDENTIALS not set", file=sys.stderr)
+        sys.exit(1)
+    if LLM_PROVIDER == "vertex_http" and not LLM_HTTP_ENDPOINT:
+        print("Error: LLM_HTTP_ENDPOINT not set", file=sys.stderr)
+        sys.exit(1)
+
+def model_id() -> str:
+    """Identity of the backing model; used in cache keys so providers never mix."""
+    return GEMINI_MODEL if LLM_PROVIDER == "gemini" else f"{LLM_PROVIDER}:{GEMINI_MODEL}"
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                factory = _PROVIDERS.get(LLM_PROVIDER)
+                if factory is None:
+                    raise LLMError(f"Unknown LLM_PROVIDER: {LLM_PROVIDER}")
+                _provider = factory(GEMINI_MODEL)
+    return _provider
+
+# ---- Latency histograms ----
+_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, float("inf"))
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, Any]] = {}
+
+def _record(task: str, outcome: str, elapsed_ms: float) -> None:
+    with _stats_lock:
+        s = _stats.setdefault(task, {"calls": 0, "ok": 0, "errors": 0, "timeouts": 0, "retries": 0,
+                                     "total_ms": 0.0, "buckets": [0] * len(_BUCKETS_MS)})
+        if outcome == "retry":
+            s["retries"] += 1
+            return
+        s["calls"] += 1
+        s[outcome] += 1
+        s["total_ms"] += elapsed_ms
+        for i, edge in enumerate(_BUCKETS_MS):
+            if elapsed_ms <= edge:
+                s["buckets"][i] += 1
+                break
+
+def stats() -> Dict[str, Any]:
+    """Per-task call counts plus latency histogram ({"<=edge_ms": count})."""
+    with _stats_lock:
+        out = {}
+        for task, s in _stats.items():
+            hist = {("+inf" if edge == float("inf") else f"<={int(edge)}ms"): n
+                    for edge, n in zip(_BUCKETS_MS, s["buckets"]) if n}
+            out[task] = {k: v for k, v in s.items() if k != "buckets"}
+            out[task]["total_ms"] = round(s["total_ms"], 1)
+            out[task]["mean_ms"] = round(s["total_ms"] / s["calls"], 1) if s["calls"] else 0.0
+            out[task]["histogram"] = hist
+        return out
+
+def log_stats() -> None:
+    if _stats:
+        print(f"[llm] {json.dumps(stats())}", file=sys.stderr)
+
+if LLM_CLIENT_STATS:
+    atexit.register(log_stats)
+
+# ---- Calls ----
+_inflight = threading.BoundedSemaphore(LLM_MAX_INFLIGHT)
+
+_RETRYABLE = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "Aborted", "GatewayTimeout", "ConnectionError", "Timeout",
+}
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (LLMTimeout, ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in _RETRYABLE for cls in type(exc).__mro__)
+
+def _call_with_deadline(fn: Callable[[], str], timeout: float,
+                        on_done: Callable[[], None] = lambda: None) -> str:
+    """
+    Run `fn` on a daemon thread and stop waiting after `timeout` seconds.
+    The SDK call can't be interrupted, so a timed-out thread is abandoned
+    rather than joined; being a daemon it never blocks interpreter exit.
+    `on_done` runs on that thread once `fn` really returns or raises.
+    """
+    box: Dict[str, Any] = {}
+
+    def run():
+        try:
+            box["value"] = fn()
+        except BaseException as e:
+            box["error"] = e
+        finally:
+            on_done()
+
+    t = threading.Thread(target=run, name="llm-call", daemon=True)
+    try:
+        t.start()
+    except BaseException:
+        on_done()
+        raise
+    t.join(timeout if timeout > 0 else None)
+    if t.is_alive():
+        raise LLMTimeout(f"LLM call exceeded {timeout:.1f}s")
+    if "error" in box:
+        raise box["error"]
+    return box["value"]
+
+def generate_text(prompt: str, task: str = "generic", temperature: Optional[float] = None,
+                  timeout: Optional[float] = None, retries: Optional[int] = None) -> str:
+    """
+    Generate text with the configured provider. Each attempt gets `timeout`
+    seconds; retryable failures back off with full jitter. At most
+    LLM_MAX_INFLIGHT calls run at once across all threads of the process;
+    an attempt that timed out keeps its slot until the abandoned call ends,
+    and an attempt that can't get a slot within `timeout` fails as a timeout.
+    """
+    timeout = LLM_TIMEOUT if timeout is None else float(timeout)
+    retries = LLM_RETRIES if retries is None else int(retries)
+    provider = get_provider()
+
+    attempt = 0
+    while True:
+        start = time.perf_counter()
+        try:
+            # waiting for a slot (held by calls that may have hung) counts as a retryable timeout
+            if not _inflight.acquire(timeout=timeout if timeout > 0 else None):
+                raise LLMTimeout(f"no free LLM slot within {timeout:.1f}s ({LLM_MAX_INFLIGHT} calls in flight)")
+            start = time.perf_counter()  # the call's own deadline starts once it has a slot
+            out = _call_with_deadline(lambda: provider.generate(prompt, task=task, temperature=temperature),
+                                      timeout, on_done=_inflight.release)
+            _record(task, "ok", (time.perf_counter() - start) * 1000.0)
+            return out
+        except Exception as e:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            if attempt >= retries or not _is_retryable(e):
+                _record(task, "timeouts" if isinstance(e, LLMTimeout) else "errors", elapsed_ms)
+                if isinstance(e, LLMError):
+                    raise
+                raise LLMError(f"{type(e).__name__}: {e}") from e
+            _record(task, "retry", elapsed_ms)
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+            print(f"[llm] {task}: {type(e).__name__}, retry {attempt + 1}/{retries} in {delay:.2f}s",
+                  file=sys.stderr)
+            time.sleep(delay)
+            attempt += 1
+
+def generate_many(prompts: List[str], task: str = "generic", **kwargs) -> List[Any]:
+    """
+    Run several prompts concurrently (bounded by the in-flight semaphore).
+    Returns results in order; a failed prompt yields its exception instead.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def one(p):
+        try:
+            return generate_text(p, task=task, **kwargs)
+        except Exception as e:
+            return e
+
+    if len(prompts) <= 1:
+        return [one(p) for p in prompts]
+    with ThreadPoolExecutor(max_workers=min(LLM_MAX_INFLIGHT, len(prompts))) as ex:
+        return list(ex.map(one, prompts))
@@ -0,0 +1,437 @@
+# python/model_2/batch_tuner.py
+"""
+Per-host batch sizes for the bi-encoder and cross-encoder.
+
+The right batch size depends on the CPU, the thread count, the model backend
+(prepared TorchScript or raw sentence-transformers, fp32 or int8) and how long
+the inputs are, so it is measured rather than fixed: for each model and each
+sequence-length bucket the tuner times encoding at growing batch sizes and
+keeps the fastest (items per second). The result is a profile under
+MODEL2_TUNING_DIR named after the host signature (CPU model, usable CPUs,
+torch series, intra-op threads); a different instance type gets its own
+profile, and so does a run whose CPU share differs from the one measured.
+
+At run time `batch_size_for` estimates the inputs' token length (p90, since
+batches pad to their longest item), looks the bucket up in the profile, and
+shrinks the batch while its estimated activation memory would take more than
+MEMORY_FRACTION of the memory still available (MemAvailable, or the cgroup
+limit minus usage if tighter). `with_backoff` halves the batch and retries if
+an encode still runs out of memory.
+
+    python python/model_2/batch_tuner.py python/model_2/models            # tune (or re-tune) this host
+    python python/model_2/batch_tuner.py python/model_2/models --show     # print the profile in use
+
+Runs with an automatic batch size and no profile for their model start a
+quick tune in the background (once per host and thread count, measured with
+the run's thread count; MODEL2_AUTOTUNE=0 disables it). The tuner takes no
+thread-budget slot, so it doesn't shrink the share of the runs it waits for.
+It waits to measure while any model_2 run is encoding (they hold a shared lock
+on encoding.lock under MODEL2_TUNING_DIR), so real work neither slows down
+nor skews the rates, and running processes pick the profile up as soon as it
+is written.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import contextlib
+import subprocess
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: tunes don't wait for encodes to finish
+    fcntl = None
+
+PROFILE_VERSION = 1
+TUNING_DIR = os.getenv("MODEL2_TUNING_DIR", os.path.join(".cache", "model2", "tuning"))
+AUTOTUNE = os.getenv("MODEL2_AUTOTUNE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+BUCKETS = (32, 64, 128, 256, 512)          # estimated tokens per input
+BATCH_SIZES = (8, 16, 32, 64, 128, 256)
+QUICK_BUCKETS = (32, 128, 512)
+QUICK_BATCH_SIZES = (8, 16, 32, 64, 128)
+DEFAULTS = {"bi_encoder": 128, "cross_encoder": 64}
+MIN_BATCH = 4
+MEMORY_FRACTION = 0.25
+CHARS_PER_TOKEN = 4.0
+# fallback shape (bge-small / MiniLM) for the memory estimate when the profile has none
+DEFAULT_DIMS = {"hidden": 384, "heads": 12}
+RETUNE_HOLDOFF_S = 3600   # after a background tune starts, finishes or fails
+IDLE_POLL_S = 0.5
+
+# --------------------------
+# Host signature and profile file
+# --------------------------
+def _cpu_model():
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+def run_threads():
+    """Intra-op threads this process encodes with (before torch is set up, what a lone run would get)."""
+    import thread_budget
+    budget = thread_budget.current()
+    if budget is not None:
+        return budget.threads
+    return thread_budget.fixed_threads() or thread_budget.usable_cpus()[0]
+
+def host_signature(torch_version=None, threads=None):
+    import thread_budget
+    cpus, _ = thread_budget.usable_cpus()
+    if torch_version is None:
+        import torch
+        torch_version = torch.__version__
+    return {"cpu": _cpu_model(), "usable_cpus": cpus, "torch": ".".join(torch_version.split("+")[0].split(".")[:2]),
+            "threads": threads or run_threads()}
+
+def profile_path(signature, tuning_dir=None):
+    digest = hashlib.sha1(json.dumps(signature, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(tuning_dir or TUNING_DIR, f"{digest}.json")
+
+def load_profile(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            prof = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return prof if prof.get("version") == PROFILE_VERSION else None
+
+def save_profile(path, profile):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+_profile_paths = {}            # thread count -> profile path
+_profile = (None, None, None)  # (path, mtime read, profile)
+
+def current_profile():
+    """
+    The profile for this host at this process's current thread count (None until
+    one exists); re-read whenever the file changes, e.g. after a background tune.
+    """
+    global _profile
+    threads = run_threads()
+    if threads not in _profile_paths:
+        _profile_paths[threads] = profile_path(host_signature(threads=threads))
+    path = _profile_paths[threads]
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if (path, mtime) != _profile[:2]:
+        _profile = (path, mtime, load_profile(path) if mtime is not None else None)
+    return _profile[2]
+
+def model_key(kind, model):
+    """e.g. 'bi_encoder.prepared.fp32'; the loaders tag models with `model2_variant`."""
+    return f"{kind}.{getattr(model, 'model2_variant', 'raw.fp32')}"
+
+# --------------------------
+# Memory headroom
+# --------------------------
+def _read_int(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            v = f.read().strip()
+        return None if v == "max" else int(v)
+    except (OSError, ValueError):
+        return None
+
+_mem_cache = (0.0, None)
+
+def available_memory_bytes():
+    """Smaller of MemAvailable and the cgroup limit minus usage; re-read at most twice a second."""
+    global _mem_cache
+    now = time.monotonic()
+    if now - _mem_cache[0] < 0.5:
+        return _mem_cache[1]
+    avail = None
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    avail = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        pass
+    for limit_p, usage_p in (("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+                             ("/sys/fs/cgroup/memory/memory.limit_in_bytes",
+                              "/sys/fs/cgroup/memory/memory.usage_in_bytes")):
+        limit, usage = _read_int(limit_p), _read_int(usage_p)
+        if limit and usage is not None and limit < (1 << 60):
+            room = max(0, limit - usage)
+            avail = room if avail is None else min(avail, room)
+            break
+    _mem_cache = (now, avail)
+    return avail
+
+def activation_bytes(batch, tokens, dims):
+    """Rough float32 working set of one forward pass: hidden states plus attention scores."""
+    return batch * (tokens * dims["hidden"] * 4 * 16 + tokens * tokens * dims["heads"] * 4 * 2)
+
+# --------------------------
+# Choosing a batch size
+# --------------------------
+def estimate_tokens(items):
+    """p90 of the inputs' estimated token counts (pairs count both sides), capped at the last bucket."""
+    if not items:
+        return BUCKETS[0]
+    lens = [sum(len(s) for s in x) if isinstance(x, (tuple, list)) else len(x) for x in items]
+    p90 = float(np.percentile(lens, 90)) / CHARS_PER_TOKEN + 2
+    return int(min(p90, BUCKETS[-1]))
+
+def bucket_for(tokens, buckets):
+    for b in sorted(buckets):
+        if tokens <= b:
+            return b
+    return max(buckets)
+
+def _profile_batch(entry, tokens):
+    if not entry or not entry.get("buckets"):
+        return None
+    buckets = {int(k): v for k, v in entry["buckets"].items()}
+    return int(buckets[bucket_for(tokens, buckets)]["best"])
+
+_ceilings = {}  # model key -> largest batch that has not run out of memory in this process
+
+def batch_size_for(kind, model, items, requested=None):
+    """
+    `requested` (an explicit --batch_size) wins over the profile; either way the
+    batch is shrunk to fit the memory available right now.
+    """
+    key = model_key(kind, model)
+    tokens = estimate_tokens(items)
+    prof = current_profile()
+    entry = (prof or {}).get("models", {}).get(key)
+    bs = requested or _profile_batch(entry, tokens) or DEFAULTS[kind]
+    bs = min(bs, _ceilings.get(key, bs), max(1, len(items)))
+    avail = available_memory_bytes()
+    if avail is not None:
+        dims = (entry or {}).get("dims", DEFAULT_DIMS)
+        while bs > MIN_BATCH and activation_bytes(bs, tokens, dims) > MEMORY_FRACTION * avail:
+            bs //= 2
+    return max(1, bs)
+
+def _lock_fd():
+    path = os.path.join(TUNING_DIR, "encoding.lock")
+    try:
+        os.makedirs(TUNING_DIR, exist_ok=True)
+        return os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    except OSError:
+        return None
+
+@contextlib.contextmanager
+def encoding():
+    """Held around a run's encodes; a background tune doesn't measure while any run holds it."""
+    fd = _lock_fd() if fcntl is not None else None
+    if fd is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except OSError:  # a tune is timing a batch right now; never make real work wait for it
+            os.close(fd)
+            fd = None
+    try:
+        yield
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+@contextlib.contextmanager
+def _idle_host():
+    """Wait until no model_2 run is encoding; the exclusive lock is held while measuring."""
+    fd = _lock_fd() if fcntl is not None else None
+    if fd is not None:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                time.sleep(IDLE_POLL_S)
+    try:
+        yield
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+def _is_oom(e):
+    return isinstance(e, MemoryError) or (isinstance(e, RuntimeError) and "memory" in str(e).lower())
+
+def with_backoff(kind, model, fn, batch_size):
+    """fn(batch_size), halving the batch after an out-of-memory error; the lower ceiling is kept."""
+    key = model_key(kind, model)
+    while True:
+        try:
+            return fn(batch_size)
+        except (MemoryError, RuntimeError) as e:
+            if not _is_oom(e) or batch_size <= 1:
+                raise
+            batch_size = max(1, batch_size // 2)
+            _ceilings[key] = batch_size
+            print(f"[model2] {kind} ran out of memory; retrying with batch size {batch_size}", file=sys.stderr)
+
+# --------------------------
+# Measuring
+# --------------------------
+_VOCAB = ("energy storage system battery inverter panel module array design safety voltage current "
+          "charge capacity cost budget grid tariff cooling airflow maintenance schedule review report").split()
+
+def _texts(tokens, n, seed=0):
+    r = np.random.default_rng(seed)
+    words = max(1, tokens - 2)  # these words are one token each; [CLS] and [SEP] make up the rest
+    return [" ".join(r.choice(_VOCAB, size=words)) for _ in range(n)]
+
+def _inputs(kind, tokens, n):
+    if kind == "bi_encoder":
+        return _texts(tokens, n)
+    q = min(16, tokens // 4)
+    return list(zip(_texts(q, n, seed=1), _texts(max(1, tokens - q - 1), n)))
+
+def measure(kind, model, tokens, batch_size, run):
+    """Items per second at one batch size: a warm-up batch, then two timed batches."""
+    items = _inputs(kind, tokens, batch_size * 2)
+    run(model, items[:batch_size], batch_size)
+    t0 = time.perf_counter()
+    run(model, items, batch_size)
+    return len(items) / (time.perf_counter() - t0)
+
+def tune_model(kind, model, run, buckets=BUCKETS, batch_sizes=BATCH_SIZES, step_budget_s=4.0, log=print):
+    """{"buckets": {tokens: {"best": bs, "items_per_s": {bs: rate}}}} for one model."""
+    out = {}
+    for tokens in buckets:
+        rates = {}
+        for bs in batch_sizes:
+            t0 = time.perf_counter()
+            try:
+                with _idle_host():
+                    rates[bs] = measure(kind, model, tokens, bs, run)
+            except (MemoryError, RuntimeError) as e:
+                if not _is_oom(e): raise
+                break
+            best = max(rates.values())
+            # larger batches past a clear drop, or ones that take too long to time, aren't worth trying
+            if rates[bs] < 0.85 * best or time.perf_counter() - t0 > step_budget_s:
+                break
+        best_bs = max(rates, key=rates.get)
+        out[str(tokens)] = {"best": best_bs, "items_per_s": {str(k): round(v, 2) for k, v in rates.items()}}
+        log(f"  {kind} {tokens:>4} tokens: best batch {best_bs} "
+            f"({rates[best_bs]:.1f} items/s; tried {', '.join(map(str, rates))})")
+    return {"buckets": out}
+
+def _model_dims(model_dir, folder):
+    try:
+        with open(os.path.join(model_dir, folder, "config.json"), "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        return {"hidden": int(cfg["hidden_size"]), "heads": int(cfg["num_attention_heads"])}
+    except (OSError, ValueError, KeyError):
+        return dict(DEFAULT_DIMS)
+
+def tune(model_dir, quantize_int8=False, quick=False, tuning_dir=None, threads=None, log=print):
+    """
+    Measure both models on this host with `threads` intra-op threads (default: a
+    lone run's share) and merge the results into that profile; returns its path.
+    """
+    import process_pdf as pp
+    import thread_budget
+    # a fixed count, and no slot: the profile is only valid for the threads it was measured with,
+    # and holding a slot would shrink the share of the very runs the tuner waits for
+    threads = threads or run_threads()
+    thread_budget.acquire(register=False, threads=threads)
+    with _idle_host():  # loading both models is the heaviest part of a quick tune
+        torch = pp._get_torch()
+        ranker = pp.MultiQueryRanker(model_dir=model_dir, quantize_int8=quantize_int8)
+        ranker.model, ranker.cross_encoder  # both load lazily; load them now
+    buckets = QUICK_BUCKETS if quick else BUCKETS
+    sizes = QUICK_BATCH_SIZES if quick else BATCH_SIZES
+    sig = host_signature(torch.__version__, threads)
+    path = profile_path(sig, tuning_dir)
+    profile = load_profile(path) or {"version": PROFILE_VERSION, "host": sig, "models": {}}
+
+    def run_bi(model, items, bs):
+        with torch.inference_mode():
+            model.encode(items, batch_size=bs, convert_to_numpy=True, show_progress_bar=False)
+
+    def run_cross(model, items, bs):
+        with torch.inference_mode():
+            model.predict(items, batch_size=bs, show_progress_bar=False)
+
+    for kind, model, run, folder in (("bi_encoder", ranker.model, run_bi, "bge-small-en-v1.5"),
+                                     ("cross_encoder", ranker.cross_encoder, run_cross, "cross-encoder-ms-marco")):
+        key = model_key(kind, model)
+        log(f"[tune] {key} with {torch.get_num_threads()} threads")
+        entry = tune_model(kind, model, run, buckets, sizes, step_budget_s=2.0 if quick else 4.0, log=log)
+        entry.update(dims=_model_dims(model_dir, folder), threads=torch.get_num_threads(),
+                     tuned_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), quick=quick)
+        profile["models"][key] = entry
+    save_profile(path, profile)
+    return path
+
+def ensure_profile(model_dir, quantize_int8=False, tuning_dir=None):
+    """
+    Start a quick background tune if this host has no profile yet for this run's
+    thread count, measured with that many threads. Only one is started per
+    profile: a marker next to the profile holds further ones off for
+    RETUNE_HOLDOFF_S after it starts, and the tuner leaves it behind marked
+    done (or failed) when it exits, so a failed tune is retried only later.
+    """
+    if not AUTOTUNE or current_profile() is not None:
+        return False
+    threads = run_threads()
+    path = profile_path(host_signature(threads=threads), tuning_dir)
+    marker = path + ".tuning"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(marker) and time.time() - os.path.getmtime(marker) < RETUNE_HOLDOFF_S:
+            return False
+        with open(marker, "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))
+        cmd = [sys.executable, os.path.abspath(__file__), model_dir, "--quick", "--threads", str(threads),
+               "--marker", marker]
+        if quantize_int8: cmd.append("--quantize_int8")
+        if tuning_dir: cmd += ["--tuning_dir", tuning_dir]
+        subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True, env=dict(os.environ, MODEL2_AUTOTUNE="0"))
+    except OSError:
+        return False
+    return True
+
+if __name__ == "__main__":
+    import argparse
+    _HERE = os.path.dirname(os.path.abspath(__file__))
+    if _HERE not in sys.path: sys.path.insert(0, _HERE)
+    parser = argparse.ArgumentParser(description="Measure and store per-host encode batch sizes for model_2.")
+    parser.add_argument("model_dir", help="Directory containing local model folders.")
+    parser.add_argument("--quantize_int8", action="store_true", help="Tune the int8 models instead.")
+    parser.add_argument("--quick", action="store_true", help="Fewer buckets and batch sizes (what first runs use).")
+    parser.add_argument("--tuning_dir", default=None, help="Profile directory (default MODEL2_TUNING_DIR).")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Intra-op threads to measure with (default: all usable CPUs, or MODEL2_THREADS).")
+    parser.add_argument("--show", action="store_true", help="Print this host's profile and exit.")
+    parser.add_argument("--marker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.show:
+        path = profile_path(host_signature(threads=args.threads), args.tuning_dir)
+        prof = load_profile(path)
+        print(json.dumps(prof, indent=2) if prof else f"No profile at {path}")
+        sys.exit(0 if prof else 1)
+    status = "failed"
+    try:
+        path = tune(args.model_dir, args.quantize_int8, args.quick, args.tuning_dir, args.threads,
+                    log=lambda m: print(m, file=sys.stderr, flush=True))
+        print(f"Profile written to {path}", file=sys.stderr)
+        status = "done"
+    finally:
+        if args.marker:
+            try:
+                with open(args.marker, "w", encoding="utf-8") as f:
+                    f.write(f"{status} {os.getpid()}")
+            except OSError: pass
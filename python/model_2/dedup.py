@@ -0,0 +1,89 @@
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+
+# --------------------------
+# Near-duplicate chunk collapsing
+# --------------------------
+# MinHash signatures over word 3-shingles, LSH banding to find candidate
+# pairs, exact Jaccard to confirm them. Each cluster of near-duplicates keeps
+# its first chunk (document order) as representative, carrying the other
+# locations in "duplicates" so results can still cite them.
+
+_PRIME = (1 << 32) + 15  # > any crc32 value; a*x+b stays below 2**64
+MIN_SHINGLES = 5         # shorter chunks (bare headings) are never treated as duplicates
+
+def shingles(text, k=3):
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    if len(words) < k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+def minhash_signatures(shingle_sets, num_perm=64, seed=1):
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+    b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+    sigs = np.full((len(shingle_sets), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for i, sh in enumerate(shingle_sets):
+        if not sh: continue
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in sh), dtype=np.uint64, count=len(sh))
+        sigs[i] = ((a[:, None] * x[None, :] + b[:, None]) % _PRIME).min(axis=1)
+    return sigs
+
+def _jaccard(x, y):
+    return len(x & y) / len(x | y) if x and y else 0.0
+
+def near_duplicate_groups(texts, threshold=0.9, num_perm=64, bands=16):
+    """Clusters (lists of indices, first = representative) of texts with Jaccard >= threshold."""
+    sets = [s if len(s) >= MIN_SHINGLES else set() for s in (shingles(t) for t in texts)]
+    sigs = minhash_signatures(sets, num_perm=num_perm)
+    rows = max(1, num_perm // bands)
+
+    parent = list(range(len(texts)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]; i = parent[i]
+        return i
+
+    checked = set()
+    for band in range(0, num_perm, rows):
+        buckets = defaultdict(list)
+        for i, s in enumerate(sets):
+            if s: buckets[sigs[i, band:band + rows].tobytes()].append(i)
+        for members in buckets.values():
+            for x, i in enumerate(members):
+                for j in members[x + 1:]:
+                    ri, rj = find(i), find(j)
+                    if ri == rj or (i, j) in checked: continue
+                    checked.add((i, j))
+                    if _jaccard(sets[i], sets[j]) >= threshold:
+                        parent[max(ri, rj)] = min(ri, rj)
+
+    groups = defaultdict(list)
+    for i in range(len(texts)):
+        groups[find(i)].append(i)
+    return sorted(groups.values(), key=lambda g: g[0])
+
+def collapse(chunks_by_doc, doc_order, threshold=0.9):
+    """
+    Drop near-duplicate chunks across all documents (visited in `doc_order`).
+    Returns ({doc: surviving chunks}, report); survivors list the dropped
+    copies' locations under "duplicates".
+    """
+    flat = [(d, c) for d in doc_order for c in chunks_by_doc.get(d, [])]
+    texts = [f"{c.get('title', '')}\n{c.get('text', '')}" for _, c in flat]
+    keep = {}
+    for group in near_duplicate_groups(texts, threshold=threshold):
+        rep = group[0]
+        dups = [{"document": flat[j][0], "title": flat[j][1].get("title", ""), "page": flat[j][1].get("page")}
+                for j in group[1:]]
+        keep[rep] = dups
+    out = {d: [] for d in doc_order}
+    for i, (d, c) in enumerate(flat):
+        if i in keep:
+            out[d].append(dict(c, duplicates=keep[i]) if keep[i] else c)
+    report = {"chunks_in": len(flat), "chunks_out": len(keep),
+              "encoder_calls_saved": len(flat) - len(keep),
+              "clusters_with_duplicates": sum(1 for v in keep.values() if v)}
+    return out, report
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+# --------------------------
+# Compact embedding storage
+# --------------------------
+# L2-normalized embeddings saved as float32, float16, or int8 with one scale
+# per vector (x ~= q * scale, scale = max|x| / 127). Files are plain .npy so
+# they load memory-mapped; scores are computed block by block straight from
+# the stored dtype, never materializing a full float32 copy.
+#
+#   <prefix>.npy        [N,d] float32 | float16 | int8
+#   <prefix>.scale.npy  [N]   float32 (int8 only)
+
+DTYPES = ("float32", "float16", "int8")
+BLOCK_ROWS = 4096
+
+def quantize(embs, dtype="float32"):
+    """(stored matrix, per-row scales or None) for `dtype`."""
+    embs = np.asarray(embs, dtype=np.float32)
+    if dtype == "float32":
+        return embs, None
+    if dtype == "float16":
+        return embs.astype(np.float16), None
+    if dtype == "int8":
+        scale = np.abs(embs).max(axis=1) / 127.0 if len(embs) else np.zeros(0, np.float32)
+        scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+        q = np.clip(np.rint(embs / scale[:, None]), -127, 127).astype(np.int8)
+        return q, scale
+    raise ValueError(f"unknown embedding dtype: {dtype}")
+
+def save(prefix, embs, dtype="float32"):
+    data, scale = quantize(embs, dtype)
+    _save_npy(prefix + ".npy", data)
+    if scale is not None:
+        _save_npy(prefix + ".scale.npy", scale)
+    elif os.path.exists(prefix + ".scale.npy"):
+        os.remove(prefix + ".scale.npy")
+
+def _save_npy(path, arr):
+    tmp = path + ".tmp.npy"
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+def load(prefix, mmap=True):
+    data = np.load(prefix + ".npy", mmap_mode="r" if mmap else None)
+    scale = np.load(prefix + ".scale.npy") if data.dtype == np.int8 else None
+    return EmbeddingMatrix(data, scale)
+
+class EmbeddingMatrix:
+    """Read-only view over stored embeddings with dequantizing scoring."""
+
+    def __init__(self, data, scale=None):
+        self.data = data
+        self.scale = scale
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def dtype(self):
+        return str(self.data.dtype)
+
+    @property
+    def nbytes(self):
+        return int(self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0))
+
+    def rows(self, idx):
+        """Dequantized float32 rows."""
+        out = np.asarray(self.data[idx], dtype=np.float32)
+        if self.scale is not None:
+            out = out * (self.scale[idx][..., None] if out.ndim == 2 else self.scale[idx])
+        return out
+
+    def __getitem__(self, idx):
+        return self.rows(idx)
+
+    def dot(self, q, rows=None):
+        """Scores [N,Q] of stored vectors (or `rows` of them) against float32 queries q [Q,d] or [d]."""
+        q = np.asarray(q, dtype=np.float32)
+        vec = q.ndim == 1
+        qm = q[:, None] if vec else q.T
+        idx = np.arange(len(self)) if rows is None else np.asarray(rows)
+        out = np.empty((len(idx), qm.shape[1]), dtype=np.float32)
+        for s in range(0, len(idx), BLOCK_ROWS):
+            sel = idx[s:s + BLOCK_ROWS]
+            block = np.asarray(self.data[sel], dtype=np.float32) @ qm
+            if self.scale is not None:
+                block *= self.scale[sel][:, None]
+            out[s:s + len(sel)] = block
+        return out[:, 0] if vec else out
+
+# --------------------------
+# Recall-versus-size report
+# --------------------------
+def compare(embs, queries, k=10, dtypes=DTYPES):
+    """Per dtype: bytes per vector, recall@k of the float32 top-k, and score error."""
+    embs = np.asarray(embs, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    ref = embs @ queries.T                                       # [N,Q]
+    k = max(1, min(k, len(embs)))
+    ref_top = np.argsort(-ref, axis=0)[:k]
+    report = []
+    for dt in dtypes:
+        m = EmbeddingMatrix(*quantize(embs, dt))
+        scores = m.dot(queries)
+        top = np.argsort(-scores, axis=0)[:k]
+        recall = np.mean([len(set(ref_top[:, j]) & set(top[:, j])) / k for j in range(queries.shape[0])])
+        report.append({
+            "dtype": dt,
+            "bytes_per_vector": m.nbytes / max(1, len(embs)),
+            "total_bytes": m.nbytes,
+            f"recall@{k}": round(float(recall), 4),
+            "max_abs_score_error": float(np.abs(scores - ref).max()) if ref.size else 0.0,
+        })
+    return report
+
+def report_for_pdfs(pdfs_dir, model_dir, k=10, queries=None, batch_size=128, max_pages_per_doc=None):
+    """Chunk embeddings of every PDF in `pdfs_dir`; queries default to the chunk headings."""
+    import process_pdf as pp
+
+    model = pp.load_bi_encoder(model_dir)
+    chunks = []
+    for name in sorted(f for f in os.listdir(pdfs_dir) if f.lower().endswith(".pdf")):
+        chunks.extend(pp.extract_pdf_text_chunks(os.path.join(pdfs_dir, name), max_pages_per_doc=max_pages_per_doc))
+    if not chunks:
+        return {"chunks": 0, "queries": 0, "results": []}
+    texts = [c["text"].strip() if c.get("text", "").strip() else c.get("title", "") for c in chunks]
+    queries = queries or [c["title"] for c in chunks]
+    embs = pp._encode_norm(model, texts, batch_size=batch_size)
+    q_embs = pp._encode_norm(model, queries, batch_size=batch_size)
+    return {"chunks": len(chunks), "queries": len(queries), "dim": int(embs.shape[1]),
+            "results": compare(embs, q_embs, k=k)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall-versus-size report for compact embedding storage.")
+    parser.add_argument("pdfs_dir", help="Folder of PDFs to embed.")
+    parser.add_argument("model_dir", help="Directory containing local model folders.")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours compared per query.")
+    parser.add_argument("--queries", default=None, help="Text file with one query per line (default: chunk headings).")
+    parser.add_argument("--batch_size", type=int, default=128, help="Encode batch size on CPU.")
+    parser.add_argument("--max_pages_per_doc", type=int, default=None, help="Hard cap on pages parsed per doc.")
+    args = parser.parse_args()
+
+    qs = None
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            qs = [l.strip() for l in f if l.strip()]
+    rep = report_for_pdfs(args.pdfs_dir, args.model_dir, k=args.k, queries=qs,
+                          batch_size=args.batch_size, max_pages_per_doc=args.max_pages_per_doc)
+    json.dump(rep, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+
+import embedding_store
+import windowing
+
+# --------------------------
+# Corpus index
+# --------------------------
+# Parsing, chunking and embedding done ahead of time, one entry per PDF
+# *content* (SHA-256), so a query can look a document up no matter which folder
+# it was uploaded to:
+#
+#   <index_dir>/docs/<sha>/meta.json       pages, encoder, windowing settings, counts
+#                          chunks.json     [{title, text, page, tokens}]
+#                          chunk_embs.npy  L2-normalized embeddings of every chunk's windows (windowing.py;
+#                                          embedding_store format, plus chunk_embs.scale.npy for int8)
+#                          window_starts.npy  [n_chunks] first chunk_embs row of each chunk
+#                          summary_embs.npy  gating vectors: window centroid + k-means medoids
+#   <index_dir>/manifest.json              watched file name -> sha/size/mtime
+#
+# Entries are written to a temp dir and renamed into place, so readers never
+# see a half-written one.
+
+MODEL2_INDEX_DIR = os.environ.get("MODEL2_INDEX_DIR", os.path.join(".cache", "model2", "index"))
+MODEL2_INDEX_DTYPE = os.environ.get("MODEL2_INDEX_DTYPE", "float16")
+INDEX_VERSION = 4
+SUMMARY_MEDOIDS = int(os.environ.get("MODEL2_SUMMARY_MEDOIDS", "4"))
+
+def encoder_id(quantize_int8=False):
+    return "bge-small-en-v1.5" + ("-int8" if quantize_int8 else "")
+
+class CorpusIndex:
+    def __init__(self, index_dir=None, emb_dtype=None):
+        self.index_dir = index_dir or MODEL2_INDEX_DIR
+        self.emb_dtype = emb_dtype or MODEL2_INDEX_DTYPE
+        if self.emb_dtype not in embedding_store.DTYPES:
+            raise ValueError(f"MODEL2_INDEX_DTYPE must be one of {embedding_store.DTYPES}")
+        self.docs_dir = os.path.join(self.index_dir, "docs")
+        os.makedirs(self.docs_dir, exist_ok=True)
+
+    def entry_dir(self, sha):
+        return os.path.join(self.docs_dir, sha)
+
+    def meta(self, sha):
+        try:
+            with open(os.path.join(self.entry_dir(sha), "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            # windows cut with other settings can't be lined up with the ranker's; such entries are rebuilt
+            ok = meta.get("version") == INDEX_VERSION and meta.get("windowing") == windowing.split_config()
+            return meta if ok else None
+        except (OSError, ValueError):
+            return None
+
+    def has(self, sha, encoder=None):
+        meta = self.meta(sha)
+        return meta is not None and (encoder is None or meta.get("encoder") == encoder)
+
+    def load(self, sha, encoder=None):
+        """The stored entry for a PDF, or None if it isn't indexed (for this encoder)."""
+        meta = self.meta(sha)
+        if meta is None or (encoder is not None and meta.get("encoder") != encoder):
+            return None
+        d = self.entry_dir(sha)
+        try:
+            with open(os.path.join(d, "chunks.json"), "r", encoding="utf-8") as f:
+                chunks = json.load(f)
+            chunk_embs = embedding_store.load(os.path.join(d, "chunk_embs"))
+            window_starts = np.load(os.path.join(d, "window_starts.npy"))
+            summary = embedding_store.load(os.path.join(d, "summary_embs"), mmap=False)
+        except (OSError, ValueError):
+            return None
+        for c in chunks:
+            c["tokens"] = set(c.get("tokens") or [])
+        return {"meta": meta, "chunks": chunks, "chunk_embs": chunk_embs, "window_starts": window_starts,
+                "summary_embs": summary.rows(np.arange(len(summary)))}
+
+    def write(self, sha, meta, chunks, chunk_embs, summary_embs, window_starts):
+        tmp = self.entry_dir(sha) + f".{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        meta = dict(meta, version=INDEX_VERSION, sha=sha, n_chunks=len(chunks), n_windows=len(chunk_embs),
+                    windowing=windowing.split_config(), created=time.time(), emb_dtype=self.emb_dtype)
+        with open(os.path.join(tmp, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump([dict(c, tokens=sorted(c.get("tokens") or [])) for c in chunks], f, ensure_ascii=False)
+        embedding_store.save(os.path.join(tmp, "chunk_embs"), chunk_embs, self.emb_dtype)
+        np.save(os.path.join(tmp, "window_starts.npy"), np.asarray(window_starts, dtype=np.int32))
+        embedding_store.save(os.path.join(tmp, "summary_embs"), summary_embs, self.emb_dtype)
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        shutil.rmtree(self.entry_dir(sha), ignore_errors=True)
+        os.replace(tmp, self.entry_dir(sha))
+
+    def remove(self, sha):
+        shutil.rmtree(self.entry_dir(sha), ignore_errors=True)
+
+    def shas(self):
+        return {n for n in os.listdir(self.docs_dir) if not n.endswith(".tmp")}
+
+    # ---- manifest of the watched folder ----
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.index_dir, "manifest.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_manifest(self, manifest):
+        p = os.path.join(self.index_dir, "manifest.json")
+        with open(p + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(p + ".tmp", p)
+
+# --------------------------
+# Document summary vectors
+# --------------------------
+def _l2(m):
+    return m / (np.linalg.norm(m, axis=-1, keepdims=True) + 1e-12)
+
+def summary_vectors(embs, k=SUMMARY_MEDOIDS, iters=10, seed=0):
+    """
+    [1+k', d] gating vectors for a document: the normalized centroid of its
+    window embeddings, then the medoid (an actual window) of each of k' <= k
+    k-means clusters, so a document is found by any of its main topics.
+    """
+    embs = np.asarray(embs, dtype=np.float32)
+    centroid = _l2(embs.mean(axis=0))[None, :]
+    k = min(k, len(embs))
+    if k <= 1:
+        return centroid
+    rng = np.random.RandomState(seed)
+    # k-means++ seeding on cosine distance
+    centers = [embs[rng.randint(len(embs))]]
+    for _ in range(1, k):
+        d = np.clip(1.0 - (embs @ np.stack(centers).T).max(axis=1), 0.0, None)
+        if d.sum() <= 0: break
+        centers.append(embs[rng.choice(len(embs), p=d / d.sum())])
+    centers = np.stack(centers)
+    for _ in range(iters):
+        assign = (embs @ centers.T).argmax(axis=1)
+        new = np.stack([_l2(embs[assign == j].mean(axis=0)) if (assign == j).any() else centers[j]
+                        for j in range(len(centers))])
+        if np.allclose(new, centers): break
+        centers = new
+    assign = (embs @ centers.T).argmax(axis=1)
+    medoids = []
+    for j in range(len(centers)):
+        members = np.where(assign == j)[0]
+        if len(members):
+            medoids.append(embs[members[(embs[members] @ centers[j]).argmax()]])
+    return np.concatenate([centroid, np.stack(medoids)])
+
+# --------------------------
+# Building entries
+# --------------------------
+def build_entry(index, pdf_path, sha, model, quantize_int8=False, batch_size=128):
+    """Parse, chunk and embed one PDF into the index, one embedding per window as the ranker scores them."""
+    import process_pdf as pp
+
+    chunks = pp.extract_pdf_text_chunks(pdf_path)
+    for c in chunks:
+        c["tokens"] = set(pp._tokens(c["text"] if c.get("text", "").strip() else c.get("title", "")))
+    texts = [c["text"].strip() if c.get("text", "").strip() else c.get("title", "") for c in chunks]
+    win_texts, window_starts = [], []
+    for t in texts:
+        window_starts.append(len(win_texts))
+        win_texts.extend(windowing.split(t))
+    if texts:
+        chunk_embs = pp._encode_norm(model, win_texts, batch_size=batch_size)
+        summary = summary_vectors(chunk_embs)
+    else:
+        # nothing chunkable (no headings found): gate on the opening pages instead
+        chunk_embs = np.zeros((0, model.get_sentence_embedding_dimension()), np.float32)
+        summary = pp._encode_norm(model, [pp.quick_doc_preview_text(pdf_path)], batch_size=batch_size)
+    meta = {"pages": pp.get_page_count_safe(pdf_path), "encoder": encoder_id(quantize_int8)}
+    index.write(sha, meta, chunks, chunk_embs, summary, window_starts)
+    return len(chunks)
+
+def sync_once(index, pdfs_dir, model, quantize_int8=False, batch_size=128, log=print):
+    """Bring the index in line with `pdfs_dir`; returns the number of PDFs (re)indexed."""
+    import result_cache
+
+    manifest = index.read_manifest()
+    seen, built = {}, 0
+    names = sorted(f for f in os.listdir(pdfs_dir) if f.lower().endswith(".pdf"))
+    for name in names:
+        path = os.path.join(pdfs_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        prev = manifest.get(name)
+        if prev and prev.get("size") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns \
+                and index.has(prev.get("sha"), encoder_id(quantize_int8)):
+            seen[name] = prev
+            continue
+        try:
+            sha = result_cache.file_sha256(path)
+            if not index.has(sha, encoder_id(quantize_int8)):
+                t0 = time.perf_counter()
+                n = build_entry(index, path, sha, model, quantize_int8, batch_size)
+                built += 1
+                log(f"indexed {name}: {n} chunks in {time.perf_counter() - t0:.2f}s")
+            seen[name] = {"sha": sha, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        except Exception as e:
+            log(f"failed to index {name}: {e}")
+
+    # Entries no watched file points at any more are dropped
+    for sha in index.shas() - {v["sha"] for v in seen.values()}:
+        index.remove(sha)
+    if seen != manifest:
+        index.write_manifest(seen)
+    return built
+
+def watch(pdfs_dir, model_dir, index_dir=None, interval=2.0, once=False,
+          quantize_int8=False, batch_size=128, emb_dtype=None):
+    import process_pdf as pp
+
+    index = CorpusIndex(index_dir, emb_dtype)
+    model = pp.load_bi_encoder(model_dir, quantize_int8=quantize_int8)
+    log = lambda *a: print("[indexer]", *a, flush=True)
+    log(f"watching {pdfs_dir} -> {index.index_dir}")
+    while True:
+        try:
+            sync_once(index, pdfs_dir, model, quantize_int8, batch_size, log=log)
+        except OSError as e:
+            log(f"scan failed: {e}")
+        if once:
+            return
+        time.sleep(interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep a parsed/embedded index of a PDF folder up to date.")
+    parser.add_argument("pdfs_dir", help="Folder of PDFs to watch.")
+    parser.add_argument("model_dir", help="Directory containing local model folders.")
+    parser.add_argument("--index_dir", default=None, help="Where the index lives (default MODEL2_INDEX_DIR).")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between folder scans.")
+    parser.add_argument("--once", action="store_true", help="Index once and exit.")
+    parser.add_argument("--batch_size", type=int, default=128, help="Encode batch size on CPU.")
+    parser.add_argument("--quantize_int8", action="store_true", help="Dynamic INT8 quantization for speed (CPU).")
+    parser.add_argument("--emb_dtype", choices=embedding_store.DTYPES, default=None,
+                        help="Stored embedding precision (default MODEL2_INDEX_DTYPE, float16).")
+    args = parser.parse_args()
+    try:
+        watch(args.pdfs_dir, args.model_dir, args.index_dir, args.interval, args.once,
+              args.quantize_int8, args.batch_size, args.emb_dtype)
+    except KeyboardInterrupt:
+        sys.exit(0)
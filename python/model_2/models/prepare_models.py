@@ -0,0 +1,175 @@
+# python/model_2/models/prepare_models.py
+"""
+Build-time preparation of the model_2 models (run after download_model.py).
+
+Loads each downloaded model the way the ranker does, traces it to a frozen
+TorchScript graph, serializes its fast tokenizer with the ranker's truncation
+and padding settings, checks that the result reproduces the
+sentence-transformers outputs on a set of probe inputs, and records
+everything in prepared/manifest.json (see prepared_models.py). The ranker
+then loads those instead of assembling the models from the raw files.
+
+    python python/model_2/models/prepare_models.py                 # fp32 artifacts
+    python python/model_2/models/prepare_models.py --int8          # also dynamic-int8 ones
+    python python/model_2/models/prepare_models.py --verify        # re-check sizes and checksums
+"""
+import os, sys, json, time, argparse
+
+os.environ["MODEL2_PREPARED"] = "0"  # reference outputs come from the raw models
+_M2 = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _M2 not in sys.path: sys.path.insert(0, _M2)
+import numpy as np
+import prepared_models as pm
+
+MODELS_DIR = os.path.join("python", "model_2", "models")
+# |prepared - reference| allowed; int8 is compared against the fp32 models
+TOLERANCE = {"fp32": 1e-4, "int8": 0.05}
+
+_WORDS = ("battery storage inverter rooftop array grid tariff safety grounding fuse capacity cycle "
+          "budget payback turbine rotor hydrogen membrane refrigerant airflow").split()
+PROBE_TEXTS = ["Battery storage", "  Sizing a rooftop photovoltaic array and choosing an inverter.  ", "x",
+               "Électricité et sécurité : mise à la terre", " ".join(_WORDS * 40)] + \
+              [" ".join(_WORDS[i:i + 3 + i]) for i in range(0, 12, 2)]
+PROBE_PAIRS = [(PROBE_TEXTS[1], t) for t in PROBE_TEXTS] + [(PROBE_TEXTS[4], PROBE_TEXTS[4])]
+
+def _source_files(src_dir):
+    return {f: {"bytes": os.path.getsize(os.path.join(src_dir, f)), "sha256": pm.file_sha256(os.path.join(src_dir, f))}
+            for f in sorted(os.listdir(src_dir)) if os.path.isfile(os.path.join(src_dir, f))}
+
+def _fast_tokenizer(hf_tokenizer, max_length):
+    """The Rust tokenizer behind `hf_tokenizer`, truncating and padding as the library call would."""
+    from tokenizers import Tokenizer
+    tok = Tokenizer.from_str(hf_tokenizer.backend_tokenizer.to_str())
+    tok.enable_truncation(max_length=int(max_length), strategy="longest_first")
+    tok.enable_padding(pad_id=hf_tokenizer.pad_token_id, pad_token=hf_tokenizer.pad_token,
+                       pad_type_id=getattr(hf_tokenizer, "pad_token_type_id", 0))
+    return tok
+
+def _trace(torch, module, tokenizer):
+    """Frozen TorchScript graph of module(input_ids, attention_mask, token_type_ids); traced on a padded batch."""
+    enc = tokenizer.encode_batch(["example input for tracing with padding", "short"])
+    example = tuple(torch.tensor([getattr(e, k) for e in enc], dtype=torch.long)
+                    for k in ("ids", "attention_mask", "type_ids"))
+    with torch.inference_mode():
+        graph = torch.jit.trace(module.eval(), example, strict=False, check_trace=False)
+    return torch.jit.freeze(graph)
+
+def _max_length(tokenizer_max, config):
+    cap = getattr(config, "max_position_embeddings", 512) or 512
+    return min(int(tokenizer_max) if tokenizer_max and tokenizer_max < 1e6 else cap, cap)
+
+def build(kind, variant, model_dir, torch, m2):
+    """(graph, tokenizer, extra manifest fields) for one model and precision."""
+    ranker = m2.MultiQueryRanker(model_dir=model_dir, quantize_int8=(variant == "int8"))
+    ref = m2.MultiQueryRanker(model_dir=model_dir)
+
+    if kind == "bi_encoder":
+        st = ranker.model
+        class Graph(torch.nn.Module):
+            def __init__(self, st):
+                super().__init__(); self.st = st
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                return self.st({"input_ids": input_ids, "attention_mask": attention_mask,
+                                "token_type_ids": token_type_ids})["sentence_embedding"]
+        tokenizer = _fast_tokenizer(st[0].tokenizer, _max_length(st[0].max_seq_length, st[0].auto_model.config))
+        graph = _trace(torch, Graph(st), tokenizer)
+        prepared = pm.PreparedBiEncoder(torch, graph, tokenizer, {})
+        got = prepared.encode(PROBE_TEXTS, batch_size=4)
+        want = ref.model.encode(PROBE_TEXTS, batch_size=4, convert_to_numpy=True, show_progress_bar=False)
+        return graph, tokenizer, {"dim": int(got.shape[1]), "max_abs_diff": float(np.abs(got - want).max())}
+
+    ce = ranker.cross_encoder
+    class Graph(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__(); self.model = model
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids, return_dict=False)[0]
+    hf_tok = ce.tokenizer
+    tokenizer = _fast_tokenizer(hf_tok, _max_length(getattr(ce, "max_length", None) or hf_tok.model_max_length,
+                                                    ce.model.config))
+    graph = _trace(torch, Graph(ce.model), tokenizer)
+    want = np.asarray(ref.cross_encoder.predict(PROBE_PAIRS, batch_size=4, show_progress_bar=False), dtype=np.float32)
+    logits = pm.PreparedCrossEncoder(torch, graph, tokenizer, {}).predict(PROBE_PAIRS, batch_size=4)
+    # predict() may or may not put the scores through a sigmoid; match whichever it does
+    candidates = {"sigmoid": 1.0 / (1.0 + np.exp(-logits)), "identity": logits}
+    activation = min(candidates, key=lambda a: float(np.abs(candidates[a] - want).max()))
+    return graph, tokenizer, {"activation": activation,
+                              "max_abs_diff": float(np.abs(candidates[activation] - want).max())}
+
+def prepare(model_dir, variants=("fp32",), kinds=tuple(pm.SOURCES)):
+    import process_pdf as m2
+    torch = m2._get_torch()
+    import tokenizers, transformers, sentence_transformers
+
+    pdir = pm.prepared_dir(model_dir)
+    os.makedirs(pdir, exist_ok=True)
+    manifest = {"version": pm.MANIFEST_VERSION, "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "built_with": {"torch": torch.__version__, "tokenizers": tokenizers.__version__,
+                               "transformers": transformers.__version__,
+                               "sentence_transformers": sentence_transformers.__version__},
+                "artifacts": {}}
+    for kind in kinds:
+        src = os.path.join(model_dir, pm.SOURCES[kind])
+        if not os.path.isdir(src):
+            print(f"  ⚠️  {src} not found; skipping {kind}.")
+            continue
+        tok_name = f"{kind}.tokenizer.json"
+        for variant in variants:
+            key = f"{kind}.{variant}"
+            print(f"  🔧 Preparing {key} ...", flush=True)
+            t0 = time.perf_counter()
+            try:
+                graph, tokenizer, extra = build(kind, variant, model_dir, torch, m2)
+            except Exception as e:
+                print(f"  ❌ FAILED to prepare {key}; the ranker will use the raw files. Error: {e}")
+                continue
+            if extra["max_abs_diff"] > TOLERANCE[variant]:
+                print(f"  ❌ {key} differs from the reference by {extra['max_abs_diff']:.2e}; not writing it.")
+                continue
+            graph_name = f"{key}.pt"
+            graph.save(os.path.join(pdir, graph_name))
+            tokenizer.save(os.path.join(pdir, tok_name))
+            files = {n: {"bytes": os.path.getsize(os.path.join(pdir, n)), "sha256": pm.file_sha256(os.path.join(pdir, n))}
+                     for n in (graph_name, tok_name)}
+            manifest["artifacts"][key] = dict(extra, kind=kind, variant=variant, torch=torch.__version__,
+                                              source=pm.SOURCES[kind], source_files=_source_files(src),
+                                              graph=graph_name, tokenizer=tok_name, files=files)
+            print(f"  ✅ {key}: {files[graph_name]['bytes'] / 1024**2:.1f} MB, "
+                  f"max diff {extra['max_abs_diff']:.1e}, {time.perf_counter() - t0:.1f}s")
+
+    tmp = os.path.join(pdir, pm.MANIFEST_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(pdir, pm.MANIFEST_NAME))
+    return manifest
+
+def verify(model_dir):
+    """Full checksum pass over every artifact and its sources; returns the failures."""
+    import torch
+    manifest = pm.load_manifest(model_dir)
+    if manifest is None:
+        return {"manifest": "missing or unreadable"}
+    failures = {}
+    for key, entry in manifest["artifacts"].items():
+        reason = pm.check_entry(model_dir, entry, torch.__version__, verify=True)
+        if reason: failures[key] = reason
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build ready-to-load model_2 artifacts from the downloaded models.")
+    parser.add_argument("model_dir", nargs="?", default=MODELS_DIR, help="Directory containing the model folders.")
+    parser.add_argument("--int8", action="store_true", help="Also build dynamically quantized int8 graphs.")
+    parser.add_argument("--verify", action="store_true", help="Only check existing artifacts against the manifest.")
+    args = parser.parse_args()
+
+    if args.verify:
+        failures = verify(args.model_dir)
+        for key, reason in failures.items():
+            print(f"  ❌ {key}: {reason}")
+        print("--- Prepared models OK ---" if not failures else "--- Prepared models FAILED verification ---")
+        sys.exit(1 if failures else 0)
+
+    print("--- Preparing model_2 artifacts ---")
+    manifest = prepare(args.model_dir, variants=("fp32", "int8") if args.int8 else ("fp32",))
+    print(f"\n--- {len(manifest['artifacts'])} artifact(s) written to {pm.prepared_dir(args.model_dir)} ---")
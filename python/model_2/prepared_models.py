@@ -0,0 +1,184 @@
+# python/model_2/prepared_models.py
+"""
+Build-time model artifacts (written by models/prepare_models.py) and their loaders.
+
+For each model folder the preparation step stores, under <model_dir>/prepared/:
+
+    <name>.<variant>.pt         TorchScript graph (traced, frozen; int8 variants are
+                                dynamically quantized before tracing) taking
+                                input_ids / attention_mask / token_type_ids
+    <name>.tokenizer.json       the fast tokenizer with truncation and padding baked in
+    manifest.json               versions, files with sizes and sha256, the source
+                                files they were built from, and the parity measured
+                                against the sentence-transformers models
+
+Loading one of these needs only torch and `tokenizers` — no transformers or
+sentence-transformers import, no config parsing or module assembly. The
+wrappers expose the calls the ranker and indexer make (`encode`, `predict`). Any
+mismatch (missing or resized file, different torch, changed source weights)
+returns None and the caller loads the raw models as before.
+
+    MODEL2_PREPARED=0 disables the artifacts.
+"""
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+
+MANIFEST_VERSION = 1
+PREPARED_DIRNAME = "prepared"
+MANIFEST_NAME = "manifest.json"
+
+# model kind -> folder of raw files under model_dir
+SOURCES = {"bi_encoder": "bge-small-en-v1.5", "cross_encoder": "cross-encoder-ms-marco"}
+
+def enabled():
+    return os.getenv("MODEL2_PREPARED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+def prepared_dir(model_dir):
+    return os.path.join(model_dir, PREPARED_DIRNAME)
+
+def file_sha256(path, bufsize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def torch_series(version):
+    """'2.3.1+cpu' -> '2.3'; TorchScript files are only trusted within one minor series."""
+    return ".".join(version.split("+")[0].split(".")[:2])
+
+def load_manifest(model_dir):
+    try:
+        with open(os.path.join(prepared_dir(model_dir), MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+def artifact_key(kind, quantize_int8=False):
+    return f"{kind}.{'int8' if quantize_int8 else 'fp32'}"
+
+def fingerprint(model_dir, quantize_int8=False):
+    """
+    {kind: {variant, sha256 of each built and source file}} of the artifacts a
+    run would load, from the manifest (nothing is hashed); None when they are
+    disabled or absent. Part of the result-cache key.
+    """
+    manifest = load_manifest(model_dir) if enabled() else None
+    if manifest is None:
+        return None
+    out = {}
+    for kind in SOURCES:
+        entry = manifest.get("artifacts", {}).get(artifact_key(kind, quantize_int8))
+        if entry:
+            out[kind] = {"variant": entry.get("variant"),
+                         "files": {n: m.get("sha256") for n, m in entry.get("files", {}).items()},
+                         "source_files": {n: m.get("sha256") for n, m in entry.get("source_files", {}).items()}}
+    return out
+
+def check_entry(model_dir, entry, torch_version, verify=False):
+    """None if the artifact is usable here, else the reason it isn't."""
+    if torch_series(entry.get("torch", "")) != torch_series(torch_version):
+        return f"built with torch {entry.get('torch')}, running {torch_version}"
+    pdir = prepared_dir(model_dir)
+    for name, meta in entry["files"].items():
+        path = os.path.join(pdir, name)
+        if not os.path.exists(path) or os.path.getsize(path) != meta["bytes"]:
+            return f"{name} missing or changed"
+        if verify and file_sha256(path) != meta["sha256"]:
+            return f"{name} checksum mismatch"
+    src = os.path.join(model_dir, entry["source"])
+    for name, meta in entry["source_files"].items():
+        path = os.path.join(src, name)
+        if not os.path.exists(path) or os.path.getsize(path) != meta["bytes"]:
+            return f"source {entry['source']}/{name} changed since preparation"
+        if verify and file_sha256(path) != meta["sha256"]:
+            return f"source {entry['source']}/{name} checksum mismatch"
+    return None
+
+# --------------------------
+# Runtime wrappers
+# --------------------------
+class _Prepared:
+    def __init__(self, torch, graph, tokenizer, entry):
+        self.torch = torch
+        self.graph = graph
+        self.tokenizer = tokenizer
+        self.entry = entry
+        self.model2_variant = f"prepared.{entry.get('variant', 'fp32')}"
+
+    def _forward(self, batch):
+        """`batch` is a list of str or (str, str); returns the graph output as float32 numpy."""
+        torch = self.torch
+        enc = self.tokenizer.encode_batch(batch)
+        ids = torch.tensor([e.ids for e in enc], dtype=torch.long)
+        mask = torch.tensor([e.attention_mask for e in enc], dtype=torch.long)
+        types = torch.tensor([e.type_ids for e in enc], dtype=torch.long)
+        with torch.inference_mode():
+            return self.graph(ids, mask, types).float().numpy()
+
+    def _run(self, items, batch_size):
+        """Longest-first batches (less padding), results back in input order."""
+        if not items:
+            return None
+        length = lambda x: sum(map(len, x)) if isinstance(x, tuple) else len(x)
+        order = sorted(range(len(items)), key=lambda i: -length(items[i]))
+        bs = max(1, int(batch_size))
+        outs = [self._forward([items[i] for i in order[s:s + bs]]) for s in range(0, len(order), bs)]
+        stacked = np.concatenate(outs, axis=0)
+        result = np.empty_like(stacked)
+        result[np.asarray(order)] = stacked
+        return result
+
+class PreparedBiEncoder(_Prepared):
+    """Stands in for SentenceTransformer.encode on a list of texts."""
+
+    def get_sentence_embedding_dimension(self):
+        return self.entry["dim"]
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False, **_):
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size)[0]
+        out = self._run([str(t).strip() for t in texts], batch_size)
+        return out if out is not None else np.zeros((0, self.entry["dim"]), dtype=np.float32)
+
+class PreparedCrossEncoder(_Prepared):
+    """Stands in for CrossEncoder.predict on (query, passage) pairs."""
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False, **_):
+        out = self._run([(str(a).strip(), str(b).strip()) for a, b in pairs], batch_size)
+        if out is None:
+            return np.zeros((0,), dtype=np.float32)
+        if self.entry.get("activation") == "sigmoid":
+            out = 1.0 / (1.0 + np.exp(-out))
+        return out[:, 0] if out.shape[1] == 1 else out
+
+def load(model_dir, kind, quantize_int8=False, torch=None):
+    """The prepared `kind` model for this precision, or None (with the reason on stderr) to fall back."""
+    if not enabled():
+        return None
+    manifest = load_manifest(model_dir)
+    if manifest is None:
+        return None
+    entry = manifest["artifacts"].get(artifact_key(kind, quantize_int8))
+    if entry is None:
+        return None
+    if torch is None:
+        import torch
+    reason = check_entry(model_dir, entry, torch.__version__)
+    if reason:
+        print(f"[model2] not using prepared {artifact_key(kind, quantize_int8)}: {reason}", file=sys.stderr)
+        return None
+    try:
+        from tokenizers import Tokenizer
+        pdir = prepared_dir(model_dir)
+        graph = torch.jit.load(os.path.join(pdir, entry["graph"]), map_location="cpu").eval()
+        tokenizer = Tokenizer.from_file(os.path.join(pdir, entry["tokenizer"]))
+    except Exception as e:
+        print(f"[model2] not using prepared {artifact_key(kind, quantize_int8)}: {e}", file=sys.stderr)
+        return None
+    cls = PreparedBiEncoder if kind == "bi_encoder" else PreparedCrossEncoder
+    return cls(torch, graph, tokenizer, entry)
@@ -1,24 +1,108 @@
+import time
+_T_START = time.perf_counter()
 import os
+import sys
 import re
 import json
 import argparse
+import copy
+import threading
 from collections import Counter, defaultdict
 import numpy as np
-import pdfplumber
-import torch
-from torch import inference_mode
-from sentence_transformers import SentenceTransformer, CrossEncoder, models
+
+# Sibling modules resolve whether this file runs as a script or is imported as model_2.process_pdf
+_HERE = os.path.dirname(os.path.abspath(__file__))
+if _HERE not in sys.path: sys.path.insert(0, _HERE)
+import result_cache
+import indexer
+import dedup
+import stage_trace
+import prepared_models
+import windowing
+import thread_budget
+import batch_tuner
 
 # --------------------------
 # CPU threading & env hints
 # --------------------------
-os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count() or 4))
-os.environ.setdefault("MKL_NUM_THREADS", str(os.cpu_count() or 4))
-try:
-    torch.set_num_threads(os.cpu_count() or 4)
-    torch.set_num_interop_threads(max(1, (os.cpu_count() or 4)//2))
-except Exception:
-    pass
+# torch, sentence_transformers and pdfplumber are imported on first use, so a
+# run that fails validation or has nothing to rank never pays for them. Thread
+# counts come from this process's share of the container's CPUs (thread_budget).
+
+STARTUP_MS = {}  # what this process spent getting ready; a model load includes the imports it triggers
+STARTUP_MS["import_modules"] = round((time.perf_counter() - _T_START) * 1000.0, 1)
+
+def _timed_startup(name, fn):
+    t0 = time.perf_counter()
+    with stage_trace.stage(name):
+        out = fn()
+    STARTUP_MS[name] = round((time.perf_counter() - t0) * 1000.0, 1)
+    return out
+
+_torch = None
+
+def _get_torch():
+    """torch, imported and given its thread settings once per process."""
+    global _torch
+    if _torch is None:
+        def load():
+            budget = thread_budget.acquire()
+            for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "RAYON_RS_NUM_CPUS"):
+                os.environ.setdefault(var, str(budget.threads))
+            import torch
+            try:
+                torch.set_num_threads(budget.threads)
+                torch.set_num_interop_threads(budget.interop_threads)
+            except Exception:
+                pass
+            return torch
+        _torch = _timed_startup("import_torch", load)
+    return _torch
+
+def _rebalance_threads():
+    """Follow this worker's CPU share as other model_2 runs start and finish."""
+    budget = thread_budget.current()
+    if budget is None or _torch is None:
+        return
+    before = budget.threads
+    if budget.refresh().threads != before:
+        _torch.set_num_threads(budget.threads)
+
+_pdfplumber = None
+
+def _get_pdfplumber():
+    global _pdfplumber
+    if _pdfplumber is None:
+        _pdfplumber = _timed_startup("import_pdfplumber", lambda: __import__("pdfplumber"))
+    return _pdfplumber
+
+def _sentence_transformers():
+    _get_torch()
+    if "sentence_transformers" not in sys.modules:
+        return _timed_startup("import_sentence_transformers", lambda: __import__("sentence_transformers"))
+    return sys.modules["sentence_transformers"]
+
+def log_startup():
+    """One stderr line with this process's import and model-load times."""
+    print("[model2] startup " + " ".join(f"{k}={v}ms" for k, v in STARTUP_MS.items()), file=sys.stderr, flush=True)
+    if thread_budget.current() is not None:
+        print(thread_budget.format_report(thread_budget.current()), file=sys.stderr, flush=True)
+
+# --------------------------
+# Cooperative cancellation (jobs run by scheduler.py)
+# --------------------------
+_job = threading.local()  # the scheduler sets `cancel` (a threading.Event) on its worker threads
+
+class Cancelled(BaseException):
+    """
+    The job on this thread was cancelled. Raised only at stage boundaries, and a
+    BaseException so the per-document `except Exception` handlers let it through.
+    """
+
+def checkpoint(where):
+    cancel = getattr(_job, "cancel", None)
+    if cancel is not None and cancel.is_set():
+        raise Cancelled(where)
 
 # --------------------------
 # Utilities
@@ -84,13 +168,19 @@ def is_junk_line(line_text):
     return False
 
 def format_extracted_sections(ranked_chunks):
-    return [{
+    out = [{
         "document": c["document"],
         "section_title": c["title"],
         "refined_text": c.get("text", ""),
         "importance_rank": i + 1,
         "page_number": c["page"]
     } for i, c in enumerate(ranked_chunks)]
+    # near-duplicate copies collapsed into this section (see dedup.py)
+    for o, c in zip(out, ranked_chunks):
+        if c.get("duplicates"):
+            o["also_found_in"] = [{"document": d["document"], "section_title": d["title"], "page_number": d["page"]}
+                                  for d in c["duplicates"]]
+    return out
 
 # --------------------------
 # Tokenization / lexical coverage
@@ -105,8 +195,8 @@ def _tokens(s):
     return [t for t in re.findall(r"[A-Za-z0-9_]+", (s or "").lower())
             if t not in _STOP and len(t) > 2]
 
-def lexical_coverage(qtext, dtext):
-    q = set(_tokens(qtext)); d = set(_tokens(dtext))
+def lexical_coverage(qtext, dtext, d_tokens=None):
+    q = set(_tokens(qtext)); d = set(_tokens(dtext)) if d_tokens is None else d_tokens
     if not q or not d: return 0.0
     return len(q & d) / len(q)
 
@@ -128,7 +218,7 @@ def build_line_object(words, page):
     }
 
 def extract_lines_and_features(pdf_path):
-    with pdfplumber.open(pdf_path) as pdf:
+    with _get_pdfplumber().open(pdf_path) as pdf:
         all_lines, font_sizes = [], []
         for page in pdf.pages:
             page_words = page.extract_words(extra_attrs=["size", "fontname", "bottom"])
@@ -245,7 +335,7 @@ def extract_pdf_text_chunks(pdf_path, max_pages_per_doc=None):
 # --------------------------
 def quick_doc_preview_text(pdf_path, max_pages=2, max_chars=2000):
     try:
-        with pdfplumber.open(pdf_path) as pdf:
+        with _get_pdfplumber().open(pdf_path) as pdf:
             lines = []
             for page in pdf.pages[:max_pages]:
                 page_words = page.extract_words(extra_attrs=["size","fontname","bottom"])
@@ -283,57 +373,115 @@ def _l2_normalize(mat: np.ndarray) -> np.ndarray:
     norms = np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12
     return mat / norms
 
-def _encode_norm(model: SentenceTransformer, texts, batch_size=128) -> np.ndarray:
-    with inference_mode():
-        embs = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+def _encode_norm(model: "SentenceTransformer", texts, batch_size=128) -> np.ndarray:
+    """batch_size=None takes the host's tuned size (batch_tuner); any size is cut down under memory pressure."""
+    _rebalance_threads()
+    bs = batch_tuner.batch_size_for("bi_encoder", model, texts, batch_size)
+    with _get_torch().inference_mode(), batch_tuner.encoding():
+        embs = batch_tuner.with_backoff("bi_encoder", model, lambda b: model.encode(
+            texts, batch_size=b, convert_to_numpy=True, show_progress_bar=False), bs)
     return _l2_normalize(embs.astype(np.float32))
 
-def _predict_cross(cpu_cross: CrossEncoder, pairs, batch_size=64) -> np.ndarray:
-    with inference_mode():
-        scores = cpu_cross.predict(pairs, show_progress_bar=False, batch_size=batch_size)
+def _predict_cross(cpu_cross: "CrossEncoder", pairs, batch_size=64) -> np.ndarray:
+    _rebalance_threads()
+    bs = batch_tuner.batch_size_for("cross_encoder", cpu_cross, pairs, batch_size)
+    with _get_torch().inference_mode(), batch_tuner.encoding():
+        scores = batch_tuner.with_backoff("cross_encoder", cpu_cross, lambda b: cpu_cross.predict(
+            pairs, show_progress_bar=False, batch_size=b), bs)
     return np.asarray(scores, dtype=np.float32)
 
 def _sigmoid(x):
     x = np.asarray(x, dtype=np.float32)
     return 1.0 / (1.0 + np.exp(-x))
 
+def load_bi_encoder(model_dir, quantize_int8=False) -> "SentenceTransformer":
+    torch = _get_torch()
+    prepared = prepared_models.load(model_dir, "bi_encoder", quantize_int8, torch)
+    if prepared is not None:
+        return prepared
+    _sentence_transformers()
+    from sentence_transformers import SentenceTransformer, models
+    bge_model_path = os.path.join(model_dir, "bge-small-en-v1.5")
+    word_embedding_model = models.Transformer(bge_model_path)
+    pooling_model = models.Pooling(word_embedding_model.get_word_embedding_dimension())
+    model = SentenceTransformer(modules=[word_embedding_model, pooling_model]).to("cpu").eval()
+
+    if quantize_int8:
+        try:
+            from torch.ao.quantization import quantize_dynamic
+            if hasattr(word_embedding_model, "auto_model") and word_embedding_model.auto_model is not None:
+                word_embedding_model.auto_model = quantize_dynamic(
+                    word_embedding_model.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+                ).eval()
+        except Exception:
+            pass
+    model.model2_variant = "raw.int8" if quantize_int8 else "raw.fp32"
+    return model
+
 # --------------------------
 # Ranker (supports query-only or persona|task)
 # --------------------------
+# Short anchors (< 8 tokens) give lexical coverage little to go on, so their
+# (alpha, beta, gamma) lean on the models: each weight is scaled by this much
+SHORT_ANCHOR_SCALE = (1.2, 0.45 / 0.35, 0.6)
+
 class MultiQueryRanker:
+    """Both models load on first use: the cross-encoder only once a shortlist needs scoring."""
+
     def __init__(self, model_dir, alpha=1.0, beta=0.35, gamma=0.25,
                  cross_top_m=48, quantize_int8=False):
-        bge_model_path = os.path.join(model_dir, "bge-small-en-v1.5")
-        word_embedding_model = models.Transformer(bge_model_path)
-        pooling_model = models.Pooling(word_embedding_model.get_word_embedding_dimension())
-        self.model = SentenceTransformer(modules=[word_embedding_model, pooling_model]).to("cpu").eval()
+        self.model_dir = model_dir
+        self.quantize_int8 = quantize_int8
+        self._model = None
+        self._cross_encoder = None
 
-        if quantize_int8:
-            try:
-                from torch.ao.quantization import quantize_dynamic
-                if hasattr(word_embedding_model, "auto_model") and word_embedding_model.auto_model is not None:
-                    word_embedding_model.auto_model = quantize_dynamic(
-                        word_embedding_model.auto_model, {torch.nn.Linear}, dtype=torch.qint8
-                    ).eval()
-            except Exception:
-                pass
+        self.alpha = float(alpha)
+        self.beta  = float(beta)
+        self.gamma = float(gamma)
+        self.cross_top_m = int(cross_top_m)
 
-        cross_encoder_path = os.path.join(model_dir, "cross-encoder-ms-marco")
-        self.cross_encoder = CrossEncoder(cross_encoder_path, device="cpu")
-        if quantize_int8:
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = _timed_startup("load_bi_encoder",
+                                         lambda: load_bi_encoder(self.model_dir, quantize_int8=self.quantize_int8))
+        return self._model
+
+    @property
+    def cross_encoder(self):
+        if self._cross_encoder is None:
+            self._cross_encoder = _timed_startup("load_cross_encoder", self._load_cross_encoder)
+        return self._cross_encoder
+
+    def _load_cross_encoder(self):
+        torch = _get_torch()
+        prepared = prepared_models.load(self.model_dir, "cross_encoder", self.quantize_int8, torch)
+        if prepared is not None:
+            return prepared
+        cross_encoder_path = os.path.join(self.model_dir, "cross-encoder-ms-marco")
+        _sentence_transformers()
+        from sentence_transformers import CrossEncoder
+        cross_encoder = CrossEncoder(cross_encoder_path, device="cpu")
+        if self.quantize_int8:
             try:
                 from torch.ao.quantization import quantize_dynamic
-                if hasattr(self.cross_encoder, "model"):
-                    self.cross_encoder.model = quantize_dynamic(
-                        self.cross_encoder.model, {torch.nn.Linear}, dtype=torch.qint8
+                if hasattr(cross_encoder, "model"):
+                    cross_encoder.model = quantize_dynamic(
+                        cross_encoder.model, {torch.nn.Linear}, dtype=torch.qint8
                     ).eval()
             except Exception:
                 pass
-
-        self.alpha = float(alpha)
-        self.beta  = float(beta)
-        self.gamma = float(gamma)
-        self.cross_top_m = int(cross_top_m)
+        cross_encoder.model2_variant = "raw.int8" if self.quantize_int8 else "raw.fp32"
+        return cross_encoder
+
+    def with_weights(self, alpha=None, beta=None, gamma=None, cross_top_m=None):
+        """A ranker with other scoring weights sharing this one's (already loaded) models."""
+        other = copy.copy(self)
+        if alpha is not None: other.alpha = float(alpha)
+        if beta is not None: other.beta = float(beta)
+        if gamma is not None: other.gamma = float(gamma)
+        if cross_top_m is not None: other.cross_top_m = int(cross_top_m)
+        return other
 
     def build_anchor(self, persona=None, task=None, query=None):
         if query and str(query).strip():
@@ -341,20 +489,42 @@ class MultiQueryRanker:
         parts = [p for p in [persona, task] if p and str(p).strip()]
         return " | ".join(parts) if parts else ""
 
-    def score_documents(self, doc_previews, anchor, batch_size=128):
-        if not doc_previews: return []
-        names = list(doc_previews.keys())
-        previews = [doc_previews[n] for n in names]
-        q_emb = _encode_norm(self.model, [anchor], batch_size=batch_size)  # [1,d]
-        p_emb = _encode_norm(self.model, previews, batch_size=batch_size)  # [N,d]
-        sims = p_emb @ q_emb.T
-        return list(zip(names, sims.ravel().astype(np.float32)))
+    def score_documents(self, doc_previews, anchor, batch_size=128, doc_vectors=None):
+        names, sims = self.score_documents_batch(doc_previews, [anchor], batch_size, doc_vectors)
+        return list(zip(names, sims[0])) if names else []
+
+    def score_documents_batch(self, doc_previews, anchors, batch_size=128, doc_vectors=None):
+        """
+        Document names and their [Q,N] similarity to each anchor. Documents
+        with stored summary vectors (centroid + medoids, from the indexer)
+        score as their best-matching vector; the rest by their preview text.
+        The two aren't comparable, so main() passes one kind or the other.
+        """
+        doc_vectors = doc_vectors or {}
+        names = list(doc_previews.keys()) + [n for n in doc_vectors if n not in doc_previews]
+        sims = np.zeros((len(anchors), len(names)), dtype=np.float32)
+        if not names: return [], sims
+        text_cols = [i for i, n in enumerate(names) if n not in doc_vectors]
+        with stage_trace.stage("gating_encode", items=len(anchors) + len(text_cols), queries=len(anchors),
+                               docs=len(names), batch_size=batch_size):
+            q_emb = _encode_norm(self.model, anchors, batch_size=batch_size)  # [Q,d]
+
+            vec_cols = [i for i, n in enumerate(names) if n in doc_vectors]
+            if vec_cols:
+                mats = [doc_vectors[names[i]] for i in vec_cols]
+                starts = np.cumsum([0] + [len(m) for m in mats[:-1]])
+                s = q_emb @ np.concatenate(mats).T                             # [Q, total vectors]
+                sims[:, vec_cols] = np.maximum.reduceat(s, starts, axis=1)
+            if text_cols:
+                p_emb = _encode_norm(self.model, [doc_previews[names[i]] for i in text_cols], batch_size=batch_size)
+                sims[:, text_cols] = q_emb @ p_emb.T                           # [Q,N']
+        return names, sims
 
     def preselect_chunks_lexical(self, anchor, chunks, max_keep=200, min_cov=0.05):
         scored = []
         for c in chunks:
             text = c["text"] if c.get("text","").strip() else c.get("title","")
-            cov = lexical_coverage(anchor, text)
+            cov = lexical_coverage(anchor, text, c.get("tokens"))
             if cov >= min_cov:
                 cc = dict(c); cc["_lex_cov_pre"] = float(cov); scored.append(cc)
         if not scored:
@@ -369,68 +539,144 @@ class MultiQueryRanker:
              min_cross_score=None, min_final_score=None, batch_size=128, shortlist_multiplier=4):
         if not chunks: return []
         anchor = self.build_anchor(persona, task, query) or "related sections"
-
-        anchor_len = len(_tokens(anchor))
-        min_cov = 0.03 if anchor_len >= 8 else 0.01
-        cross_top_m_local = self.cross_top_m if anchor_len >= 8 else max(self.cross_top_m, 64)
-
-        chunks = self.preselect_chunks_lexical(anchor, chunks, max_keep=max(200, top_k*50), min_cov=min_cov)
-
-        texts = [c["text"].strip() if c.get("text","").strip() else c.get("title","") for c in chunks]
-        q_emb = _encode_norm(self.model, [anchor], batch_size=batch_size)
-        c_emb = _encode_norm(self.model, texts, batch_size=batch_size)
-
-        bi_sims = (c_emb @ q_emb.T).ravel()
-        for i, ch in enumerate(chunks): ch["similarity"] = float(bi_sims[i])
-
-        ranked_by_bi = sorted(chunks, key=lambda x: x["similarity"], reverse=True)
-
-        # shortlist — lift per-doc cap when ranking a single PDF
-        doc_counter, shortlist = defaultdict(int), []
-        max_shortlist = max(cross_top_m_local, top_k * shortlist_multiplier)
-        docs_in_pool = {c.get("document","") for c in ranked_by_bi}
-        single_doc_mode = len(docs_in_pool) == 1
-        per_doc_shortlist_cap = max_shortlist if single_doc_mode else max(3, max_chunks_per_doc * 3)
-
-        for ch in ranked_by_bi:
-            d = ch.get("document","")
-            if doc_counter[d] < per_doc_shortlist_cap:
-                shortlist.append(ch); doc_counter[d] += 1
-            if len(shortlist) >= max_shortlist: break
-
-        if not shortlist: return []
-
-        # Cross-encoder scoring (normalize before combining)
-        pairs = [(anchor, c["text"]) for c in shortlist]
-        cross_scores = _predict_cross(self.cross_encoder, pairs, batch_size=max(16, batch_size//2))
-        cross_raw = np.asarray(cross_scores, dtype=np.float32)
-        cross_prob = _sigmoid(cross_raw)                   # [0..1]
-        sim_vals  = np.asarray([c["similarity"] for c in shortlist], dtype=np.float32)
-        sim_norm  = (sim_vals + 1.0) * 0.5                 # [-1,1] -> [0..1]
-
-        alpha_w = 1.0 if anchor_len >= 8 else 1.2
-        beta_w  = 0.35 if anchor_len >= 8 else 0.45
-        gamma_w = 0.25 if anchor_len >= 8 else 0.15
-
-        for i, c in enumerate(shortlist):
-            c["cross_prob"] = float(cross_prob[i])
-            c["sim_norm"]   = float(sim_norm[i])
-            c["lex_cov"]    = float(lexical_coverage(anchor, c["text"]))
-            c["final_score"] = alpha_w * c["cross_prob"] + beta_w * c["sim_norm"] + gamma_w * c["lex_cov"]
-
-        filtered = [
-            c for c in shortlist
-            if (min_cross_score is None or c["cross_prob"] >= min_cross_score)
-            and (min_final_score is None or c["final_score"] >= min_final_score)
-        ]
-        filtered.sort(key=lambda x: x["final_score"], reverse=True)
-
-        per_doc, final = defaultdict(int), []
-        for c in filtered:
-            if per_doc[c["document"]] < max_chunks_per_doc:
-                final.append(c); per_doc[c["document"]] += 1
-            if len(final) >= top_k: break
-        return final
+        return self.rank_batch([anchor], chunks, top_k=top_k, max_chunks_per_doc=max_chunks_per_doc,
+                               min_cross_score=min_cross_score, min_final_score=min_final_score,
+                               batch_size=batch_size, shortlist_multiplier=shortlist_multiplier)[0]
+
+    def rank_batch(self, anchors, chunks, top_k=5, max_chunks_per_doc=2,
+                   min_cross_score=None, min_final_score=None, batch_size=128, shortlist_multiplier=4):
+        """
+        rank() for several anchors over the same chunks: one encode for all
+        anchors, one queries x chunks matrix multiply, and each distinct
+        (anchor, chunk) pair sent to the cross-encoder once.
+        """
+        if not chunks or not anchors: return [[] for _ in anchors]
+        anchors = [a or "related sections" for a in anchors]
+        chunks = [dict(c, _cid=i) for i, c in enumerate(chunks)]
+
+        # Per-anchor lexical preselect, then one encode over the union of survivors
+        pools, plans = [], []
+        with stage_trace.stage("lexical_preselect", items=len(chunks), queries=len(anchors)) as st:
+            for anchor in anchors:
+                anchor_len = len(_tokens(anchor))
+                min_cov = 0.03 if anchor_len >= 8 else 0.01
+                cross_top_m_local = self.cross_top_m if anchor_len >= 8 else max(self.cross_top_m, 64)
+                pools.append(self.preselect_chunks_lexical(anchor, chunks, max_keep=max(200, top_k*50), min_cov=min_cov))
+                plans.append((anchor_len, cross_top_m_local))
+            union = sorted({c["_cid"] for pool in pools for c in pool})
+            st["kept"] = len(union)
+
+        checkpoint("bi_encode")
+        row = {cid: r for r, cid in enumerate(union)}
+        # Long sections are scored as overlapping windows (windowing.py); a section takes its best window
+        win_texts, win_start = [], []
+        for cid in union:
+            text = chunks[cid]["text"].strip() if chunks[cid].get("text","").strip() else chunks[cid].get("title","")
+            win_start.append(len(win_texts))
+            win_texts.extend(windowing.split(text))
+        win_end = win_start[1:] + [len(win_texts)]
+        # the indexer stored the same windows' embeddings (the index checks the settings match)
+        precomputed = all("_emb_rows" in chunks[cid] and
+                          chunks[cid]["_emb_rows"][1] - chunks[cid]["_emb_rows"][0] == win_end[r] - win_start[r]
+                          for r, cid in enumerate(union))
+        with stage_trace.stage("bi_encode", items=len(anchors) + (0 if precomputed else len(win_texts)),
+                               chunks=len(union), windows=len(win_texts), precomputed=precomputed,
+                               batch_size=batch_size):
+            q_emb = _encode_norm(self.model, anchors, batch_size=batch_size)          # [Q,d]
+            if precomputed:
+                # scored straight from the indexer's stored (possibly int8/float16) matrices, one dot per document
+                win_sims = np.empty((len(anchors), len(win_texts)), dtype=np.float32)  # [Q,W]
+                by_store = defaultdict(list)
+                for r, cid in enumerate(union):
+                    by_store[id(chunks[cid]["_emb_store"])].append(r)
+                for rs in by_store.values():
+                    store = chunks[union[rs[0]]]["_emb_store"]
+                    rows = np.concatenate([np.arange(*chunks[union[r]]["_emb_rows"]) for r in rs])
+                    cols = np.concatenate([np.arange(win_start[r], win_end[r]) for r in rs])
+                    win_sims[:, cols] = store.dot(q_emb, rows=rows).T
+            else:
+                w_emb = _encode_norm(self.model, win_texts, batch_size=batch_size)   # [W,d]
+                win_sims = q_emb @ w_emb.T                                            # [Q,W]
+            bi_sims = np.maximum.reduceat(win_sims, win_start, axis=1)                # [Q,U]
+
+        shortlists = []
+        for qi, pool in enumerate(pools):
+            anchor_len, cross_top_m_local = plans[qi]
+            pool = [dict(c) for c in pool]
+            for ch in pool: ch["similarity"] = float(bi_sims[qi, row[ch["_cid"]]])
+
+            ranked_by_bi = sorted(pool, key=lambda x: x["similarity"], reverse=True)
+
+            # shortlist — lift per-doc cap when ranking a single PDF
+            doc_counter, shortlist = defaultdict(int), []
+            max_shortlist = max(cross_top_m_local, top_k * shortlist_multiplier)
+            docs_in_pool = {c.get("document","") for c in ranked_by_bi}
+            single_doc_mode = len(docs_in_pool) == 1
+            per_doc_shortlist_cap = max_shortlist if single_doc_mode else max(3, max_chunks_per_doc * 3)
+
+            for ch in ranked_by_bi:
+                d = ch.get("document","")
+                if doc_counter[d] < per_doc_shortlist_cap:
+                    shortlist.append(ch); doc_counter[d] += 1
+                if len(shortlist) >= max_shortlist: break
+            shortlists.append(shortlist)
+
+        # Cross-encoder scoring over distinct pairs (normalize before combining); a windowed
+        # section sends its best few windows by similarity
+        pair_index = {}
+        for qi, shortlist in enumerate(shortlists):
+            for c in shortlist:
+                r = row[c["_cid"]]
+                windows = win_texts[win_start[r]:win_end[r]]
+                if len(windows) == 1:
+                    c["_cross_texts"] = [c["text"]]
+                else:
+                    best = np.argsort(-win_sims[qi, win_start[r]:win_end[r]], kind="stable")[:windowing.CROSS_WINDOWS]
+                    c["_cross_texts"] = [windows[i] for i in best]
+                for t in c["_cross_texts"]:
+                    pair_index.setdefault((anchors[qi], t), len(pair_index))
+        checkpoint("cross_encode")
+        cross_batch = max(16, batch_size//2) if batch_size else None
+        cross_encoder = self.cross_encoder if pair_index else None
+        with stage_trace.stage("cross_encode", items=len(pair_index), batch_size=cross_batch):
+            if pair_index:
+                cross_scores = _predict_cross(cross_encoder, list(pair_index), batch_size=cross_batch)
+            else:
+                cross_scores = np.zeros(0, dtype=np.float32)
+        cross_all = _sigmoid(np.asarray(cross_scores, dtype=np.float32))  # [0..1]
+
+        results = []
+        for qi, shortlist in enumerate(shortlists):
+            if not shortlist:
+                results.append([]); continue
+            anchor, (anchor_len, _) = anchors[qi], plans[qi]
+            cross_prob = [max(cross_all[pair_index[(anchor, t)]] for t in c["_cross_texts"]) for c in shortlist]
+            sim_vals  = np.asarray([c["similarity"] for c in shortlist], dtype=np.float32)
+            sim_norm  = (sim_vals + 1.0) * 0.5                 # [-1,1] -> [0..1]
+
+            scale = (1.0, 1.0, 1.0) if anchor_len >= 8 else SHORT_ANCHOR_SCALE
+            alpha_w, beta_w, gamma_w = (w * s for w, s in zip((self.alpha, self.beta, self.gamma), scale))
+
+            for i, c in enumerate(shortlist):
+                c["cross_prob"] = float(cross_prob[i])
+                c["sim_norm"]   = float(sim_norm[i])
+                c["lex_cov"]    = float(lexical_coverage(anchor, c["text"]))
+                c["final_score"] = alpha_w * c["cross_prob"] + beta_w * c["sim_norm"] + gamma_w * c["lex_cov"]
+
+            filtered = [
+                c for c in shortlist
+                if (min_cross_score is None or c["cross_prob"] >= min_cross_score)
+                and (min_final_score is None or c["final_score"] >= min_final_score)
+            ]
+            filtered.sort(key=lambda x: x["final_score"], reverse=True)
+
+            per_doc, final = defaultdict(int), []
+            for c in filtered:
+                if per_doc[c["document"]] < max_chunks_per_doc:
+                    final.append(c); per_doc[c["document"]] += 1
+                if len(final) >= top_k: break
+            results.append(final)
+        return results
 
 # --------------------------
 # Per-PDF processing (now writes per-SECTION files immediately)
@@ -439,8 +685,9 @@ def process_single_pdf(pdf_path, file_name, ranker, persona, task, output_dir,
                        top_k=5, min_words=8,
                        min_cross_score=None, min_final_score=None,
                        max_chunks_per_doc=2, max_pages_per_doc=None, batch_size=128,
-                       query=None):
-    chunks = extract_pdf_text_chunks(pdf_path, max_pages_per_doc=max_pages_per_doc)
+                       query=None, chunks=None):
+    if chunks is None:
+        chunks = extract_pdf_text_chunks(pdf_path, max_pages_per_doc=max_pages_per_doc)
     if not chunks:
         return None
 
@@ -455,6 +702,9 @@ def process_single_pdf(pdf_path, file_name, ranker, persona, task, output_dir,
         min_final_score=min_final_score,
         batch_size=batch_size
     )
+    return write_section_outputs(ranked, file_name, output_dir, query=query, min_words=min_words)
+
+def write_section_outputs(ranked, file_name, output_dir, query=None, min_words=8):
     if not ranked:
         return None
 
@@ -474,30 +724,163 @@ def process_single_pdf(pdf_path, file_name, ranker, persona, task, output_dir,
     ordinals = ["first","second","third","fourth","fifth","sixth","seventh","eighth","ninth","tenth"]
 
     results = []
-    for idx, section in enumerate(cleaned):
-        per_section_result = {
-            "metadata": {
-                "source_file": file_name,
-                "query": query or ""
-            },
-            "extracted_sections": format_extracted_sections([{
-                "document": section["document"],
-                "title": section["title"],
-                "text": section["text"],
-                "page": section["page"]
-            }])
-        }
-
-        # filename: PDFName_first.json, PDFName_second.json, ...
-        suffix = f"_{ordinals[idx]}" if idx < len(ordinals) else f"_{idx+1}"
-        out_name = f"{base_pdf_name}{suffix}.json"
-        out_path = os.path.join(output_dir, out_name)
-        atomic_write_json(per_section_result, out_path)
-        results.append(per_section_result)
+    with stage_trace.stage("write_outputs", items=len(cleaned), doc=file_name):
+        for idx, section in enumerate(cleaned):
+            per_section_result = {
+                "metadata": {
+                    "source_file": file_name,
+                    "query": query or ""
+                },
+                "extracted_sections": format_extracted_sections([{
+                    "document": section["document"],
+                    "title": section["title"],
+                    "text": section["text"],
+                    "page": section["page"],
+                    "duplicates": section.get("duplicates")
+                }])
+            }
+
+            # filename: PDFName_first.json, PDFName_second.json, ...
+            suffix = f"_{ordinals[idx]}" if idx < len(ordinals) else f"_{idx+1}"
+            out_name = f"{base_pdf_name}{suffix}.json"
+            out_path = os.path.join(output_dir, out_name)
+            atomic_write_json(per_section_result, out_path)
+            results.append(per_section_result)
 
 
     return results if results else None
 
+def load_doc_chunks(fnames, pdfs_dir, indexed=None, max_pages_per_doc=None, dedup_threshold=0.9):
+    """
+    {name: chunks} for `fnames` (from the index when possible), with near-duplicate
+    chunks across all of them collapsed. Returns (chunks_by_doc, failed names).
+    """
+    indexed = indexed or {}
+    chunks_by_doc, failed = {}, []
+    for fname in fnames:
+        checkpoint("parse")
+        entry = indexed.get(fname)
+        from_index = entry is not None and max_pages_per_doc is None
+        try:
+            with stage_trace.stage("parse", doc=fname, source="index" if from_index else "pdf") as st:
+                if from_index:
+                    chunks = indexed_chunks(entry)
+                else:
+                    chunks = extract_pdf_text_chunks(os.path.join(pdfs_dir, fname), max_pages_per_doc=max_pages_per_doc)
+                st["items"] = len(chunks)
+            for c in chunks: c["document"] = fname
+            chunks_by_doc[fname] = chunks
+        except Exception as e:
+            _report_failure("parse", fname, e)
+            failed.append(fname)
+    if dedup_threshold and dedup_threshold > 0:
+        order = [f for f in fnames if f in chunks_by_doc]
+        with stage_trace.stage("dedup", items=sum(len(v) for v in chunks_by_doc.values())) as st:
+            chunks_by_doc, rep = dedup.collapse(chunks_by_doc, order, threshold=dedup_threshold)
+            st["kept"] = rep["chunks_out"]
+        if rep["encoder_calls_saved"]:
+            print(f"Dedup: {rep['chunks_in']} -> {rep['chunks_out']} chunks "
+                  f"({rep['encoder_calls_saved']} encoder calls saved).")
+    return chunks_by_doc, failed
+
+def _report_failure(stage_name, fname, exc):
+    """A document that produced no output: say why on stderr and in the stage trace."""
+    print(f"Warning: {stage_name} failed for {fname}: {type(exc).__name__}: {exc}", file=sys.stderr)
+    stage_trace.error(stage_name, fname, exc)
+
+def indexed_chunks(entry):
+    """Chunks of an index entry, each pointing at its window rows of the stored (still quantized) embeddings."""
+    store = entry["chunk_embs"]
+    bounds = [int(s) for s in entry["window_starts"]] + [len(store)]
+    return [dict(c, _emb_store=store, _emb_rows=(bounds[i], bounds[i + 1])) for i, c in enumerate(entry["chunks"])]
+
+# --------------------------
+# Batch mode: several queries in one run
+# --------------------------
+def batch_queries(input_data, persona, task):
+    """
+    The "queries" list of input.json, or None for a single-query run. Items are
+    strings or {id?, selected_text, persona?, task?}; persona/task default to
+    the top-level ones.
+    """
+    items = input_data.get("queries")
+    if not isinstance(items, list) or not items: return None
+    out = []
+    for n, q in enumerate(items, 1):
+        if isinstance(q, str): q = {"selected_text": q}
+        if not isinstance(q, dict): continue
+        out.append({
+            "id": _shorten_filename_component(str(q.get("id") or f"q{n}")),
+            "query": re.sub(r"\s+", " ", str(q.get("selected_text") or "")).strip(),
+            "persona": q.get("persona", persona),
+            "task": q.get("task", task),
+        })
+    return out
+
+def select_docs(doc_scores_list, pdf_files, max_docs=None, doc_threshold=None):
+    selected_docs = []
+    if doc_scores_list:
+        doc_scores_list = sorted(doc_scores_list, key=lambda x: x[1], reverse=True)
+        for name, score in doc_scores_list:
+            if (doc_threshold is not None) and (score < float(doc_threshold)): continue
+            selected_docs.append(name)
+            if max_docs is not None and len(selected_docs) >= int(max_docs): break
+        if not selected_docs:
+            take = min(len(doc_scores_list), max_docs or 3)
+            selected_docs = [name for name, _ in doc_scores_list[:take]]
+    else:
+        selected_docs = pdf_files[: (max_docs or len(pdf_files))]
+    return selected_docs
+
+def run_batch(queries, ranker, pdfs_dir, pdf_files, output_dir, doc_previews, doc_vectors=None,
+              indexed=None, top_k=5, per_doc_k=2, min_cross_score=None, min_final_score=None,
+              min_words=8, max_docs=None, doc_threshold=None, max_pages_per_doc=None, batch_size=128,
+              dedup_threshold=0.9):
+    """
+    Every query gets the single-query treatment, with its per-section files
+    in <output_dir>/<query id>/ and one line in <output_dir>/results.ndjson,
+    but each PDF is parsed once and ranked once for all queries that selected it.
+    Returns True if any document failed.
+    """
+    indexed = indexed or {}
+    anchors = [ranker.build_anchor(q["persona"], q["task"], q["query"]) for q in queries]
+    names, sims = ranker.score_documents_batch(doc_previews, anchors, batch_size=batch_size,
+                                               doc_vectors=doc_vectors)
+    selected = [select_docs(list(zip(names, sims[qi])) if names else [], pdf_files, max_docs, doc_threshold)
+                for qi in range(len(queries))]
+
+    sections = [[] for _ in queries]
+    needed = [f for f in pdf_files if any(f in sel for sel in selected)]  # shortest first
+    chunks_by_doc, failed_docs = load_doc_chunks(needed, pdfs_dir, indexed, max_pages_per_doc, dedup_threshold)
+    failed = bool(failed_docs)
+    for fname in needed:
+        checkpoint("rank")
+        wanted = [qi for qi in range(len(queries)) if fname in selected[qi]]
+        chunks = chunks_by_doc.get(fname)
+        if not chunks: continue
+        try:
+            ranked = ranker.rank_batch([anchors[qi] for qi in wanted], chunks, top_k=top_k,
+                                       max_chunks_per_doc=per_doc_k, min_cross_score=min_cross_score,
+                                       min_final_score=min_final_score, batch_size=batch_size)
+            for qi, r in zip(wanted, ranked):
+                q = queries[qi]
+                written = write_section_outputs(r, fname, os.path.join(output_dir, q["id"]),
+                                                query=q["query"], min_words=min_words)
+                sections[qi].extend(written or [])
+        except Exception as e:
+            _report_failure("rank", fname, e)
+            failed = True
+
+    ndjson = os.path.join(output_dir, "results.ndjson")
+    with open(ndjson + ".tmp", "w", encoding="utf-8") as f:
+        for qi, q in enumerate(queries):
+            f.write(json.dumps(_to_jsonable({
+                "query_id": q["id"], "query": q["query"], "documents": selected[qi],
+                "sections": sections[qi]
+            }), ensure_ascii=False) + "\n")
+    os.replace(ndjson + ".tmp", ndjson)
+    return failed
+
 # --------------------------
 # Main
 # --------------------------
@@ -506,7 +889,7 @@ def matches_any_pattern(name, patterns):
 
 def get_page_count_safe(pdf_path):
     try:
-        with pdfplumber.open(pdf_path) as pdf: return len(pdf.pages)
+        with _get_pdfplumber().open(pdf_path) as pdf: return len(pdf.pages)
     except Exception: return float('inf')
 
 def main(input_dir, output_dir, model_dir,
@@ -516,7 +899,9 @@ def main(input_dir, output_dir, model_dir,
          max_docs=None, doc_threshold=None,
          allow_docs=None, deny_docs=None,
          preview_pages=2, max_pages_per_doc=None,
-         batch_size=128, quantize_int8=False):
+         batch_size=128, quantize_int8=False, use_cache=True, index_dir=None, dedup_threshold=0.9,
+         ranker=None):
+    """`ranker`: an already loaded MultiQueryRanker to use instead of building one (scheduler.py)."""
     input_json_path = os.path.join(input_dir, "input.json")
     pdfs_dir = os.path.join(input_dir, "PDFs")
     ensure_dir(output_dir)
@@ -532,12 +917,7 @@ def main(input_dir, output_dir, model_dir,
         persona = input_data.get("persona", {}).get("role", "user")
         task    = input_data.get("job_to_be_done", {}).get("task", "summarize")
         enriched_query = enrich_query(input_data)
-
-        ranker = MultiQueryRanker(
-            model_dir=model_dir,
-            alpha=alpha, beta=beta, gamma=gamma, cross_top_m=cross_top_m,
-            quantize_int8=quantize_int8
-        )
+        queries = batch_queries(input_data, persona, task)
     except Exception as e:
         print(f"Error during initialization: {e}")
         return
@@ -562,37 +942,115 @@ def main(input_dir, output_dir, model_dir,
     if not filtered_pdf_files:
         return
 
-    # Order: shortest first
-    filtered_pdf_files.sort(key=lambda f: get_page_count_safe(os.path.join(pdfs_dir, f)))
-
-    # Gating previews
-    doc_previews = {}
-    for name in filtered_pdf_files:
+    # Pre-parsed, pre-embedded documents from the indexer (python/model_2/indexer.py)
+    indexed = {}
+    if index_dir:
+        index = indexer.CorpusIndex(index_dir)
+        with stage_trace.stage("index_load", items=len(filtered_pdf_files)) as st:
+            for name in filtered_pdf_files:
+                try:
+                    entry = index.load(result_cache.file_sha256(os.path.join(pdfs_dir, name)),
+                                       indexer.encoder_id(quantize_int8))
+                except OSError:
+                    entry = None
+                if entry is not None:
+                    indexed[name] = entry
+            st["hits"] = len(indexed)
+    # Summary vectors and preview embeddings score on different scales, so documents are
+    # gated by summary vectors only when every one of them has them (never a mix)
+    summary_gating = bool(indexed) and len(indexed) == len(filtered_pdf_files)
+
+    # Same query, same parameters, same PDF contents -> replay the stored outputs
+    cache_key = None
+    if use_cache:
         try:
-            doc_previews[name] = quick_doc_preview_text(os.path.join(pdfs_dir, name), max_pages=preview_pages)
-        except Exception:
-            doc_previews[name] = ""
+            with stage_trace.stage("cache_lookup", items=len(pdf_files)):
+                cache_key = result_cache.result_key(
+                    {"persona": persona, "task": task, "selected_text": enriched_query,
+                     "queries": queries, "allow_docs": allow_docs, "deny_docs": deny_docs},
+                    {"top_k": top_k, "per_doc_k": per_doc_k, "min_cross_score": min_cross_score,
+                     "min_final_score": min_final_score, "min_words": min_words,
+                     "alpha": alpha, "beta": beta, "gamma": gamma, "cross_top_m": cross_top_m,
+                     "max_docs": max_docs, "doc_threshold": doc_threshold, "preview_pages": preview_pages,
+                     "max_pages_per_doc": max_pages_per_doc, "quantize_int8": bool(quantize_int8),
+                     "dedup_threshold": dedup_threshold, "index_hits": sorted(indexed),
+                     "windowing": windowing.config(),
+                     "prepared": prepared_models.fingerprint(model_dir, quantize_int8),
+                     "model_dir": os.path.abspath(model_dir)},
+                    result_cache.corpus_fingerprint(pdfs_dir, pdf_files),
+                )
+                cached = result_cache.load(cache_key)
+        except OSError:
+            cache_key, cached = None, None
+        if cached is not None:
+            result_cache.replay_outputs(cached, output_dir)
+            print(f"Replayed {len(cached)} cached section outputs.")
+            print(f"Done. Per-section outputs written to: {output_dir}")
+            print(f"SAVED_DIR::{output_dir}", flush=True)
+            return
+
+    checkpoint("load_models")
+    if ranker is None:
+        try:
+            ranker = MultiQueryRanker(
+                model_dir=model_dir,
+                alpha=alpha, beta=beta, gamma=gamma, cross_top_m=cross_top_m,
+                quantize_int8=quantize_int8
+            )
+            ranker.model  # gating needs the bi-encoder whatever happens next; the cross-encoder waits for a shortlist
+        except Exception as e:
+            print(f"Error during initialization: {e}")
+            return
+    if batch_size is None:
+        batch_tuner.ensure_profile(model_dir, quantize_int8)  # no-op once this host has been tuned
 
-    # Build anchor for gating
-    anchor = ranker.build_anchor(persona, task, enriched_query)
-    doc_scores_list = ranker.score_documents(doc_previews, anchor, batch_size=batch_size)
+    # Order: shortest first
+    with stage_trace.stage("page_count_sort", items=len(filtered_pdf_files) - len(indexed)):
+        filtered_pdf_files.sort(key=lambda f: indexed[f]["meta"]["pages"] if f in indexed
+                                else get_page_count_safe(os.path.join(pdfs_dir, f)))
 
-    # Select docs by score (and thresholds)
-    selected_docs = []
-    if doc_scores_list:
-        doc_scores_list.sort(key=lambda x: x[1], reverse=True)
-        for name, score in doc_scores_list:
-            if (doc_threshold is not None) and (score < float(doc_threshold)): continue
-            selected_docs.append(name)
-            if max_docs is not None and len(selected_docs) >= int(max_docs): break
-        if not selected_docs:
-            take = min(len(doc_scores_list), max_docs or 3)
-            selected_docs = [name for name, _ in doc_scores_list[:take]]
+    # Gating previews
+    doc_previews, doc_vectors = {}, {}
+    with stage_trace.stage("preview_extract", pages=preview_pages) as st:
+        for name in filtered_pdf_files:
+            checkpoint("preview_extract")
+            if summary_gating:
+                doc_vectors[name] = indexed[name]["summary_embs"]  # no preview parse for indexed documents
+                continue
+            try:
+                doc_previews[name] = quick_doc_preview_text(os.path.join(pdfs_dir, name), max_pages=preview_pages)
+            except Exception as e:
+                stage_trace.error("preview_extract", name, e)
+                doc_previews[name] = ""
+        st["items"] = len(doc_previews)
+
+    checkpoint("gating")
+    if queries is not None:
+        failed = run_batch(
+            queries, ranker, pdfs_dir, filtered_pdf_files, output_dir, doc_previews,
+            doc_vectors=doc_vectors, indexed=indexed, top_k=top_k, per_doc_k=per_doc_k,
+            min_cross_score=min_cross_score, min_final_score=min_final_score, min_words=min_words,
+            max_docs=max_docs, doc_threshold=doc_threshold, max_pages_per_doc=max_pages_per_doc,
+            batch_size=batch_size, dedup_threshold=dedup_threshold
+        )
+        selected_docs = []
     else:
-        selected_docs = filtered_pdf_files[: (max_docs or len(filtered_pdf_files))]
+        # Build anchor for gating
+        anchor = ranker.build_anchor(persona, task, enriched_query)
+        doc_scores_list = ranker.score_documents(doc_previews, anchor, batch_size=batch_size,
+                                                 doc_vectors=doc_vectors)
+
+        # Select docs by score (and thresholds)
+        selected_docs = select_docs(doc_scores_list, filtered_pdf_files, max_docs, doc_threshold)
+        chunks_by_doc, failed_docs = load_doc_chunks(selected_docs, pdfs_dir, indexed, max_pages_per_doc,
+                                                     dedup_threshold)
+        failed = bool(failed_docs)
+        selected_docs = [f for f in selected_docs if f in chunks_by_doc]
 
     # Process PDFs one by one, writing each per-SECTION file immediately
     for fname in selected_docs:
+        checkpoint("rank")
+        chunks = chunks_by_doc[fname]
         try:
             process_single_pdf(
                 os.path.join(pdfs_dir, fname), fname, ranker, persona, task, output_dir,
@@ -603,10 +1061,19 @@ def main(input_dir, output_dir, model_dir,
                 max_chunks_per_doc=per_doc_k,
                 max_pages_per_doc=max_pages_per_doc,
                 batch_size=batch_size,
-                query=enriched_query
+                query=enriched_query,
+                chunks=chunks
             )
-        except Exception:
-            # Errors are handled silently for individual files, they just won't produce output.
+        except Exception as e:
+            # A failed file just produces no output; the run carries on with the others.
+            _report_failure("rank", fname, e)
+            failed = True
+
+    # A run with a failed file is not stored, so the next request retries it
+    if cache_key and not failed:
+        try:
+            result_cache.save(cache_key, result_cache.collect_outputs(output_dir))
+        except (OSError, ValueError):
             pass
 
     # Final summary file creation is disabled.
@@ -634,28 +1101,58 @@ if __name__ == "__main__":
     parser.add_argument("--deny_docs", nargs="*", default=None, help="Regex patterns; PDFs matching are excluded.")
     parser.add_argument("--preview_pages", type=int, default=2, help="Pages used for document preview gating.")
     parser.add_argument("--max_pages_per_doc", type=int, default=None, help="Hard cap on pages parsed per doc.")
-    parser.add_argument("--batch_size", type=int, default=128, help="Encode batch size on CPU.")
+    parser.add_argument("--batch_size", type=int, default=None,
+                        help="Encode batch size on CPU (default: this host's tuned sizes, see batch_tuner.py).")
     parser.add_argument("--quantize_int8", action="store_true", help="Dynamic INT8 quantization for speed (CPU).")
+    parser.add_argument("--no_cache", action="store_true", help="Ignore and don't update the result cache.")
+    parser.add_argument("--dedup_threshold", type=float, default=0.9,
+                        help="Jaccard similarity at which chunks count as near-duplicates (0 disables).")
+    parser.add_argument("--index_dir", default=os.environ.get("MODEL2_INDEX_DIR"),
+                        help="Corpus index written by indexer.py; indexed PDFs skip parsing and encoding.")
+    parser.add_argument("--trace", default=stage_trace.MODEL2_TRACE,
+                        help="Write a per-stage timing/memory JSON report here (default MODEL2_TRACE).")
+    parser.add_argument("--chrome_trace", default=None, help="Also write Chrome trace events (chrome://tracing) here.")
+    parser.add_argument("--trace_memory", action="store_true",
+                        help="Record peak Python allocations per stage with tracemalloc (slower).")
 
     args = parser.parse_args()
 
-    main(
-        args.input_dir,
-        args.output_dir,
-        args.model_dir,
-        top_k=args.top_k,
-        per_doc_k=args.per_doc_k,
-        min_cross_score=args.min_cross_score,
-        min_final_score=args.min_final_score,
-        min_words=args.min_words,
-        alpha=args.alpha, beta=args.beta, gamma=args.gamma,
-        cross_top_m=args.cross_top_m,
-        max_docs=args.max_docs,
-        doc_threshold=args.doc_threshold,
-        allow_docs=args.allow_docs,
-        deny_docs=args.deny_docs,
-        preview_pages=args.preview_pages,
-        max_pages_per_doc=args.max_pages_per_doc,
-        batch_size=args.batch_size,
-        quantize_int8=args.quantize_int8
-    )
+    tracer = None
+    if args.trace or args.chrome_trace:
+        tracer = stage_trace.activate(stage_trace.Tracer(trace_memory=args.trace_memory))
+        tracer.meta.update({k: v for k, v in vars(args).items() if k not in ("trace", "chrome_trace")})
+    try:
+        main(
+            args.input_dir,
+            args.output_dir,
+            args.model_dir,
+            top_k=args.top_k,
+            per_doc_k=args.per_doc_k,
+            min_cross_score=args.min_cross_score,
+            min_final_score=args.min_final_score,
+            min_words=args.min_words,
+            alpha=args.alpha, beta=args.beta, gamma=args.gamma,
+            cross_top_m=args.cross_top_m,
+            max_docs=args.max_docs,
+            doc_threshold=args.doc_threshold,
+            allow_docs=args.allow_docs,
+            deny_docs=args.deny_docs,
+            preview_pages=args.preview_pages,
+            max_pages_per_doc=args.max_pages_per_doc,
+            batch_size=args.batch_size,
+            quantize_int8=args.quantize_int8,
+            use_cache=not args.no_cache,
+            index_dir=args.index_dir,
+            dedup_threshold=args.dedup_threshold
+        )
+    finally:
+        log_startup()
+        if tracer is not None:
+            tracer.meta["startup_ms"] = STARTUP_MS
+            if thread_budget.current() is not None:
+                tracer.meta["threads"] = thread_budget.current().report()
+            stage_trace.deactivate()
+            try:
+                tracer.write(args.trace, args.chrome_trace)
+            except OSError as e:
+                print(f"Warning: could not write trace: {e}", file=sys.stderr)
@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import time
+import hashlib
+
+# --------------------------
+# Whole-query result cache
+# --------------------------
+# A run's per-section outputs are stored under a key made of the normalized
+# query, the ranker parameters (with the prepared model artifacts and the
+# windowing settings) and a fingerprint of the PDFs' contents, so a repeated
+# request against an unchanged corpus replays them without loading models or
+# parsing anything. Any PDF change alters the fingerprint.
+#
+# File hashes are remembered by (path, size, mtime) in HASH_MEMO_NAME in the
+# cache directory, so a new process doesn't re-read an unchanged corpus to
+# compute the fingerprint.
+
+RESULT_CACHE_VERSION = "model2-results-v1"
+MODEL2_CACHE_DIR = os.environ.get("MODEL2_CACHE_DIR", os.path.join(".cache", "model2", "results"))
+MODEL2_CACHE_TTL = float(os.environ.get("MODEL2_CACHE_TTL", str(7 * 24 * 3600)))
+MODEL2_CACHE_MAX_MB = float(os.environ.get("MODEL2_CACHE_MAX_MB", "128"))
+HASH_MEMO_NAME = "file_hashes.json"
+HASH_MEMO_MAX = 4096  # files remembered; the least recently hashed are dropped
+
+_sha_memo = None  # abspath -> [size, mtime_ns, sha256], read from the cache dir on first use
+
+def _memo_path(cache_dir=None):
+    return os.path.join(cache_dir or MODEL2_CACHE_DIR, HASH_MEMO_NAME)
+
+def _load_memo():
+    global _sha_memo
+    if _sha_memo is None:
+        try:
+            with open(_memo_path(), "r", encoding="utf-8") as f:
+                _sha_memo = {p: list(v) for p, v in json.load(f).items()}
+        except (OSError, ValueError, AttributeError, TypeError):
+            _sha_memo = {}
+    return _sha_memo
+
+def _save_memo():
+    """Merge this process's hashes into the memo file (other processes add theirs too)."""
+    p = _memo_path()
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            merged = json.load(f)
+    except (OSError, ValueError):
+        merged = {}
+    if not isinstance(merged, dict):
+        merged = {}
+    for path, v in _sha_memo.items():
+        merged.pop(path, None)
+        merged[path] = v
+    try:
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(list(merged.items())[-HASH_MEMO_MAX:]), f)
+        os.replace(tmp, p)
+    except OSError:
+        pass
+
+def file_sha256(path, block=1 << 20, persist=True):
+    """Content hash of a file, remembered per (path, size, mtime) across processes."""
+    st = os.stat(path)
+    memo = _load_memo()
+    path = os.path.abspath(path)
+    hit = memo.get(path)
+    if hit is not None and hit[:2] == [st.st_size, st.st_mtime_ns]:
+        return hit[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(block), b""):
+            h.update(buf)
+    memo.pop(path, None)
+    memo[path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+    if persist:
+        _save_memo()
+    return memo[path][2]
+
+def corpus_fingerprint(pdfs_dir, names):
+    """Hash of every PDF's name and contents; independent of where the folder lives."""
+    h = hashlib.sha256()
+    before = dict(_load_memo())
+    for name in sorted(names):
+        sha = file_sha256(os.path.join(pdfs_dir, name), persist=False)
+        h.update(f"{name}\x1f{sha}\x1e".encode("utf-8"))
+    if _sha_memo != before:
+        _save_memo()  # once for the whole corpus
+    return h.hexdigest()
+
+def _norm(v):
+    if isinstance(v, str):
+        return re.sub(r"\s+", " ", v).strip()
+    if isinstance(v, dict):
+        return {k: _norm(x) for k, x in sorted(v.items())}
+    if isinstance(v, (list, tuple)):
+        return [_norm(x) for x in v]
+    return v
+
+def result_key(query, params, fingerprint):
+    payload = json.dumps({"v": RESULT_CACHE_VERSION, "query": _norm(query), "params": _norm(params),
+                          "corpus": fingerprint}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _path(key, cache_dir=None):
+    return os.path.join(cache_dir or MODEL2_CACHE_DIR, key[:2], key + ".json")
+
+def load(key, cache_dir=None):
+    """{file name: section JSON} for a cached run, or None."""
+    p = _path(key, cache_dir)
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if MODEL2_CACHE_TTL > 0 and time.time() - entry.get("created", 0) > MODEL2_CACHE_TTL:
+        try: os.remove(p)
+        except OSError: pass
+        return None
+    try: os.utime(p, None)  # mtime doubles as last-access time for pruning
+    except OSError: pass
+    return entry.get("outputs")
+
+def save(key, outputs, cache_dir=None):
+    p = _path(key, cache_dir)
+    try:
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "outputs": outputs}, f, ensure_ascii=False)
+        os.replace(tmp, p)
+    except OSError:
+        return
+    prune(cache_dir)
+
+def prune(cache_dir=None, max_bytes=int(MODEL2_CACHE_MAX_MB * 1024 * 1024)):
+    """Drop least recently used entries until the cache fits `max_bytes`."""
+    entries = []
+    for root, _, files in os.walk(cache_dir or MODEL2_CACHE_DIR):
+        for n in files:
+            if n.startswith(HASH_MEMO_NAME): continue  # not a result; cheap to keep
+            p = os.path.join(root, n)
+            try:
+                st = os.stat(p); entries.append((st.st_mtime, st.st_size, p))
+            except OSError:
+                pass
+    total = sum(e[1] for e in entries)
+    for _, size, p in sorted(entries):
+        if total <= max_bytes: break
+        try:
+            os.remove(p); total -= size
+        except OSError:
+            pass
+
+def collect_outputs(output_dir):
+    """Every file a run wrote under `output_dir`: parsed JSON for .json, text otherwise."""
+    out = {}
+    for root, _, files in os.walk(output_dir):
+        for name in sorted(files):
+            if not name.endswith((".json", ".ndjson")): continue
+            p = os.path.join(root, name)
+            rel = os.path.relpath(p, output_dir).replace(os.sep, "/")
+            with open(p, "r", encoding="utf-8") as f:
+                out[rel] = json.load(f) if name.endswith(".json") else f.read()
+    return out
+
+def replay_outputs(outputs, output_dir):
+    for rel, data in outputs.items():
+        p = os.path.join(output_dir, *rel.split("/"))
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        with open(p + ".tmp", "w", encoding="utf-8") as f:
+            if isinstance(data, str):
+                f.write(data)
+            else:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(p + ".tmp", p)
@@ -0,0 +1,429 @@
+# python/model_2/scheduler.py
+"""
+Long-lived job scheduler around process_pdf.main.
+
+One process loads the models once and runs several model_2 jobs at a time on
+worker threads, each with its share of a CPU budget (threads_per_job torch
+threads, so workers x threads_per_job ~ cpu_budget; encoding releases the
+GIL, PDF parsing does not). Jobs arrive over a local
+socket as newline-delimited JSON — a Unix socket path, or host:port for TCP —
+and wait in one of two lanes:
+
+    interactive   taken first; one worker is always kept free of bulk jobs
+    bulk          taken when no interactive job waits, or once its head has
+                  waited --bulk_max_wait_s (so it is never starved)
+
+Cancelling a queued job drops it; cancelling a running one stops it at the next
+stage boundary (process_pdf.checkpoint) — files already written stay, nothing
+is cached. `stats` reports queue depth per lane, running jobs and wait / run
+time percentiles.
+
+    python python/model_2/scheduler.py serve python/model_2/models --cpu_budget 8 --workers 4
+    python python/model_2/scheduler.py submit <input_dir> <output_dir> --priority bulk --wait
+    python python/model_2/scheduler.py status <job_id> | cancel <job_id> | stats | shutdown
+
+Requests (one JSON object per line, one JSON reply per line):
+
+    {"op": "submit", "input_dir": ..., "output_dir": ..., "priority": "interactive", "options": {...}}
+    {"op": "status" | "wait" | "cancel", "job_id": ..., "timeout": <wait only>}
+    {"op": "stats"}  {"op": "jobs"}  {"op": "shutdown"}
+"""
+import os, sys, json, time, uuid, socket, argparse, threading, tempfile, socketserver
+from collections import deque, OrderedDict
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+if _HERE not in sys.path: sys.path.insert(0, _HERE)
+import thread_budget
+
+LANES = ("interactive", "bulk")
+DEFAULT_ADDRESS = os.getenv("MODEL2_SCHEDULER") or (
+    os.path.join(tempfile.gettempdir(), "model2-scheduler.sock") if hasattr(socket, "AF_UNIX") else "127.0.0.1:8767")
+KEEP_FINISHED = 500
+LOG_LINES = 50
+# main() keyword arguments a job may set; the models (model_dir, quantize_int8) are the scheduler's
+JOB_OPTIONS = {"top_k", "per_doc_k", "min_cross_score", "min_final_score", "min_words", "alpha", "beta", "gamma",
+               "cross_top_m", "max_docs", "doc_threshold", "allow_docs", "deny_docs", "preview_pages",
+               "max_pages_per_doc", "batch_size", "use_cache", "index_dir", "dedup_threshold"}
+
+def _pcts(xs):
+    xs = sorted(xs)
+    if not xs: return None
+    at = lambda q: round(xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))], 1)
+    return {"p50": at(0.5), "p95": at(0.95), "max": round(xs[-1], 1), "n": len(xs)}
+
+# --------------------------
+# Jobs
+# --------------------------
+class Job:
+    def __init__(self, input_dir, output_dir, lane, options):
+        self.id = uuid.uuid4().hex[:12]
+        self.input_dir, self.output_dir, self.lane, self.options = input_dir, output_dir, lane, options
+        self.state = "queued"
+        self.submitted, self.started, self.finished = time.time(), None, None
+        self.cancel = threading.Event()
+        self.done = threading.Event()
+        self.log = deque(maxlen=LOG_LINES)
+        self.error = None
+
+    def wait_ms(self):
+        end = self.started or time.time()
+        return (end - self.submitted) * 1000.0
+
+    def run_ms(self):
+        return None if self.started is None else ((self.finished or time.time()) - self.started) * 1000.0
+
+    def to_dict(self):
+        return {"job_id": self.id, "state": self.state, "priority": self.lane, "input_dir": self.input_dir,
+                "output_dir": self.output_dir, "submitted": self.submitted, "wait_ms": round(self.wait_ms(), 1),
+                "run_ms": None if self.run_ms() is None else round(self.run_ms(), 1), "error": self.error,
+                "log": list(self.log)[-10:]}
+
+class _ThreadStdout:
+    """sys.stdout stand-in sending a worker thread's prints to its job's log, everything else through."""
+
+    def __init__(self, real):
+        self.real = real
+        self.local = threading.local()
+
+    def write(self, s):
+        job = getattr(self.local, "job", None)
+        if job is None:
+            return self.real.write(s)
+        buf = getattr(self.local, "partial", "") + s
+        *lines, self.local.partial = buf.split("\n")
+        job.log.extend(l for l in lines if l.strip())
+        return len(s)
+
+    def flush(self):
+        if getattr(self.local, "job", None) is None:
+            self.real.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+# --------------------------
+# Scheduler
+# --------------------------
+class Scheduler:
+    def __init__(self, model_dir, workers=2, threads_per_job=1, cpu_budget=None, quantize_int8=False,
+                 bulk_max_wait_s=60.0):
+        self.model_dir = model_dir
+        self.workers = max(1, int(workers))
+        self.threads_per_job = max(1, int(threads_per_job))
+        self.cpu_budget = cpu_budget
+        self.quantize_int8 = quantize_int8
+        self.bulk_max_wait_s = float(bulk_max_wait_s)
+        self.max_bulk = self.workers - 1 if self.workers > 1 else 1
+        self.cond = threading.Condition()
+        self.queues = {lane: deque() for lane in LANES}
+        self.running = {lane: 0 for lane in LANES}
+        self.jobs = OrderedDict()
+        self.waits = {lane: deque(maxlen=1000) for lane in LANES}
+        self.runs = {lane: deque(maxlen=1000) for lane in LANES}
+        self.finished = {"done": 0, "failed": 0, "cancelled": 0}
+        self.started_at = time.time()
+        self.stopping = False
+        self.pp = self.ranker = None
+        self._threads = []
+
+    def start(self):
+        """Load the models once, then start the workers."""
+        import process_pdf as pp
+        self.pp = pp
+        self.ranker = pp.MultiQueryRanker(model_dir=self.model_dir, quantize_int8=self.quantize_int8)
+        self.ranker.model, self.ranker.cross_encoder  # shared by every job from here on
+        pp.log_startup()
+        if not isinstance(sys.stdout, _ThreadStdout):
+            sys.stdout = _ThreadStdout(sys.stdout)
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"model2-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            for lane in LANES:
+                while self.queues[lane]:
+                    self._finish(self.queues[lane].popleft(), "cancelled", "scheduler stopped")
+            for job in self.jobs.values():
+                job.cancel.set()
+            self.cond.notify_all()
+
+    # ---- requests ----
+    def submit(self, input_dir, output_dir, priority="interactive", options=None):
+        if priority not in LANES:
+            raise ValueError(f"priority must be one of {', '.join(LANES)}")
+        options = dict(options or {})
+        unknown = set(options) - JOB_OPTIONS
+        if unknown:
+            raise ValueError(f"unknown options: {', '.join(sorted(unknown))}")
+        if not os.path.isfile(os.path.join(input_dir, "input.json")):
+            raise ValueError(f"no input.json in {input_dir}")
+        out = os.path.abspath(output_dir)
+        with self.cond:
+            if self.stopping:
+                raise ValueError("scheduler is shutting down")
+            # main() clears its output directory, so two live jobs can't share one
+            if any(j.state in ("queued", "running") and os.path.abspath(j.output_dir) == out for j in self.jobs.values()):
+                raise ValueError(f"output_dir {output_dir} is in use by another job")
+            job = Job(input_dir, output_dir, priority, options)
+            self.jobs[job.id] = job
+            self.queues[priority].append(job)
+            self._trim()
+            self.cond.notify()
+        return job
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"no such job: {job_id}")
+        return job
+
+    def cancel(self, job_id):
+        with self.cond:
+            job = self.get(job_id)
+            if job.state == "queued":
+                self.queues[job.lane].remove(job)
+                self._finish(job, "cancelled")
+            elif job.state == "running":
+                job.cancel.set()  # honoured at the job's next stage boundary
+        return job
+
+    def status(self, job_id):
+        with self.cond:
+            job = self.get(job_id)
+            d = job.to_dict()
+            if job.state == "queued":
+                d["position"] = list(self.queues[job.lane]).index(job)
+            d["cancel_requested"] = job.cancel.is_set()
+            return d
+
+    def stats(self):
+        with self.cond:
+            now = time.time()
+            return {
+                "uptime_s": round(now - self.started_at, 1), "workers": self.workers,
+                "threads_per_job": self.threads_per_job, "cpu_budget": self.cpu_budget, "max_bulk": self.max_bulk,
+                "queued": {lane: len(q) for lane, q in self.queues.items()},
+                "oldest_wait_ms": {lane: round((now - q[0].submitted) * 1000.0, 1) if q else None
+                                   for lane, q in self.queues.items()},
+                "running": dict(self.running), "finished": dict(self.finished),
+                "wait_ms": {lane: _pcts(self.waits[lane]) for lane in LANES},
+                "run_ms": {lane: _pcts(self.runs[lane]) for lane in LANES},
+            }
+
+    # ---- internals (call with self.cond held) ----
+    def _trim(self):
+        done = [jid for jid, j in self.jobs.items() if j.done.is_set()]
+        for jid in done[:max(0, len(done) - KEEP_FINISHED)]:
+            del self.jobs[jid]
+
+    def _finish(self, job, state, error=None):
+        job.state, job.error, job.finished = state, error, time.time()
+        self.finished[state] += 1
+        job.done.set()
+
+    def _next_job(self):
+        interactive, bulk = self.queues["interactive"], self.queues["bulk"]
+        bulk_ok = bool(bulk) and self.running["bulk"] < self.max_bulk
+        aged = bulk_ok and time.time() - bulk[0].submitted >= self.bulk_max_wait_s
+        if interactive and not aged:
+            return interactive.popleft()
+        if bulk_ok:
+            return bulk.popleft()
+        return None
+
+    # ---- workers ----
+    def _worker(self):
+        pp = self.pp
+        while True:
+            with self.cond:
+                job = None
+                while not self.stopping:
+                    job = self._next_job()
+                    if job is not None: break
+                    self.cond.wait(timeout=1.0)  # also re-checks bulk ageing
+                if job is None:
+                    return
+                job.state, job.started = "running", time.time()
+                self.running[job.lane] += 1
+                self.waits[job.lane].append(job.wait_ms())
+            state, error = self._run(pp, job)
+            with self.cond:
+                self.running[job.lane] -= 1
+                self._finish(job, state, error)
+                self.runs[job.lane].append(job.run_ms())
+                self.cond.notify_all()  # a bulk slot may have freed up
+
+    def _run(self, pp, job):
+        opts = job.options
+        ranker = self.ranker.with_weights(opts.get("alpha"), opts.get("beta"), opts.get("gamma"), opts.get("cross_top_m"))
+        pp._job.cancel = job.cancel
+        sys.stdout.local.job = job
+        try:
+            pp.main(job.input_dir, job.output_dir, self.model_dir, quantize_int8=self.quantize_int8,
+                    ranker=ranker, **dict({"batch_size": None}, **opts))
+        except pp.Cancelled as c:
+            return "cancelled", f"cancelled before {c}"
+        except Exception as e:
+            return "failed", f"{type(e).__name__}: {e}"
+        finally:
+            pp._job.cancel = None
+            sys.stdout.local.job = None
+            sys.stdout.local.partial = ""
+        if not any(line.startswith("SAVED_DIR::") for line in job.log):
+            return "failed", next((l for l in reversed(job.log) if "rror" in l or "Skipping" in l), "no outputs")
+        return "done", None
+
+# --------------------------
+# Local socket protocol
+# --------------------------
+def parse_address(address):
+    """'host:port' -> TCP, anything else -> Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and os.path.sep not in host:
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    return socket.AF_UNIX, address
+
+def handle(scheduler, req):
+    op = req.get("op")
+    if op == "submit":
+        job = scheduler.submit(req["input_dir"], req["output_dir"], req.get("priority", "interactive"),
+                               req.get("options"))
+        if req.get("wait"):
+            job.done.wait(req.get("timeout"))
+        return scheduler.status(job.id)
+    if op == "status":
+        return scheduler.status(req["job_id"])
+    if op == "wait":
+        scheduler.get(req["job_id"]).done.wait(req.get("timeout"))
+        return scheduler.status(req["job_id"])
+    if op == "cancel":
+        scheduler.cancel(req["job_id"])
+        return scheduler.status(req["job_id"])
+    if op == "stats":
+        return scheduler.stats()
+    if op == "jobs":
+        with scheduler.cond:
+            return {"jobs": [j.to_dict() for j in scheduler.jobs.values()]}
+    raise ValueError(f"unknown op: {op}")
+
+def serve(scheduler, address=DEFAULT_ADDRESS):
+    """Serve requests until a shutdown request; returns the bound address."""
+    family, addr = parse_address(address)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                try:
+                    req = json.loads(raw)
+                    if req.get("op") == "shutdown":
+                        scheduler.stop()
+                        self._reply({"ok": True})
+                        threading.Thread(target=server.shutdown, daemon=True).start()
+                        return
+                    self._reply(dict(handle(scheduler, req), ok=True))
+                except (KeyError, ValueError) as e:
+                    self._reply({"ok": False, "error": str(e.args[0]) if e.args else str(e)})
+                except Exception as e:  # malformed request (not an object, options not a dict, ...)
+                    self._reply({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+        def _reply(self, obj):
+            self.wfile.write((json.dumps(obj) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            try:
+                request(address, {"op": "stats"}, timeout=1.0)
+                raise SystemExit(f"a scheduler is already listening on {addr}")
+            except OSError:
+                os.remove(addr)  # stale socket from a process that is gone
+        server = socketserver.ThreadingUnixStreamServer(addr, Handler)
+    else:
+        server = type("Server", (socketserver.ThreadingTCPServer,), {"allow_reuse_address": True})(addr, Handler)
+    server.daemon_threads = True
+    bound = server.server_address if family == socket.AF_UNIX else f"{server.server_address[0]}:{server.server_address[1]}"
+    print(f"[scheduler] listening on {bound} with {scheduler.workers} workers x {scheduler.threads_per_job} threads",
+          file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.remove(addr)
+    return bound
+
+def request(address, payload, timeout=None):
+    """One request/reply round trip with a running scheduler."""
+    family, addr = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(addr)
+        s.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        with s.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise OSError("scheduler closed the connection")
+    return json.loads(line)
+
+# --------------------------
+# CLI
+# --------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run model_2 jobs from a queue, or talk to a running scheduler.")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="Unix socket path or host:port (default MODEL2_SCHEDULER).")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("serve", help="Load the models and serve jobs.")
+    p.add_argument("model_dir", help="Directory containing local model folders.")
+    p.add_argument("--cpu_budget", type=int, default=None, help="CPUs for all jobs together (default: what the container allows).")
+    p.add_argument("--workers", type=int, default=None, help="Jobs run at once (default: min(4, cpu_budget)).")
+    p.add_argument("--threads_per_job", type=int, default=None, help="torch threads per job (default: cpu_budget // workers).")
+    p.add_argument("--quantize_int8", action="store_true", help="Dynamic INT8 quantization for speed (CPU).")
+    p.add_argument("--bulk_max_wait_s", type=float, default=60.0, help="Bulk jobs waiting this long go ahead of interactive ones.")
+
+    p = sub.add_parser("submit", help="Queue a job.")
+    p.add_argument("input_dir", help="Directory containing 'input.json' and the 'PDFs' folder.")
+    p.add_argument("output_dir")
+    p.add_argument("--priority", choices=LANES, default="interactive")
+    p.add_argument("--options", default=None, help='JSON of main() options, e.g. \'{"top_k": 8}\'.')
+    p.add_argument("--wait", action="store_true", help="Block until the job finishes.")
+    p.add_argument("--timeout", type=float, default=None)
+
+    for name in ("status", "wait", "cancel"):
+        p = sub.add_parser(name)
+        p.add_argument("job_id")
+        if name == "wait": p.add_argument("--timeout", type=float, default=None)
+    sub.add_parser("stats")
+    sub.add_parser("jobs")
+    sub.add_parser("shutdown")
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        budget = args.cpu_budget or thread_budget.usable_cpus()[0]
+        workers = args.workers or max(1, min(4, budget))
+        threads = args.threads_per_job or max(1, budget // workers)
+        os.environ["MODEL2_THREADS"] = str(threads)  # every job's share; read when torch is first imported
+        sched = Scheduler(args.model_dir, workers=workers, threads_per_job=threads, cpu_budget=budget,
+                          quantize_int8=args.quantize_int8, bulk_max_wait_s=args.bulk_max_wait_s).start()
+        serve(sched, args.address)
+        sys.exit(0)
+
+    payload = {"op": args.cmd}
+    if args.cmd == "submit":
+        payload.update(input_dir=os.path.abspath(args.input_dir), output_dir=os.path.abspath(args.output_dir),
+                       priority=args.priority, options=json.loads(args.options) if args.options else None,
+                       wait=args.wait, timeout=args.timeout)
+    elif args.cmd in ("status", "wait", "cancel"):
+        payload["job_id"] = args.job_id
+        if args.cmd == "wait": payload["timeout"] = args.timeout
+    try:
+        reply = request(args.address, payload)
+    except OSError as e:
+        print(f"Error: no scheduler at {args.address}: {e}", file=sys.stderr)
+        sys.exit(2)
+    print(json.dumps(reply, indent=2))
+    sys.exit(0 if reply.get("ok") and reply.get("state") not in ("failed", "cancelled") else 1)
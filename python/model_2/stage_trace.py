@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import threading
+import traceback
+from contextlib import contextmanager
+
+# --------------------------
+# Per-stage timing and memory trace
+# --------------------------
+# Code wraps its stages in `with stage_trace.stage("bi_encode", items=n) as s:`
+# and may add counts to `s` inside the block. Nothing is recorded unless a
+# Tracer is active, so the calls cost one attribute lookup in normal runs.
+#
+# Each stage records wall and CPU time, resident memory at exit, the
+# process's peak RSS so far, and (with trace_memory) the peak of Python
+# allocations inside the stage. The report aggregates stages by name; the
+# Chrome trace (chrome://tracing, Perfetto) shows every span on a timeline.
+
+MODEL2_TRACE = os.environ.get("MODEL2_TRACE")
+
+_active = None
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def _peak_rss_bytes():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB elsewhere
+    except (ImportError, OSError):
+        return None
+
+def _mb(b):
+    return None if b is None else round(b / (1024 * 1024), 2)
+
+class Tracer:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.spans, self.errors, self.meta = [], [], {}
+        self._depth = threading.local()
+        self._t0 = time.perf_counter()
+        self._wall0 = time.time()
+        if trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, **fields):
+        depth = getattr(self._depth, "n", 0)
+        self._depth.n = depth + 1
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.reset_peak()
+            alloc0 = tracemalloc.get_traced_memory()[0]
+        start, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield fields
+        except BaseException as e:
+            fields["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span = {"name": name, "depth": depth, "tid": threading.get_ident(),
+                    "start_ms": (start - self._t0) * 1000.0,
+                    "wall_ms": (time.perf_counter() - start) * 1000.0,
+                    "cpu_ms": (time.process_time() - cpu0) * 1000.0,
+                    "rss_mb": _mb(_rss_bytes()), "peak_rss_mb": _mb(_peak_rss_bytes())}
+            if self.trace_memory:
+                span["py_alloc_peak_mb"] = _mb(tracemalloc.get_traced_memory()[1] - alloc0)
+            span.update(fields)
+            self.spans.append(span)
+            self._depth.n = depth
+
+    def error(self, stage, item, exc):
+        tb = traceback.extract_tb(exc.__traceback__)
+        self.errors.append({"stage": stage, "item": item, "error": f"{type(exc).__name__}: {exc}",
+                            "where": f"{os.path.basename(tb[-1].filename)}:{tb[-1].lineno}" if tb else None})
+
+    def report(self):
+        stages = {}
+        for s in self.spans:
+            a = stages.setdefault(s["name"], {"calls": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "max_wall_ms": 0.0,
+                                              "peak_rss_mb": None, "items": 0, "batch_sizes": []})
+            a["calls"] += 1
+            a["wall_ms"] += s["wall_ms"]; a["cpu_ms"] += s["cpu_ms"]
+            a["max_wall_ms"] = max(a["max_wall_ms"], s["wall_ms"])
+            if s.get("peak_rss_mb") is not None:
+                a["peak_rss_mb"] = max(a["peak_rss_mb"] or 0.0, s["peak_rss_mb"])
+            if "py_alloc_peak_mb" in s:
+                a["py_alloc_peak_mb"] = max(a.get("py_alloc_peak_mb", 0.0), s["py_alloc_peak_mb"] or 0.0)
+            a["items"] += int(s.get("items") or 0)
+            if s.get("batch_size") is not None and s["batch_size"] not in a["batch_sizes"]:
+                a["batch_sizes"].append(s["batch_size"])
+        for a in stages.values():
+            a["wall_ms"] = round(a["wall_ms"], 2); a["cpu_ms"] = round(a["cpu_ms"], 2)
+            a["max_wall_ms"] = round(a["max_wall_ms"], 2)
+        total = (time.perf_counter() - self._t0) * 1000.0
+        top = [s for s in self.spans if s["depth"] == 0]
+        return {
+            "started": self._wall0, "total_wall_ms": round(total, 2),
+            "peak_rss_mb": _mb(_peak_rss_bytes()), "meta": self.meta,
+            # stages sorted by time spent, most expensive first
+            "stages": dict(sorted(stages.items(), key=lambda kv: kv[1]["wall_ms"], reverse=True)),
+            "untraced_ms": round(total - sum(s["wall_ms"] for s in top), 2),
+            "errors": self.errors,
+            "spans": [dict(s, start_ms=round(s["start_ms"], 3), wall_ms=round(s["wall_ms"], 3),
+                           cpu_ms=round(s["cpu_ms"], 3)) for s in self.spans],
+        }
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "model_2"}}]
+        for s in self.spans:
+            args = {k: v for k, v in s.items() if k not in ("name", "tid", "start_ms", "wall_ms", "depth")}
+            events.append({"name": s["name"], "cat": "model_2", "ph": "X", "pid": pid, "tid": s["tid"],
+                           "ts": round(s["start_ms"] * 1000.0, 1), "dur": round(s["wall_ms"] * 1000.0, 1),
+                           "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path=None, chrome_path=None):
+        if path:
+            _write_json(path, self.report(), indent=2)
+        if chrome_path:
+            _write_json(chrome_path, self.chrome_trace())
+
+def _write_json(path, data, indent=None):
+    d = os.path.dirname(path)
+    if d: os.makedirs(d, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, default=str)
+    os.replace(path + ".tmp", path)
+
+# ---- module-level hooks used by process_pdf ----
+def activate(tracer):
+    global _active
+    _active = tracer
+    return tracer
+
+def deactivate():
+    global _active
+    _active = None
+
+def active():
+    return _active
+
+@contextmanager
+def stage(name, **fields):
+    if _active is None:
+        yield fields
+        return
+    with _active.stage(name, **fields) as f:
+        yield f
+
+def error(stage_name, item, exc):
+    if _active is not None:
+        _active.error(stage_name, item, exc)
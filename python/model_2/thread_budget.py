@@ -0,0 +1,229 @@
+# python/model_2/thread_budget.py
+"""
+CPU budget for model_2 processes sharing a host or container.
+
+os.cpu_count() reports the machine, not what this process may use: a
+container's cgroup quota (cpu.max, or cfs_quota_us/cfs_period_us on cgroup
+v1) and the affinity mask can both be far smaller, and when several runs
+overlap each one used to claim every core. Here the usable CPUs are the
+smallest of those limits, and each running process holds a slot — an
+flock()ed file under MODEL2_SLOT_DIR, released by the kernel when the process
+exits — so the CPUs can be split among however many are live:
+
+    threads = max(1, usable_cpus // live_workers)
+
+The share is re-checked (at most every REBALANCE_S) before heavy stages, so a
+run that started alone gives threads back when another one arrives. Processes
+that only encode now and then (the LLM scripts' text reducer) take their share
+without holding a slot, so they don't halve everyone else's while they wait
+on other work.
+
+    MODEL2_THREADS=<n>   fixed intra-op thread count; no slot, no sharing
+    MODEL2_PIN_CPUS=1    also restrict each worker to its own slice of CPUs,
+                         by its rank among the live slots
+"""
+import os
+import sys
+import time
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows: no slots, every process assumes it is alone
+    fcntl = None
+
+MAX_SLOTS = 64
+REBALANCE_S = 1.0
+SLOT_DIR = os.getenv("MODEL2_SLOT_DIR", os.path.join(tempfile.gettempdir(), "model2-slots"))
+
+# --------------------------
+# What this process may use
+# --------------------------
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def cgroup_cpu_quota(root="/sys/fs/cgroup"):
+    """CPUs allowed by the cgroup quota (may be fractional), or None when unlimited."""
+    v2 = _read(os.path.join(root, "cpu.max"))
+    if v2:
+        quota, _, period = v2.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    quota = _read(os.path.join(root, "cpu", "cpu.cfs_quota_us")) or _read(os.path.join(root, "cpu.cfs_quota_us"))
+    period = _read(os.path.join(root, "cpu", "cpu.cfs_period_us")) or _read(os.path.join(root, "cpu.cfs_period_us"))
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+def affinity_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return list(range(os.cpu_count() or 1))
+
+def usable_cpus():
+    """(whole CPUs this process may keep busy, the limits that went into it)."""
+    allowed = affinity_cpus()
+    quota = cgroup_cpu_quota()
+    limits = {"cpu_count": os.cpu_count(), "affinity": len(allowed), "cgroup_quota": quota}
+    n = len(allowed)
+    if quota is not None:
+        n = min(n, max(1, int(quota)))  # a fractional remainder can't keep a thread busy
+    return max(1, n), limits
+
+# --------------------------
+# Slots shared with other workers
+# --------------------------
+def _held_by_someone(path):
+    """True if any open file description (ours included) holds the lock on `path`."""
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return False
+    except OSError:
+        return True
+    finally:
+        os.close(fd)
+
+def _set_affinity_all_threads(cpus):
+    """sched_setaffinity(0) only moves the calling thread; move every thread this process already has."""
+    try:
+        tids = [int(t) for t in os.listdir("/proc/self/task")]
+    except OSError:
+        tids = [0]
+    for tid in tids:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except ProcessLookupError:  # the thread exited meanwhile
+            pass
+
+class Budget:
+    def __init__(self, slot_dir=SLOT_DIR, fixed_threads=None, pin=False, register=True):
+        self.slot_dir = slot_dir
+        self.fixed_threads = fixed_threads
+        self.pin = pin
+        self.register = register
+        self.cpus, self.limits = usable_cpus()
+        self.allowed = affinity_cpus()
+        self.slot = None
+        self._fd = None
+        self.workers = 1
+        self.threads = fixed_threads or self.cpus
+        self.pinned = None
+        self._checked = 0.0
+
+    def acquire(self):
+        """Take the lowest free slot; without one (no fcntl, slots exhausted) the process counts itself alone."""
+        if self.fixed_threads or fcntl is None:
+            return self
+        if not self.register:
+            return self.refresh(force=True)
+        try:
+            os.makedirs(self.slot_dir, exist_ok=True)
+        except OSError:
+            return self
+        for i in range(MAX_SLOTS):
+            path = os.path.join(self.slot_dir, f"slot-{i:02d}")
+            try:
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+            except OSError:
+                return self
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            self.slot, self._fd = i, fd
+            break
+        return self.refresh(force=True)
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)  # closing drops the flock
+            self._fd = self.slot = None
+
+    def live_slots(self):
+        """Indices of the slots held right now (ours included), ascending."""
+        try:
+            names = sorted(n for n in os.listdir(self.slot_dir) if n.startswith("slot-"))
+        except OSError:
+            return []
+        return [int(n[5:]) for n in names if n[5:].isdigit() and _held_by_someone(os.path.join(self.slot_dir, n))]
+
+    def live_workers(self, live=None):
+        if self.slot is None and self.register:
+            return 1  # no slot to be found by (no fcntl, slots exhausted): assume alone
+        live = self.live_slots() if live is None else live
+        return max(1, len(live) + (0 if self.register else 1))
+
+    def refresh(self, force=False):
+        """Recompute this worker's share; returns self. Cheap enough to call before every heavy stage."""
+        now = time.monotonic()
+        if self.fixed_threads or (not force and now - self._checked < REBALANCE_S):
+            return self
+        self._checked = now
+        live = self.live_slots() if self.slot is not None or not self.register else []
+        self.workers = self.live_workers(live)
+        self.threads = max(1, self.cpus // self.workers)
+        if self.pin and self.slot in live and len(self.allowed) > self.threads:
+            # slot numbers can have gaps (0 and 2 live); ranks don't, so the slices never overlap
+            start = (live.index(self.slot) * self.threads) % len(self.allowed)
+            cpus = [self.allowed[(start + k) % len(self.allowed)] for k in range(self.threads)]
+            if cpus != self.pinned:
+                try:
+                    _set_affinity_all_threads(cpus)
+                    self.pinned = cpus
+                except (AttributeError, OSError):
+                    self.pinned = None
+        return self
+
+    @property
+    def interop_threads(self):
+        return max(1, self.threads // 2)
+
+    def report(self):
+        return dict(self.limits, usable_cpus=self.cpus, slot=self.slot, live_workers=self.workers,
+                    intra_op_threads=self.threads, inter_op_threads=self.interop_threads, pinned=self.pinned,
+                    effective_parallelism=min(self.threads, len(self.pinned) if self.pinned else self.cpus))
+
+_budget = None
+
+def fixed_threads():
+    """MODEL2_THREADS, or None when the share is worked out from the live slots."""
+    fixed = os.getenv("MODEL2_THREADS", "").strip()
+    return int(fixed) if fixed.isdigit() and int(fixed) > 0 else None
+
+def acquire(register=True, threads=None):
+    """
+    This process's Budget, created and its slot taken on first call.
+    register=False sizes it from the live slots without taking one (and never pins);
+    `threads` fixes the thread count like MODEL2_THREADS does.
+    """
+    global _budget
+    if _budget is None:
+        pin = register and os.getenv("MODEL2_PIN_CPUS", "").strip().lower() in ("1", "true", "yes", "on")
+        _budget = Budget(fixed_threads=threads or fixed_threads(), pin=pin, register=register).acquire()
+    return _budget
+
+def current():
+    return _budget
+
+def format_report(budget):
+    r = budget.report()
+    quota = "none" if r["cgroup_quota"] is None else f"{r['cgroup_quota']:g}"
+    return (f"[model2] threads intra={r['intra_op_threads']} interop={r['inter_op_threads']} "
+            f"workers={r['live_workers']} usable_cpus={r['usable_cpus']} (cpu_count={r['cpu_count']} "
+            f"affinity={r['affinity']} quota={quota})" + (f" pinned={r['pinned']}" if r["pinned"] else ""))
+
+if __name__ == "__main__":
+    b = acquire()
+    print(format_report(b), file=sys.stderr)
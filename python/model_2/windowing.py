@@ -0,0 +1,56 @@
+# python/model_2/windowing.py
+"""
+Overlapping, token-bounded windows over long sections.
+
+extract_pdf_text_chunks makes everything between two headings one section,
+whatever its length, and both encoders stop reading at their maximum sequence
+length — the rest of a long section was tokenized and then ignored. The
+ranker instead scores a long section as windows of about WINDOW_TOKENS tokens
+that overlap by WINDOW_OVERLAP, and the section takes its best window:
+
+    similarity   max over all its windows (bi-encoder)
+    cross_prob   max over its CROSS_WINDOWS best windows by similarity
+
+Sections that fit in one window are scored exactly as before, and outputs
+still carry whole sections. A section that would need more than MAX_WINDOWS
+windows gets MAX_WINDOWS spread evenly over it, so the cost per section is
+bounded. The indexer stores one embedding per window as well, so indexed and
+parsed documents are ranked alike.
+
+    MODEL2_WINDOW_TOKENS=0 scores whole sections again (truncated by the models).
+"""
+import os
+import math
+
+WINDOW_TOKENS = int(os.getenv("MODEL2_WINDOW_TOKENS", "256"))
+WINDOW_OVERLAP = int(os.getenv("MODEL2_WINDOW_OVERLAP", "48"))
+MAX_WINDOWS = 16
+CROSS_WINDOWS = 2
+TOKENS_PER_WORD = 1.3  # WordPiece tokens per whitespace-separated word of English prose
+
+def estimate_tokens(text):
+    return math.ceil(len(text.split()) * TOKENS_PER_WORD)
+
+def split(text, window_tokens=WINDOW_TOKENS, overlap=WINDOW_OVERLAP, max_windows=MAX_WINDOWS):
+    """[text] itself when it fits in one window, else the window texts in reading order."""
+    if window_tokens <= 0:
+        return [text]
+    words = text.split()
+    size = max(1, int(window_tokens / TOKENS_PER_WORD))
+    if len(words) <= size:
+        return [text]
+    step = max(1, size - int(overlap / TOKENS_PER_WORD))
+    n = math.ceil((len(words) - size) / step) + 1
+    if n <= max_windows:
+        starts = [min(i * step, len(words) - size) for i in range(n)]
+    else:
+        starts = [round(i * (len(words) - size) / (max_windows - 1)) for i in range(max_windows)]
+    return [" ".join(words[s:s + size]) for s in starts]
+
+def split_config():
+    """The settings that decide the windows themselves (stored window embeddings must match them)."""
+    return {"window_tokens": WINDOW_TOKENS, "window_overlap": WINDOW_OVERLAP, "max_windows": MAX_WINDOWS}
+
+def config():
+    """The settings that change rankings (for cache keys)."""
+    return dict(split_config(), cross_windows=CROSS_WINDOWS)
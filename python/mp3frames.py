@@ -0,0 +1,124 @@
+# python/mp3frames.py
+"""
+Just enough MPEG audio (Layer III) parsing to splice MP3 streams at frame
+boundaries: walk frame headers, drop ID3 tags and Xing/Info/VBRI header
+frames, and build silent frames that match a stream's format. Concatenating
+CBR streams this way needs no decode or re-encode.
+"""
+from typing import List, NamedTuple, Optional
+
+# bitrate tables (kbps) for Layer III, indexed by the 4-bit bitrate field
+_BITRATES_V1 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0]
+_BITRATES_V2 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0]
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+class Frame(NamedTuple):
+    offset: int
+    length: int
+    version: int      # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    sample_rate: int
+    bitrate: int      # kbps
+    mono: bool
+
+    @property
+    def samples(self)->int:
+        return 1152 if self.version == 3 else 576
+
+    @property
+    def format(self):
+        """Everything two streams must share to be spliced frame by frame."""
+        return (self.version, self.sample_rate, self.bitrate, self.mono)
+
+def _parse_header(data:bytes, i:int)->Optional[Frame]:
+    if i + 4 > len(data) or data[i] != 0xFF or (data[i + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = data[i + 1], data[i + 2], data[i + 3]
+    version = (b1 >> 3) & 0x3
+    layer = (b1 >> 1) & 0x3
+    br_idx = (b2 >> 4) & 0xF
+    sr_idx = (b2 >> 2) & 0x3
+    if version == 1 or layer != 1 or br_idx in (0, 15) or sr_idx == 3:
+        return None  # reserved values, or not Layer III / free format
+    bitrate = (_BITRATES_V1 if version == 3 else _BITRATES_V2)[br_idx]
+    sample_rate = _SAMPLE_RATES[version][sr_idx]
+    padding = (b2 >> 1) & 0x1
+    coef = 144 if version == 3 else 72
+    length = coef * bitrate * 1000 // sample_rate + padding
+    return Frame(i, length, version, sample_rate, bitrate, (b3 >> 6) == 3)
+
+def _side_info_len(f:Frame)->int:
+    if f.version == 3: return 17 if f.mono else 32
+    return 9 if f.mono else 17
+
+def _is_info_frame(data:bytes, f:Frame)->bool:
+    body = data[f.offset + 4 : f.offset + f.length]
+    return body[_side_info_len(f) : _side_info_len(f) + 4] in (b"Xing", b"Info") or body[32:36] == b"VBRI"
+
+def _skip_id3v2(data:bytes)->int:
+    if data[:3] != b"ID3" or len(data) < 10: return 0
+    size = 0
+    for b in data[6:10]: size = (size << 7) | (b & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+def frames(data:bytes)->List[Frame]:
+    """Audio frames of an MP3 stream, without tags or Xing/Info header frames."""
+    out, i, end = [], _skip_id3v2(data), len(data)
+    if data[-128:-125] == b"TAG": end -= 128
+    while i + 4 <= end:
+        f = _parse_header(data, i)
+        # require the next header to line up too, so stray 0xFF bytes aren't taken as sync
+        if f is None or (f.offset + f.length < end and _parse_header(data, f.offset + f.length) is None):
+            i += 1
+            continue
+        if f.offset + f.length > end: break
+        if out or not _is_info_frame(data, f):
+            out.append(f)
+        i += f.length
+    return out
+
+def template(sample_rate:int=48000, kbps:int=192, mono:bool=True)->Frame:
+    """A format description for silence() before any real audio has been seen."""
+    version = 3 if sample_rate in _SAMPLE_RATES[3] else 2 if sample_rate in _SAMPLE_RATES[2] else 0
+    coef = 144 if version == 3 else 72
+    return Frame(0, coef * kbps * 1000 // sample_rate, version, sample_rate, kbps, mono)
+
+def duration_ms(fs:List[Frame])->float:
+    return sum(f.samples * 1000.0 / f.sample_rate for f in fs)
+
+def audio_bytes(data:bytes, fs:List[Frame])->bytes:
+    """The bytes of frames `fs` of `data`, without tags or header frames."""
+    if not fs: return b""
+    if _contiguous(fs): return data[fs[0].offset : fs[-1].offset + fs[-1].length]
+    return b"".join(data[f.offset : f.offset + f.length] for f in fs)
+
+def silence(template:Frame, duration_ms:float)->bytes:
+    """Silent frames in `template`'s format: zeroed side info means no coded samples."""
+    header = bytes([0xFF, 0xE0 | (template.version << 3) | (1 << 1) | 1,
+                    ((_BITRATES_V1 if template.version == 3 else _BITRATES_V2).index(template.bitrate) << 4)
+                    | (_SAMPLE_RATES[template.version].index(template.sample_rate) << 2),
+                    0xC0 if template.mono else 0x00])
+    coef = 144 if template.version == 3 else 72
+    frame = header + bytes(coef * template.bitrate * 1000 // template.sample_rate - 4)
+    frame_ms = template.samples * 1000.0 / template.sample_rate
+    return frame * max(0, round(duration_ms / frame_ms))
+
+def concat(streams:List[bytes], gap_ms:float=0.0, lead_ms:float=0.0)->Optional[bytes]:
+    """
+    Splice MP3 streams with silence before the first and after each one.
+    Returns None when the streams don't all share one format (or aren't MP3),
+    in which case the caller has to decode and re-encode instead.
+    """
+    parsed = [(s, frames(s)) for s in streams]
+    if not parsed or any(not fs for _, fs in parsed): return None
+    template = parsed[0][1][0]
+    if any(f.format != template.format for _, fs in parsed for f in fs): return None
+    gap = silence(template, gap_ms)
+    parts = [silence(template, lead_ms)]
+    for s, fs in parsed:
+        parts.append(audio_bytes(s, fs))
+        parts.append(gap)
+    return b"".join(parts)
+
+def _contiguous(fs:List[Frame])->bool:
+    return all(a.offset + a.length == b.offset for a, b in zip(fs, fs[1:]))
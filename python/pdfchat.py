@@ -3,54 +3,29 @@ import os
 import json
 import re
 from io import BytesIO
-from typing import Dict
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
 
 import requests
 import pdfplumber
 
-LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini").lower()
-GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
-GOOGLE_APPLICATION_CREDENTIALS = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "")
-GOOGLE_CLOUD_PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT", "")
-GOOGLE_CLOUD_REGION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
+import llm_client
+import text_reducer
+from llm_cache import cached_call, make_key, log_stats
 
-if LLM_PROVIDER != "gemini":
-    print("Error: LLM_PROVIDER must be 'gemini' for pdfchat.py", file=sys.stderr)
-    sys.exit(1)
+# Bump whenever the prompts below change so cached answers are not reused.
+CHAT_PROMPT_VERSION = "chat-v1"
+CHAT_SESSION_PROMPT_VERSION = "chat-session-v1"
 
-if not GOOGLE_APPLICATION_CREDENTIALS:
-    print("Error: GOOGLE_APPLICATION_CREDENTIALS not set", file=sys.stderr)
-    sys.exit(1)
+# Session mode (--session): retrieval and conversation memory
+CHAT_CONTEXT_CHARS = int(os.environ.get("CHAT_CONTEXT_CHARS", "2000"))
+CHAT_CHUNK_CHARS = int(os.environ.get("CHAT_CHUNK_CHARS", "700"))
+CHAT_HISTORY_TURNS = int(os.environ.get("CHAT_HISTORY_TURNS", "4"))
+CHAT_SUMMARY_CHARS = int(os.environ.get("CHAT_SUMMARY_CHARS", "1200"))
+CHAT_RETRY_S = float(os.environ.get("CHAT_RETRY_S", "30"))  # a PDF that failed to load is fetched again after this
 
-# ---- Vertex init (lazy) ----
-_vertex_model = None
-
-def _read_project_from_sa(json_path: str) -> str:
-    try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data.get("project_id") or data.get("projectId") or ""
-    except Exception:
-        return ""
-
-def _init_vertex_if_needed():
-    global _vertex_model
-    if _vertex_model is not None:
-        return
-    try:
-        from vertexai import init as vertex_init
-        from vertexai.generative_models import GenerativeModel
-    except Exception as e:
-        print(f"Error: Vertex AI SDK not installed: {e}", file=sys.stderr)
-        sys.exit(1)
-
-    project = GOOGLE_CLOUD_PROJECT or _read_project_from_sa(GOOGLE_APPLICATION_CREDENTIALS)
-    if project:
-        vertex_init(project=project, location=GOOGLE_CLOUD_REGION)
-    else:
-        vertex_init(location=GOOGLE_CLOUD_REGION)
-
-    _vertex_model = GenerativeModel(GEMINI_MODEL)
+llm_client.require_config("pdfchat.py")
 
 # ---- PDF utils ----
 def extract_pdf_text(pdf_url: str) -> str:
@@ -107,20 +82,25 @@ def _extract_json_object(s: str) -> Dict:
     return {"answer": raw[:1000]}
 
 # ---- Core Q&A ----
-def chat_pdf(pdf_url: str, question: str) -> Dict:
+def chat_pdf(pdf_url: str, question: str, use_cache: bool = True) -> Dict:
     pdf_text = extract_pdf_text(pdf_url)
     if not pdf_text:
         return {"answer": "Failed to extract text from the PDF."}
 
     # Keep input size modest (as in your original)
     context = pdf_text[:2000]
+    key = make_key(llm_client.model_id(), CHAT_PROMPT_VERSION, context, question)
+    return cached_call(key, lambda: _answer(context, question), bypass=not use_cache,
+                       should_store=lambda obj: not obj.get("_error"))
 
+def _answer(context: str, question: str, history: str = "") -> Dict:
+    convo = f"\nConversation so far:\n{history}\n" if history else ""
     prompt = f"""
 You are an AI assistant. A user wants to ask a question about the PDF content below.
 
 PDF Content:
 {context}
-
+{convo}
 Question: {question}
 
 Provide a concise and clear answer grounded in the PDF content. Return strictly as JSON:
@@ -130,22 +110,7 @@ Provide a concise and clear answer grounded in the PDF content. Return strictly
 """.strip()
 
     try:
-        _init_vertex_if_needed()
-        resp = _vertex_model.generate_content(prompt)
-
-        # Prefer resp.text when available; otherwise inspect candidates
-        answer_text = None
-        if hasattr(resp, "text") and resp.text:
-            answer_text = resp.text
-        else:
-            cands = getattr(resp, "candidates", None)
-            if cands:
-                content = getattr(cands[0], "content", None)
-                parts = getattr(content, "parts", None) if content else None
-                if parts and len(parts) > 0 and hasattr(parts[0], "text"):
-                    answer_text = parts[0].text
-        if not answer_text:
-            answer_text = str(resp)
+        answer_text = llm_client.generate_text(prompt, task="chat")
 
         obj = _extract_json_object(answer_text)
         # Ensure we always return an "answer" field
@@ -154,7 +119,210 @@ Provide a concise and clear answer grounded in the PDF content. Return strictly
         return obj
     except Exception as e:
         print(f"Error parsing model response: {e}", file=sys.stderr)
-        return {"answer": "An error occurred while processing the question."}
+        return {"answer": "An error occurred while processing the question.", "_error": True}
+
+# ---- Session mode ----
+def split_chunks(text: str, max_chars: int = CHAT_CHUNK_CHARS) -> List[str]:
+    """Consecutive pieces of about `max_chars`, cut at line breaks."""
+    chunks, cur, size = [], [], 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if cur and size + len(line) > max_chars:
+            chunks.append("\n".join(cur))
+            cur, size = [], 0
+        cur.append(line)
+        size += len(line) + 1
+    if cur:
+        chunks.append("\n".join(cur))
+    return chunks
+
+def _words(s: str) -> set:
+    return {w for w in re.findall(r"[a-z0-9]+", s.lower()) if len(w) > 2}
+
+class SessionDoc:
+    """Text of one PDF, split into chunks, with chunk embeddings when the encoder is available."""
+
+    def __init__(self, url: str):
+        t0 = time.perf_counter()
+        self.url = url
+        self.loaded_at = time.monotonic()
+        self.text = extract_pdf_text(url)
+        self.chunks = split_chunks(self.text)
+        # a document that fits the context whole is sent whole; embedding it would pick the same chunks
+        self.embs = text_reducer.encode(self.chunks) if len(self.text) > CHAT_CONTEXT_CHARS else None
+        self.words = [_words(c) for c in self.chunks] if self.embs is None else []
+        print(f"[pdfchat] loaded {url}: {len(self.chunks)} chunks, "
+              f"{'embeddings' if self.embs is not None else 'lexical'} in {time.perf_counter() - t0:.2f}s",
+              file=sys.stderr)
+
+    def context_for(self, query: str, max_chars: int = CHAT_CONTEXT_CHARS) -> str:
+        """Best-matching chunks for `query`, in document order, within `max_chars`."""
+        if not self.chunks:
+            return ""
+        q = text_reducer.encode([query]) if self.embs is not None else None
+        if q is not None:
+            scores = [float(x) for x in self.embs @ q[0]]
+        else:
+            qw = _words(query)
+            scores = [len(qw & w) / (1.0 + len(w)) ** 0.5 for w in self.words]
+        picked, used = [], 0
+        for i in sorted(range(len(self.chunks)), key=lambda i: scores[i], reverse=True):
+            if used + len(self.chunks[i]) > max_chars and picked:
+                continue
+            picked.append(i)
+            used += len(self.chunks[i])
+        return "\n...\n".join(self.chunks[i] for i in sorted(picked))[:max_chars]
+
+class ChatSession:
+    """
+    One conversation: documents stay extracted and embedded for the life of the
+    process, the last CHAT_HISTORY_TURNS turns are kept verbatim and older ones
+    are folded into a running summary on a background thread. `_lock` guards
+    the summary and turns, which that thread updates.
+    """
+
+    def __init__(self, use_cache: bool = True):
+        self.use_cache = use_cache
+        self.docs: Dict[str, SessionDoc] = {}
+        self.current: Optional[str] = None
+        self.summary = ""
+        self.turns: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by reset(); a compaction started before it is discarded
+        self._compactor: Optional[threading.Thread] = None
+
+    def doc(self, url: Optional[str]) -> Optional[SessionDoc]:
+        url = url or self.current
+        if not url:
+            return None
+        if url != self.current and self.current is not None:
+            self.reset()  # history is about the previous document
+        self.current = url
+        cached = self.docs.get(url)
+        # a failed download or extraction is only remembered for CHAT_RETRY_S, so a transient error doesn't stick
+        if cached is None or (not cached.text and time.monotonic() - cached.loaded_at >= CHAT_RETRY_S):
+            self.docs[url] = SessionDoc(url)
+        return self.docs[url]
+
+    def reset(self) -> None:
+        with self._lock:
+            self.summary, self.turns = "", []
+            self._generation += 1
+
+    def history_text(self) -> str:
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of earlier conversation: {self.summary}")
+            parts.extend(f"User: {q}\nAssistant: {a}" for q, a in self.turns)
+        return "\n".join(parts)
+
+    def ask(self, question: str, pdf_url: Optional[str] = None, use_cache: Optional[bool] = None) -> Dict:
+        doc = self.doc(pdf_url)
+        if doc is None:
+            return {"answer": "pdfUrl is required for the first question"}
+        if not doc.text:
+            return {"answer": "Failed to extract text from the PDF."}
+        context = doc.context_for(question)
+        history = self.history_text()
+        use_cache = self.use_cache if use_cache is None else use_cache
+        key = make_key(llm_client.model_id(), CHAT_SESSION_PROMPT_VERSION, context, history, question)
+        result = cached_call(key, lambda: _answer(context, question, history), bypass=not use_cache,
+                             should_store=lambda obj: not obj.get("_error"))
+        if not result.get("_error"):
+            with self._lock:
+                self.turns.append((question, str(result.get("answer", ""))))
+        return result
+
+    def compact_async(self) -> None:
+        """Start compact() in the background unless it is running or there's nothing to fold."""
+        with self._lock:
+            if len(self.turns) <= CHAT_HISTORY_TURNS or (self._compactor and self._compactor.is_alive()):
+                return
+            self._compactor = threading.Thread(target=self.compact, name="chat-compact", daemon=True)
+            self._compactor.start()
+
+    def wait(self) -> None:
+        if self._compactor is not None:
+            self._compactor.join()
+
+    def compact(self) -> None:
+        """
+        Fold turns beyond CHAT_HISTORY_TURNS into the summary. The folded turns
+        stay in `turns` until the summary is ready, so a question asked in the
+        meantime still sees them verbatim.
+        """
+        with self._lock:
+            if len(self.turns) <= CHAT_HISTORY_TURNS:
+                return
+            old = self.turns[:-CHAT_HISTORY_TURNS]
+            earlier, generation = self.summary, self._generation
+        transcript = "\n".join(f"User: {q}\nAssistant: {a}" for q, a in old)
+        prompt = f"""
+Condense this conversation about a PDF into a short paragraph that keeps every fact, name and number a follow-up question might refer to.
+
+Earlier summary: {earlier or "(none)"}
+
+New turns:
+{transcript}
+""".strip()
+        try:
+            summary = llm_client.generate_text(prompt, task="chat_history").strip()
+        except Exception as e:
+            print(f"[pdfchat] history summary failed, truncating instead: {e}", file=sys.stderr)
+            summary = f"{earlier} {transcript}".strip()
+        with self._lock:
+            if generation != self._generation:
+                return  # the conversation was reset meanwhile
+            self.summary = summary[-CHAT_SUMMARY_CHARS:]
+            del self.turns[:len(old)]
+
+def run_session(stream=sys.stdin, out=sys.stdout, use_cache: bool = True) -> None:
+    """
+    Answer JSON-lines requests {pdfUrl?, question, noCache?, reset?, id?} until
+    stdin closes, writing one JSON line per request (echoing `id`). `pdfUrl`
+    may be omitted after the first request; a different URL starts a new
+    conversation, as does {"reset": true}.
+    """
+    session = ChatSession(use_cache=use_cache)
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        t0 = time.perf_counter()
+        try:
+            req = json.loads(line)
+            if not isinstance(req, dict):
+                raise ValueError("expected a JSON object")
+        except Exception as e:
+            out.write(json.dumps({"answer": f"Invalid input: {str(e)}"}) + "\n")
+            out.flush()
+            continue
+
+        if req.get("reset"):
+            session.reset()
+        question = str(req.get("question") or "")
+        if question:
+            try:
+                result = session.ask(question, req.get("pdfUrl") or None,
+                                     use_cache=not req.get("noCache", False) and use_cache)
+            except Exception as e:
+                print(f"[pdfchat] session error: {e}", file=sys.stderr)
+                result = {"answer": "An error occurred while processing the question.", "_error": True}
+        else:
+            result = {"answer": "" if req.get("reset") else "question is required"}
+        result.pop("_error", None)
+        if "id" in req:
+            result["id"] = req["id"]
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        print(f"[pdfchat] answered in {(time.perf_counter() - t0) * 1000:.0f} ms", file=sys.stderr)
+        # Summarizing old turns runs in the background, off the next question's path
+        session.compact_async()
+    session.wait()
+    log_stats()
 
 # ---- CLI ----
 if __name__ == "__main__":
@@ -165,6 +333,10 @@ if __name__ == "__main__":
         except Exception:
             pass
 
+        if "--session" in sys.argv[1:]:
+            run_session(use_cache="--no-cache" not in sys.argv[1:])
+            sys.exit(0)
+
         input_data = json.load(sys.stdin)
         pdf_url = input_data.get("pdfUrl", "")
         question = input_data.get("question", "")
@@ -172,7 +344,9 @@ if __name__ == "__main__":
             print(json.dumps({"answer": "pdfUrl and question are required"}))
             sys.exit(0)
 
-        result = chat_pdf(pdf_url, question)
+        result = chat_pdf(pdf_url, question, use_cache=not input_data.get("noCache", False))
+        result.pop("_error", None)
         print(json.dumps(result))
+        log_stats()
     except Exception as e:
         print(json.dumps({"answer": f"Invalid input: {str(e)}"}))
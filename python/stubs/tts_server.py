@@ -0,0 +1,110 @@
+# python/stubs/tts_server.py
+"""
+Local stand-in for the Azure TTS REST endpoint (POST /cognitiveservices/v1).
+
+Answers every SSML request with silent MPEG-1 Layer III audio in the
+requested X-Microsoft-OutputFormat, roughly as long as the text would take
+to speak. Latency and failure rate are configurable so generate_podcast.py
+can be exercised offline:
+
+    python python/stubs/tts_server.py --port 8765 --latency-ms 300
+    AZURE_TTS_KEY=x AZURE_TTS_ENDPOINT=http://127.0.0.1:8765/cognitiveservices/v1 \
+        python python/generate_podcast.py < seed.txt
+"""
+import re, sys, time, random, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# MPEG-1 Layer III header tables (bitrate index -> kbps, sample rate -> index)
+_BITRATES = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+_RATES = {44100: 0, 48000: 1, 32000: 2}
+
+def silent_mp3(duration_ms:int, sample_rate:int=48000, kbps:int=192)->bytes:
+    """Mono CBR frames whose side info is all zero, i.e. decode to silence."""
+    header = bytes([0xFF, 0xFB, (_BITRATES.index(kbps) << 4) | (_RATES[sample_rate] << 2), 0xC0])
+    frame_len = 144 * kbps * 1000 // sample_rate
+    frame = header + bytes(frame_len - 4)
+    n = max(1, round(duration_ms / (1152 * 1000 / sample_rate)))
+    return frame * n
+
+def parse_output_format(fmt:str):
+    """(sample_rate, kbps) for an `audio-*khz-*kbitrate-mono-mp3` format; MPEG-2 rates are served as 48 kHz."""
+    m = re.match(r"audio-(\d+)khz-(\d+)kbitrate-mono-mp3$", fmt or "")
+    if not m: return None
+    rate = 44100 if m.group(1) == "44" else 48000
+    kbps = int(m.group(2))
+    return rate, (kbps if kbps in _BITRATES else 192)
+
+class Stats:
+    lock = threading.Lock()
+    requests = 0
+    failures = 0
+    inflight = 0
+    max_inflight = 0
+
+def make_handler(latency_ms:float, jitter_ms:float, error_rate:float, ms_per_char:float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+
+        def log_message(self, *a): pass
+
+        def _send(self, code:int, body:bytes, ctype:str):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with Stats.lock:
+                body = (f'{{"requests": {Stats.requests}, "failures": {Stats.failures}, '
+                        f'"max_inflight": {Stats.max_inflight}}}').encode()
+            self._send(200, body, "application/json")
+
+        def do_POST(self):
+            ssml = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8", "replace")
+            with Stats.lock:
+                Stats.requests += 1
+                Stats.inflight += 1
+                Stats.max_inflight = max(Stats.max_inflight, Stats.inflight)
+            try:
+                time.sleep(max(0.0, random.gauss(latency_ms, jitter_ms)) / 1000.0)
+                if not self.headers.get("Ocp-Apim-Subscription-Key"):
+                    return self._send(401, b"missing subscription key", "text/plain")
+                fmt = parse_output_format(self.headers.get("X-Microsoft-OutputFormat", ""))
+                if fmt is None or "<speak" not in ssml:
+                    return self._send(400, b"bad request", "text/plain")
+                if random.random() < error_rate:
+                    with Stats.lock: Stats.failures += 1
+                    return self._send(503, b"stub: injected failure", "text/plain")
+                text = re.sub(r"<[^>]+>", "", ssml)
+                self._send(200, silent_mp3(int(len(text.strip()) * ms_per_char) or 200, *fmt), "audio/mpeg")
+            finally:
+                with Stats.lock: Stats.inflight -= 1
+    return Handler
+
+def serve(host:str="127.0.0.1", port:int=0, latency_ms:float=0.0, jitter_ms:float=0.0,
+          error_rate:float=0.0, ms_per_char:float=65.0)->ThreadingHTTPServer:
+    """Start the stub on a daemon thread; `server.server_address` has the bound port."""
+    srv = ThreadingHTTPServer((host, port), make_handler(latency_ms, jitter_ms, error_rate, ms_per_char))
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+def main():
+    ap = argparse.ArgumentParser(description="Stub Azure TTS REST server (silent MP3).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Mean response latency.")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="Std-dev of response latency.")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 503.")
+    ap.add_argument("--ms-per-char", type=float, default=65.0, help="Audio length per character of text.")
+    a = ap.parse_args()
+    srv = serve(a.host, a.port, a.latency_ms, a.jitter_ms, a.error_rate, a.ms_per_char)
+    print(f"TTS stub listening on http://{a.host}:{srv.server_address[1]}/cognitiveservices/v1", file=sys.stderr, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+if __name__=="__main__":
+    main()
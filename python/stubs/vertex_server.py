@@ -0,0 +1,118 @@
+# python/stubs/vertex_server.py
+"""
+Local stand-in for the Vertex AI generateContent REST endpoint
+(POST .../publishers/google/models/<model>:generateContent).
+
+Answers with the same task-shaped text as llm_client's stub provider, wrapped
+in a Vertex response body, after a configurable latency. Errors are injected
+at a configurable rate with a choice of HTTP status codes, and a fraction of
+requests can hang to exercise client deadlines. Used with
+LLM_PROVIDER=vertex_http so every script can run and be load-tested offline:
+
+    python python/stubs/vertex_server.py --port 8766 --latency-ms 800 --error-rate 0.02
+    LLM_PROVIDER=vertex_http LLM_HTTP_ENDPOINT=http://127.0.0.1:8766 \
+        python python/summarygenerator.py http://host/doc.pdf
+"""
+import os, re, sys, json, time, random, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_client import stub_response
+
+_PATH = re.compile(r"/models/([^/:]+):generateContent$")
+
+class Stats:
+    lock = threading.Lock()
+    requests = 0
+    failures = 0
+    hangs = 0
+    inflight = 0
+    max_inflight = 0
+
+def make_handler(latency_ms:float, jitter_ms:float, ms_per_token:float, error_rate:float,
+                 error_codes:list, hang_rate:float, hang_ms:float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *a): pass
+
+        def _send(self, code:int, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with Stats.lock:
+                self._send(200, {"requests": Stats.requests, "failures": Stats.failures,
+                                 "hangs": Stats.hangs, "max_inflight": Stats.max_inflight})
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            with Stats.lock:
+                Stats.requests += 1
+                Stats.inflight += 1
+                Stats.max_inflight = max(Stats.max_inflight, Stats.inflight)
+            try:
+                m = _PATH.search(self.path.split("?")[0])
+                try:
+                    req = json.loads(raw or b"{}")
+                    prompt = "".join(p.get("text", "") for c in req.get("contents", []) for p in c.get("parts", []))
+                except ValueError:
+                    prompt = None
+                if not m or prompt is None:
+                    return self._send(400, {"error": {"code": 400, "message": "bad request", "status": "INVALID_ARGUMENT"}})
+
+                text = stub_response(prompt, self.headers.get("X-Stub-Task") or "generic")
+                out_tokens = max(1, len(text) // 4)
+                delay = max(0.0, random.gauss(latency_ms, jitter_ms)) + ms_per_token * out_tokens
+                if random.random() < hang_rate:
+                    with Stats.lock: Stats.hangs += 1
+                    delay = hang_ms
+                time.sleep(delay / 1000.0)
+                if random.random() < error_rate:
+                    code = random.choice(error_codes)
+                    with Stats.lock: Stats.failures += 1
+                    return self._send(code, {"error": {"code": code, "message": "stub: injected failure"}})
+                self._send(200, {
+                    "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                    "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": out_tokens},
+                    "modelVersion": m.group(1),
+                })
+            finally:
+                with Stats.lock: Stats.inflight -= 1
+    return Handler
+
+def serve(host:str="127.0.0.1", port:int=0, latency_ms:float=0.0, jitter_ms:float=0.0, ms_per_token:float=0.0,
+          error_rate:float=0.0, error_codes=(429, 503), hang_rate:float=0.0, hang_ms:float=120000.0)->ThreadingHTTPServer:
+    """Start the stub on a daemon thread; `server.server_address` has the bound port."""
+    srv = ThreadingHTTPServer((host, port), make_handler(latency_ms, jitter_ms, ms_per_token, error_rate,
+                                                         list(error_codes), hang_rate, hang_ms))
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+def main():
+    ap = argparse.ArgumentParser(description="Stub Vertex AI generateContent server.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Mean time to first byte.")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="Std-dev of that latency.")
+    ap.add_argument("--ms-per-token", type=float, default=0.0, help="Extra latency per generated token (~4 chars).")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error.")
+    ap.add_argument("--error-codes", default="429,503", help="Comma-separated statuses injected errors use.")
+    ap.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests held for --hang-ms.")
+    ap.add_argument("--hang-ms", type=float, default=120000.0)
+    a = ap.parse_args()
+    srv = serve(a.host, a.port, a.latency_ms, a.jitter_ms, a.ms_per_token, a.error_rate,
+                [int(c) for c in a.error_codes.split(",") if c.strip()], a.hang_rate, a.hang_ms)
+    print(f"Vertex stub listening on http://{a.host}:{srv.server_address[1]}", file=sys.stderr, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+if __name__=="__main__":
+    main()
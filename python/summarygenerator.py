@@ -1,53 +1,37 @@
 import sys
-import os
-import json
 from typing import List
 import requests
 from io import BytesIO
 import pdfplumber
 
-# ----- Env -----
-GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
-GOOGLE_APPLICATION_CREDENTIALS = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "")
-GOOGLE_CLOUD_PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT", "")
-GOOGLE_CLOUD_REGION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
+import llm_client
+from text_reducer import reduce_for_llm, settings_key
+from llm_cache import cached_call, make_key, log_stats
 
-if not GOOGLE_APPLICATION_CREDENTIALS:
-    print("Error: GOOGLE_APPLICATION_CREDENTIALS not set", file=sys.stderr)
-    sys.exit(1)
+# Bump whenever the prompt below changes so cached summaries are not reused.
+SUMMARY_PROMPT_VERSION = "summary-v1"
 
-def _read_project_from_sa(json_path: str) -> str:
-    try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data.get("project_id") or data.get("projectId") or ""
-    except Exception:
-        return ""
+llm_client.require_config("summarygenerator.py")
 
-# ----- Vertex init (lazy) -----
-_vertex_model = None
-
-def _init_vertex_if_needed():
-    global _vertex_model
-    if _vertex_model is not None:
-        return
-    try:
-        from vertexai import init as vertex_init
-        from vertexai.generative_models import GenerativeModel
+def summarize_text(pdf_text: str, use_cache: bool = True) -> str:
+    """
+    Summary of a whole document, cached on the downloaded text itself: a repeat
+    request is answered before the reducer (and its encoder) ever runs.
+    """
+    key = make_key(llm_client.model_id(), SUMMARY_PROMPT_VERSION, settings_key(), pdf_text)
+    return cached_call(key, lambda: _summarize_text(pdf_text, use_cache), bypass=not use_cache)
 
-        project = GOOGLE_CLOUD_PROJECT or _read_project_from_sa(GOOGLE_APPLICATION_CREDENTIALS)
-        if project:
-            vertex_init(project=project, location=GOOGLE_CLOUD_REGION)
-        else:
-            vertex_init(location=GOOGLE_CLOUD_REGION)
+def _summarize_text(pdf_text: str, use_cache: bool = True) -> str:
+    # Fewer, denser chunks: redundant sentences never reach the model
+    pdf_text = reduce_for_llm(pdf_text, label="summary")
+    summaries = [generate_summary_chunk(chunk, use_cache=use_cache) for chunk in chunk_text(pdf_text)]
+    return remove_consecutive_duplicates("\n".join(summaries)).strip()
 
-        _vertex_model = GenerativeModel(GEMINI_MODEL)
-    except Exception as e:
-        print(f"Error: failed to initialize Vertex AI: {e}", file=sys.stderr)
-        sys.exit(1)
+def generate_summary_chunk(text: str, use_cache: bool = True) -> str:
+    key = make_key(llm_client.model_id(), SUMMARY_PROMPT_VERSION, text)
+    return cached_call(key, lambda: _generate_summary_chunk(text), bypass=not use_cache)
 
-def generate_summary_chunk(text: str) -> str:
-    _init_vertex_if_needed()
+def _generate_summary_chunk(text: str) -> str:
     try:
         prompt = f"""
 You are an expert AI assistant specialized in summarizing documents concisely.
@@ -64,10 +48,7 @@ Instructions:
 7. Output plain text only — do NOT return JSON or markup.
 """.strip()
 
-        resp = _vertex_model.generate_content(prompt)
-        if hasattr(resp, "text") and resp.text:
-            return resp.text
-        return str(getattr(resp, "candidates", "") or resp)
+        return llm_client.generate_text(prompt, task="summary")
     except Exception as e:
         raise RuntimeError(f"Vertex generation failed: {e}")
 
@@ -120,19 +101,16 @@ def main():
         sys.exit(1)
 
     pdf_url = sys.argv[1]
+    use_cache = "--no-cache" not in sys.argv[2:]
 
     try:
         pdf_text = download_pdf(pdf_url)
-
-        summaries: List[str] = []
-        for chunk in chunk_text(pdf_text):
-            summaries.append(generate_summary_chunk(chunk))
-
-        final_summary = remove_consecutive_duplicates("\n".join(summaries)).strip()
-        print(final_summary)
+        print(summarize_text(pdf_text, use_cache=use_cache))
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        log_stats()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,253 @@
+import sys
+import os
+import re
+import math
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Rough LLM input budget (tokens ~= chars / 4); inputs under it are sent untouched.
+LLM_INPUT_TOKEN_BUDGET = int(os.environ.get("LLM_INPUT_TOKEN_BUDGET", "4000"))
+REDUCER_MODEL_DIR = os.environ.get(
+    "REDUCER_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_2", "models")
+)
+REDUCER_DISABLE = os.environ.get("REDUCER_DISABLE", "").lower() in ("1", "true", "yes")
+
+# Blend of "central to the whole text" vs "close to the query" (when one is given)
+CENTRALITY_WEIGHT = 0.6
+HEADING_BONUS = 0.15
+NEAR_DUPLICATE_SIM = 0.95
+
+# ---- Heading / junk detection ----
+def _get_level_from_structure(text):
+    t = (text or "").strip()
+    if re.match(r"^\d+(\.\d+)*\.?\s", t) or re.match(r"^(chapter|section|part)\s+[IVXLC\d]+", t, re.IGNORECASE):
+        return "H1"
+    return None
+
+def _is_junk_line(line_text):
+    text = (line_text or "").strip().lower()
+    return bool(re.search(r"^(page\s*\d+|\d+\s*of\s*\d+)", text)) or text.isnumeric() \
+        or "copyright" in text or "all rights reserved" in text
+
+def _tokens(s):
+    return [t for t in re.findall(r"[A-Za-z0-9_]+", (s or "").lower()) if len(t) > 2]
+
+_helpers = None
+
+def _pdf_helpers():
+    """model_2's heading/junk rules when it imports; the same rules inline otherwise."""
+    global _helpers
+    if _helpers is None:
+        try:
+            from model_2 import process_pdf
+            _helpers = (process_pdf.get_level_from_structure, process_pdf.is_junk_line, process_pdf._tokens)
+        except Exception:
+            _helpers = (_get_level_from_structure, _is_junk_line, _tokens)
+    return _helpers
+
+def settings_key() -> str:
+    """What decides reduce_for_llm()'s output besides the text; part of LLM cache keys built on unreduced text."""
+    return f"reducer:{LLM_INPUT_TOKEN_BUDGET}:{int(REDUCER_DISABLE)}:{'embedding' if _model_present() else 'lexical'}"
+
+def approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+def _is_heading(line: str) -> bool:
+    get_level_from_structure = _pdf_helpers()[0]
+    words = line.split()
+    if not words or len(words) > 12 or line.rstrip().endswith((".", ",", ";")):
+        return False
+    if get_level_from_structure(line):
+        return True
+    return line.isupper() or sum(w[:1].isupper() for w in words) >= max(1, int(len(words) * 0.6))
+
+_SENT_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+def split_units(text: str) -> List[Dict[str, Any]]:
+    """Headings (one per line) and sentences, in document order, junk lines dropped."""
+    is_junk_line = _pdf_helpers()[1]
+    units: List[Dict[str, Any]] = []
+    para: List[str] = []
+
+    def flush():
+        if para:
+            for sent in _SENT_SPLIT.split(" ".join(para)):
+                if sent.strip():
+                    units.append({"text": sent.strip(), "heading": False})
+            para.clear()
+
+    for raw in (text or "").splitlines():
+        line = raw.strip()
+        if not line:
+            flush()
+            continue
+        if is_junk_line(line):
+            continue
+        if _is_heading(line):
+            flush()
+            units.append({"text": line, "heading": True})
+        else:
+            para.append(line)
+    flush()
+    for i, u in enumerate(units):
+        u["pos"] = i
+        u["tokens"] = approx_tokens(u["text"]) + 1
+    return units
+
+# ---- Scoring ----
+_encoder = None
+_encoder_failed = False
+
+def _model_present() -> bool:
+    """Raw bge files or prepared artifacts under REDUCER_MODEL_DIR; checked before anything imports torch."""
+    return os.path.isfile(os.path.join(REDUCER_MODEL_DIR, "bge-small-en-v1.5", "config.json")) or \
+        os.path.isfile(os.path.join(REDUCER_MODEL_DIR, "prepared", "manifest.json"))
+
+def _get_encoder():
+    """The bge bi-encoder from model_2, loaded once; None when unavailable."""
+    global _encoder, _encoder_failed
+    if _encoder is None and not _encoder_failed:
+        if not _model_present():
+            _encoder_failed = True
+            print(f"[reducer] no bi-encoder under {REDUCER_MODEL_DIR}, using lexical scoring", file=sys.stderr)
+            return None
+        try:
+            from model_2.process_pdf import load_bi_encoder
+            import thread_budget  # importable once model_2 is
+            # a share of the CPUs without holding a model_2 slot through this process's LLM waits
+            thread_budget.acquire(register=False)
+            _encoder = load_bi_encoder(REDUCER_MODEL_DIR)
+        except Exception as e:
+            _encoder_failed = True
+            print(f"[reducer] bi-encoder unavailable, using lexical scoring: {e}", file=sys.stderr)
+    return _encoder
+
+def encode(texts: List[str]) -> Optional[Any]:
+    """L2-normalized embeddings of `texts` from the shared bi-encoder; None when it isn't available."""
+    enc = _get_encoder()
+    if enc is None or not texts:
+        return None
+    from model_2.process_pdf import _encode_norm
+    return _encode_norm(enc, texts)
+
+def _embedding_scores(units: List[Dict[str, Any]], query: Optional[str]) -> Optional[Tuple[List[float], Any]]:
+    texts = [u["text"] for u in units]
+    if query:
+        texts.append(query)
+    embs = encode(texts)
+    if embs is None:
+        return None
+    import numpy as np
+
+    sent = embs[: len(units)]
+    centroid = sent.mean(axis=0)
+    centroid /= (np.linalg.norm(centroid) + 1e-12)
+    central = sent @ centroid
+    if query:
+        rel = sent @ embs[-1]
+        score = CENTRALITY_WEIGHT * central + (1.0 - CENTRALITY_WEIGHT) * rel
+    else:
+        score = central
+    return [float(x) for x in score], sent
+
+def _lexical_scores(units: List[Dict[str, Any]], query: Optional[str]) -> List[float]:
+    """TF-IDF cosine to the whole text (and the query), for when no encoder is around."""
+    tokens = _pdf_helpers()[2]
+    bags = [Counter(tokens(u["text"])) for u in units]
+    df = Counter(t for b in bags for t in b)
+    n = len(units)
+    idf = {t: math.log((1 + n) / (1 + c)) + 1.0 for t, c in df.items()}
+
+    def vec(bag):
+        v = {t: c * idf.get(t, 1.0) for t, c in bag.items()}
+        norm = math.sqrt(sum(x * x for x in v.values())) or 1.0
+        return {t: x / norm for t, x in v.items()}
+
+    vecs = [vec(b) for b in bags]
+    doc = vec(sum(bags, Counter()))
+    q = vec(Counter(tokens(query))) if query else None
+    out = []
+    for v in vecs:
+        central = sum(x * doc.get(t, 0.0) for t, x in v.items())
+        if q:
+            rel = sum(x * q.get(t, 0.0) for t, x in v.items())
+            out.append(CENTRALITY_WEIGHT * central + (1.0 - CENTRALITY_WEIGHT) * rel)
+        else:
+            out.append(central)
+    return out
+
+# ---- Reduction ----
+def reduce_text(text: str, budget_tokens: int = LLM_INPUT_TOKEN_BUDGET,
+                query: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Keep the highest-scoring headings and sentences, in their original order,
+    until `budget_tokens` is reached. Text already within budget is returned as is.
+    """
+    t0 = time.perf_counter()
+    orig = approx_tokens(text)
+    report: Dict[str, Any] = {"input_tokens": orig, "output_tokens": orig, "ratio": 1.0, "method": "none"}
+    if REDUCER_DISABLE or budget_tokens <= 0 or orig <= budget_tokens:
+        return text, report
+
+    units = split_units(text)
+    if not units:
+        return text, report
+
+    scored = _embedding_scores(units, query)
+    if scored is not None:
+        scores, embs = scored
+        report["method"] = "embedding"
+    else:
+        scores, embs = _lexical_scores(units, query), None
+        report["method"] = "lexical"
+
+    order = sorted(range(len(units)), key=lambda i: scores[i] + (HEADING_BONUS if units[i]["heading"] else 0.0),
+                   reverse=True)
+    chosen: List[int] = []
+    used = 0
+    for i in order:
+        cost = units[i]["tokens"]
+        if used + cost > budget_tokens:
+            continue
+        if embs is not None and chosen and float((embs[chosen] @ embs[i]).max()) >= NEAR_DUPLICATE_SIM:
+            continue
+        chosen.append(i)
+        used += cost
+
+    # Headings with nothing kept beneath them are noise; drop them
+    keep = set(chosen)
+    lines: List[str] = []
+    for i, u in enumerate(units):
+        if i not in keep:
+            continue
+        if u["heading"]:
+            nxt = next((j for j in range(i + 1, len(units)) if units[j]["heading"] or j in keep), None)
+            if nxt is None or units[nxt]["heading"]:
+                continue
+            lines.append("\n" + u["text"])
+        else:
+            lines.append(u["text"])
+    reduced = "\n".join(lines).strip()
+
+    report.update({
+        "output_tokens": approx_tokens(reduced),
+        "ratio": round(approx_tokens(reduced) / orig, 3),
+        "units_kept": len(lines),
+        "units_total": len(units),
+        "ms": round((time.perf_counter() - t0) * 1000.0, 1),
+    })
+    return reduced, report
+
+def reduce_for_llm(text: str, budget_tokens: int = LLM_INPUT_TOKEN_BUDGET,
+                   query: Optional[str] = None, label: str = "input") -> str:
+    """reduce_text() that logs the compression ratio to stderr and never raises."""
+    try:
+        reduced, r = reduce_text(text, budget_tokens, query)
+    except Exception as e:
+        print(f"[reducer] {label}: failed, sending raw text: {e}", file=sys.stderr)
+        return text
+    if r["method"] != "none":
+        print(f"[reducer] {label}: {r['input_tokens']} -> {r['output_tokens']} tokens "
+              f"(ratio {r['ratio']}, {r['method']}, {r.get('ms', 0)} ms)", file=sys.stderr)
+    return reduced
@@ -0,0 +1,216 @@
+# python/tts_client.py
+"""
+Azure TTS over REST: one keep-alive session for all workers, a
+content-addressed cache of synthesized audio, and optional packing of a
+whole Host/Guest dialog into multi-voice SSML documents.
+"""
+import sys, os, time, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import urlparse
+from xml.sax.saxutils import escape, quoteattr
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TTS_PROVIDER = (os.environ.get("TTS_PROVIDER") or "azure").lower()
+AZURE_TTS_KEY = os.environ.get("AZURE_TTS_KEY", "")
+AZURE_TTS_ENDPOINT = os.environ.get("AZURE_TTS_ENDPOINT", "")
+AZURE_REGION = os.environ.get("AZURE_REGION", "")
+TTS_MAX_WORKERS = max(1, int(os.environ.get("TTS_MAX_WORKERS", "4")))
+TTS_OUTPUT_FORMAT = "audio-48khz-192kbitrate-mono-mp3"
+
+# Multi-voice packing; Azure caps one request at 64 KB of SSML and 50 <voice> elements
+TTS_PACK_SSML = os.environ.get("TTS_PACK_SSML", "").lower() in ("1", "true", "yes")
+TTS_SSML_MAX_BYTES = int(os.environ.get("TTS_SSML_MAX_BYTES", str(60 * 1024)))
+TTS_SSML_MAX_VOICES = int(os.environ.get("TTS_SSML_MAX_VOICES", "50"))
+
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join(".cache", "tts"))
+TTS_CACHE_MAX_MB = float(os.environ.get("TTS_CACHE_MAX_MB", "256"))
+TTS_CACHE_BYPASS = os.environ.get("TTS_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+Line = Tuple[str, str]  # (voice, text)
+
+def log(*a): print("[tts]", *a, file=sys.stderr, flush=True)
+
+# ---- HTTP ----
+_session = None
+_session_lock = threading.Lock()
+def session()->requests.Session:
+    """Shared session; its pool is sized to the worker count so every worker keeps a connection."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TTS_MAX_WORKERS)
+            s.mount("https://", adapter); s.mount("http://", adapter)
+            _session = s
+    return _session
+
+def endpoint()->str:
+    url = AZURE_TTS_ENDPOINT or f"https://{AZURE_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
+    # plain http is only accepted for a local stand-in (python/stubs/tts_server.py)
+    local = urlparse(url).hostname in ("localhost", "127.0.0.1", "::1")
+    if not url.startswith("https://") and not (local and url.startswith("http://")):
+        raise RuntimeError(f"Bad AZURE_TTS_ENDPOINT: {url}")
+    return url
+
+def post_ssml(ssml:str)->bytes:
+    if TTS_PROVIDER!="azure": raise RuntimeError("TTS_PROVIDER must be 'azure'")
+    if not AZURE_TTS_KEY: raise RuntimeError("AZURE_TTS_KEY not set")
+    h = {
+      "Ocp-Apim-Subscription-Key": AZURE_TTS_KEY,
+      "Content-Type": "application/ssml+xml",
+      "X-Microsoft-OutputFormat": TTS_OUTPUT_FORMAT,
+      "User-Agent": "podcast-generator",
+    }
+    r = session().post(endpoint(), data=ssml.encode("utf-8"), headers=h, timeout=60)
+    if r.status_code!=200:
+        raise RuntimeError(f"Azure REST failed: {r.status_code} {r.text[:200]}")
+    return r.content
+
+# ---- SSML ----
+_SPEAK_OPEN = "<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='en-IN'>"
+_SPEAK_CLOSE = "</speak>"
+
+def _voice_block(voice:str, text:str, pause_ms:int=0)->str:
+    brk = f"<break time='{pause_ms}ms'/>" if pause_ms else ""
+    return f"<voice name={quoteattr(voice)}>{escape(text)}{brk}</voice>"
+
+def ssml_for(lines:List[Line], pause_ms:int=0)->str:
+    """One document, one <voice> per line, `pause_ms` of silence between lines."""
+    blocks = [_voice_block(v, t, pause_ms if i < len(lines) - 1 else 0) for i, (v, t) in enumerate(lines)]
+    return _SPEAK_OPEN + "".join(blocks) + _SPEAK_CLOSE
+
+def pack_lines(lines:List[Line], pause_ms:int=0, max_bytes:int=TTS_SSML_MAX_BYTES,
+               max_voices:int=TTS_SSML_MAX_VOICES)->List[List[Line]]:
+    """Split a dialog into as few consecutive groups as the request limits allow."""
+    packs, cur, size = [], [], len(_SPEAK_OPEN) + len(_SPEAK_CLOSE)
+    for v, t in lines:
+        cost = len(_voice_block(v, t, pause_ms).encode("utf-8"))
+        if cur and (size + cost > max_bytes or len(cur) >= max_voices):
+            packs.append(cur)
+            cur, size = [], len(_SPEAK_OPEN) + len(_SPEAK_CLOSE)
+        cur.append((v, t)); size += cost
+    if cur: packs.append(cur)
+    return packs
+
+# ---- Cache ----
+def cache_key(lines:List[Line], pause_ms:int=0)->str:
+    """Content address of the audio for `lines`: voices, texts, pause and output format."""
+    # audio from a local stand-in must never answer for the real service
+    stub = urlparse(AZURE_TTS_ENDPOINT).hostname in ("localhost", "127.0.0.1", "::1")
+    h = hashlib.sha256(f"{TTS_OUTPUT_FORMAT}\x1f{pause_ms}\x1f{'stub' if stub else ''}".encode("utf-8"))
+    for v, t in lines:
+        h.update(f"\x1e{v}\x1f{' '.join(t.split())}".encode("utf-8"))
+    return h.hexdigest()
+
+def _cache_path(key:str)->str:
+    return os.path.join(TTS_CACHE_DIR, key[:2], key + ".mp3")
+
+def cache_get(key:str)->Optional[bytes]:
+    if TTS_CACHE_BYPASS: return None
+    p = _cache_path(key)
+    try:
+        with open(p, "rb") as f: data = f.read()
+        os.utime(p, None)  # mtime doubles as last-access time for eviction
+        return data
+    except OSError:
+        return None
+
+def cache_put(key:str, data:bytes)->None:
+    if TTS_CACHE_BYPASS or not data: return
+    p = _cache_path(key)
+    try:
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(tmp, "wb") as f: f.write(data)
+        os.replace(tmp, p)
+    except OSError as e:
+        log("cache write failed:", e)
+
+def prune_cache(max_bytes:int=int(TTS_CACHE_MAX_MB * 1024 * 1024))->None:
+    """Drop least recently used audio until the cache fits `max_bytes`."""
+    entries = []
+    for root, _, files in os.walk(TTS_CACHE_DIR):
+        for n in files:
+            p = os.path.join(root, n)
+            try:
+                st = os.stat(p)
+                entries.append((st.st_mtime, st.st_size, p))
+            except OSError:
+                pass
+    total = sum(e[1] for e in entries)
+    for _, size, p in sorted(entries):
+        if total <= max_bytes: break
+        try:
+            os.remove(p); total -= size
+        except OSError:
+            pass
+
+class Stats:
+    lock = threading.Lock()
+    requests = 0
+    cache_hits = 0
+
+def synthesize(lines:List[Line], pause_ms:int=0)->bytes:
+    """Audio for one SSML document (cached)."""
+    key = cache_key(lines, pause_ms)
+    data = cache_get(key)
+    if data is not None:
+        with Stats.lock: Stats.cache_hits += 1
+        return data
+    with Stats.lock: Stats.requests += 1
+    data = post_ssml(ssml_for(lines, pause_ms))
+    cache_put(key, data)
+    return data
+
+# ---- Dialog ----
+def synthesize_dialog(lines:List[Line], fallback:Callable[[int], bytes], pause_ms:int=0,
+                      pack:bool=TTS_PACK_SSML,
+                      on_chunk:Optional[Callable[[int, bytes], None]]=None)->List[bytes]:
+    """
+    MP3 chunks for a dialog, in order. Unpacked: one chunk per line, lines
+    synthesized concurrently. Packed: one chunk per multi-voice document with
+    `pause_ms` breaks between its lines; a document that fails is redone line
+    by line. A line that still fails yields `fallback(line_index)`.
+    `on_chunk(n, data)` is called in order as soon as each chunk and all
+    chunks before it are ready.
+    """
+    if not lines: return []
+    t0 = time.perf_counter()
+
+    def one(i:int)->bytes:
+        v, t = lines[i]
+        try:
+            log(f"line {i+1}/{len(lines)} voice={v}")
+            return synthesize([(v, t)])
+        except Exception as e:
+            log(f"line {i+1}/{len(lines)} error -> fallback:", e)
+            return fallback(i)
+
+    with ThreadPoolExecutor(max_workers=min(TTS_MAX_WORKERS, len(lines))) as ex:
+        if not pack:
+            results = ([c] for c in ex.map(one, range(len(lines))))
+        else:
+            groups, start = [], 0
+            for p in pack_lines(lines, pause_ms):
+                groups.append(list(range(start, start + len(p)))); start += len(p)
+
+            def packed(idx:List[int])->List[bytes]:
+                try:
+                    log(f"lines {idx[0]+1}-{idx[-1]+1}/{len(lines)} as one SSML request")
+                    return [synthesize([lines[i] for i in idx], pause_ms)]
+                except Exception as e:
+                    log("packed request failed -> per line:", e)
+                    return [one(i) for i in idx]
+
+            results = ex.map(packed, groups)
+        out = []
+        for chunks in results:  # map() yields in submission order as results land
+            for chunk in chunks:
+                if on_chunk: on_chunk(len(out), chunk)
+                out.append(chunk)
+    log(f"{len(lines)} lines -> {Stats.requests} requests, {Stats.cache_hits} cache hits "
+        f"in {time.perf_counter() - t0:.2f}s")
+    return out